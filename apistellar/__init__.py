@@ -10,11 +10,13 @@ from apistellar.bases.service import Service
 from apistellar.bases.hooks import Hook, Return
 from apistellar.bases.components import Component
 from apistellar.bases.controller import Controller
-from apistellar.bases.response import FileResponse
+from apistellar.bases.channel import Channel
+from apistellar.bases.response import FileResponse, StreamingResponse, \
+    JSONStreamResponse, NDJSONResponse, EventSourceResponse, ServerSentEvent
 from apistellar.bases.model_factory import ModelFactory
 from apistellar.bases.entities import Session, Cookie, FormParam, \
-    FileStream, inject, SettingsMixin, UrlEncodeForm, MultiPartForm, \
-    settings, init_settings, coroutinelocal
+    FileStream, TypeStream, inject, SettingsMixin, UrlEncodeForm, \
+    MultiPartForm, settings, init_settings, coroutinelocal
 
 from apistellar.console import main as console
 
@@ -23,7 +25,7 @@ from apistellar.solo.manager import SoloManager
 
 from apistellar.persistence import DriverMixin, conn_manager, conn_ignore
 
-from apistellar.types import Type, AsyncType, PersistentType, \
+from apistellar.types import Type, AsyncType, PersistentType, TypeList, \
     TypeEncoder, validators
 
 from apistellar.route import route, get, post, delete, put, options, websocket
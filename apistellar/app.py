@@ -1,4 +1,6 @@
+import io
 import os
+import mmap
 import asyncio
 import logging
 import traceback
@@ -6,28 +8,102 @@ import traceback
 from apistar import ASyncApp, exceptions
 from apistar.http import Response, JSONResponse
 from apistar.server.components import ReturnValue
-from apistar.server.asgi import ASGIScope, ASGISend
+from apistar.server.asgi import ASGIScope, ASGISend, ASGIReceive
 
 from apistellar.bases.entities import settings
 from apistellar.bases.websocket import WebSocketApp
+from apistellar.bases.fileio import AsyncFileReader
+from apistellar.bases.response import StreamingResponse
+from apistellar.bases.injector import PlanInjector
 from apistellar.document import ShowLogPainter, AppLogPainter
 from apistellar.bases.components import Component, ComposeTypeComponent
 from apistellar.bases.hooks import WebContextHook, ErrorHook, \
     AccessLogHook, SessionHook, Hook
-from apistellar.helper import TypeEncoder, find_children, enhance_response
+from apistellar.helper import TypeEncoder, find_children, \
+    enhance_response, get_regular_fileno, get_json_backend
 
 __all__ = ["Application"]
 enhance_response(Response)
 # 可以序列化Type子类
 JSONResponse.options["default"] = TypeEncoder().default
 
+
+def render_json(self, content):
+    """
+    使用配置的json后端序列化
+    """
+    return get_json_backend().dumpb(content, **self.options)
+
+
+JSONResponse.render = render_json
+
 del JSONResponse.charset
 
 
 RESP_BUFFER_SIZE = 1024000
+# ASGI零拷贝扩展名称，服务器在scope["extensions"]中声明支持
+ZEROCOPY_EXTENSION = "http.response.zerocopy"
+
+
+async def maybe_await(value):
+    """
+    兼容同步和异步的文件对象(如aiofiles)的方法调用结果
+    :param value:
+    :return:
+    """
+    if asyncio.iscoroutine(value) or asyncio.isfuture(value):
+        return await value
+    return value
 
 
 class FixedAsyncApp(ASyncApp):
+    # 请求开始时state中已存在的key
+    state_keys = ('scope', 'receive', 'send', 'exc',
+                  'app', 'path_params', 'route')
+
+    def __init__(self, *args, **kwargs):
+        self.plans = dict()
+        super(FixedAsyncApp, self).__init__(*args, **kwargs)
+        self.compile_plans()
+
+    def init_injector(self, components=None):
+        super(FixedAsyncApp, self).init_injector(components)
+        self.injector = PlanInjector(
+            self.injector.components, self.injector.initial)
+
+    def compile_plans(self):
+        """
+        启动时为每个Route编译依赖注入的执行计划，请求时直接执行。
+        hook为类时每次请求都会重新实例化，无法预编译。
+        :return:
+        """
+        self.plans.clear()
+        if any(isinstance(hook, type) for hook in self.event_hooks or []):
+            return
+
+        on_request, on_response, on_error = self.get_event_hooks()
+        for funcs in ([self.exception_handler] + on_response +
+                      [self.finalize_asgi],
+                      [self.error_handler, self.finalize_asgi],
+                      on_error):
+            self._compile(funcs)
+
+        for route in self.router.name_lookups.values():
+            if route.standalone:
+                funcs = [route.handler]
+            else:
+                funcs = on_request + [route.handler, self.render_response] + \
+                        on_response + [self.finalize_asgi]
+            plan = self._compile(funcs)
+            if plan is not None:
+                self.plans[route] = plan
+
+    def _compile(self, funcs):
+        try:
+            return self.injector.compile(funcs, self.state_keys)
+        except Exception:
+            # 保持原有行为，在请求时才抛出配置错误
+            return None
 
     def exception_handler(self, exc: Exception) -> Response:
         """
@@ -55,16 +131,213 @@ class FixedAsyncApp(ASyncApp):
         return super().error_handler()
 
     async def read(self, response):
-        coroutine = response.content.read(RESP_BUFFER_SIZE)
-        if asyncio.iscoroutine(coroutine) or asyncio.isfuture(coroutine):
-            return await coroutine
-        else:
-            return coroutine
+        return await maybe_await(response.content.read(RESP_BUFFER_SIZE))
+
+    @staticmethod
+    def get_send_range(response, fileno, offset):
+        """
+        计算从offset开始需要发送的字节数，不超过Content-Length及文件剩余大小
+        :param response:
+        :param fileno:
+        :param offset:
+        :return:
+        """
+        count = os.fstat(fileno).st_size - offset
+        content_length = str(response.headers.get("Content-Length", ""))
+        if content_length.isdigit():
+            count = min(count, int(content_length))
+        return max(count, 0)
+
+    @staticmethod
+    async def send_zerocopy(response, send, offset, count):
+        """
+        服务器支持零拷贝扩展时，将文件交给服务器直接发送(如sendfile)
+        :param response:
+        :param send:
+        :param offset:
+        :param count:
+        :return:
+        """
+        await send({
+            "type": ZEROCOPY_EXTENSION,
+            "file": response.content,
+            "offset": offset,
+            "count": count,
+            "more_body": True,
+        })
+
+    @staticmethod
+    async def send_mmap(send, fileno, offset, count):
+        """
+        async_read=False且服务器不支持零拷贝扩展时的后备方式。
+        ASGI要求body为bytes，每个RESP_BUFFER_SIZE的切片仍会复制一次，
+        与read()相比不能减少复制，只是省去了seek及read调用；
+        映射的页面在事件循环中读入，冷文件的缺页仍会阻塞事件循环
+        :param send:
+        :param fileno:
+        :param offset:
+        :param count:
+        :return:
+        """
+        mm = mmap.mmap(fileno, 0, access=mmap.ACCESS_READ)
+        view = memoryview(mm)
+        try:
+            end = offset + count
+            for start in range(offset, end, RESP_BUFFER_SIZE):
+                await send({
+                    'type': 'http.response.body',
+                    'body': bytes(view[start: min(start + RESP_BUFFER_SIZE, end)]),
+                    "more_body": True,
+                })
+        finally:
+            view.release()
+            mm.close()
+
+    @staticmethod
+    async def send_seek(response, send, offset, count):
+        """
+        对于在线程池中读取或无法mmap的文件对象，seek到offset后有限读取count个字节
+        :param response:
+        :param send:
+        :param offset:
+        :param count:
+        :return:
+        """
+        await maybe_await(response.content.seek(offset))
+        while count > 0:
+            body = await maybe_await(
+                response.content.read(min(RESP_BUFFER_SIZE, count)))
+            if not body:
+                break
+            await send({
+                'type': 'http.response.body',
+                'body': body,
+                "more_body": True,
+            })
+            count -= len(body)
+
+    async def send_file(self, response, send, scope):
+        """
+        对于普通磁盘文件，只有服务器支持零拷贝扩展时才交给服务器发送(零拷贝)，
+        否则与其它同步文件对象一样在有界线程池中读取，避免磁盘读取阻塞事件循环，
+        async_read=False时在事件循环中使用mmap读取。Range请求按分段发送。
+        :param response:
+        :param send:
+        :param scope:
+        :return:
+        """
+        fileno = None
+        if getattr(response, "zero_copy", False):
+            fileno = get_regular_fileno(response.content)
+        zerocopy = fileno is not None and \
+            ZEROCOPY_EXTENSION in (scope.get("extensions") or {})
+
+        if not zerocopy and getattr(response, "async_read", False) and \
+                isinstance(response.content,
+                           (io.RawIOBase, io.BufferedIOBase)):
+            # 同步文件对象在线程池中读取，避免阻塞事件循环
+            response.content = AsyncFileReader(response.content)
+
+        try:
+            await self.send_ranges(response, send, fileno, zerocopy)
+        finally:
+            if isinstance(response.content, AsyncFileReader):
+                await response.content.cancel_read_ahead()
+
+    async def send_ranges(self, response, send, fileno, zerocopy):
+        ranges = getattr(response, "ranges", None)
+        if ranges is None:
+            if fileno is None:
+                body = await self.read(response)
+                while body:
+                    await send({
+                        'type': 'http.response.body',
+                        'body': body,
+                        "more_body": True,
+                    })
+                    body = await self.read(response)
+                await send({
+                    'type': 'http.response.body',
+                    'body': b""
+                })
+                return
+
+            offset = await maybe_await(response.content.tell())
+            ranges = [
+                (b"", offset, self.get_send_range(response, fileno, offset))]
+
+        mmap_able = fileno is not None and \
+            not isinstance(response.content, AsyncFileReader)
+        for head, offset, count in ranges:
+            if head:
+                await send({
+                    'type': 'http.response.body',
+                    'body': head,
+                    "more_body": True,
+                })
+            if not count:
+                continue
+            if zerocopy:
+                await self.send_zerocopy(response, send, offset, count)
+            elif mmap_able:
+                await self.send_mmap(send, fileno, offset, count)
+            else:
+                await self.send_seek(response, send, offset, count)
+        await send({
+            'type': 'http.response.body',
+            'body': getattr(response, "ranges_tail", b"")
+        })
+
+    @staticmethod
+    async def wait_disconnect(response, receive):
+        """
+        客户端断开连接时通知response停止迭代
+        :param response:
+        :param receive:
+        :return:
+        """
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                response.disconnect()
+                return
+
+    async def send_stream(self, response, send, receive=None):
+        """
+        逐块发送StreamingResponse，send阻塞时暂停迭代，
+        结束或出错时关闭生成器
+        :param response:
+        :param send:
+        :param receive: 需要监听客户端断开时传入
+        :return:
+        """
+        watcher = None
+        if receive is not None and response.watch_disconnect:
+            watcher = asyncio.ensure_future(
+                self.wait_disconnect(response, receive))
+        body_iter = response.iter_body()
+        try:
+            async for body in body_iter:
+                await send({
+                    'type': 'http.response.body',
+                    'body': body,
+                    "more_body": True,
+                })
+        finally:
+            if watcher is not None:
+                watcher.cancel()
+            await body_iter.aclose()
+            await response.close()
+        await send({
+            'type': 'http.response.body',
+            'body': b""
+        })
 
     async def finalize_asgi(self,
                             response: Response,
                             send: ASGISend,
-                            scope: ASGIScope):
+                            scope: ASGIScope,
+                            receive: ASGIReceive = None):
         if response.exc_info is not None:
             if self.debug or scope.get('raise_exceptions', False):
                 exc_info = response.exc_info
@@ -78,28 +351,74 @@ class FixedAsyncApp(ASyncApp):
                 for key, value in response.headers
             ]
         })
-        if hasattr(response.content, "read"):
-            body = await self.read(response)
-            while body:
-                await send({
-                    'type': 'http.response.body',
-                    'body': body,
-                    "more_body": True,
-                })
-                body = await self.read(response)
+        if isinstance(response, StreamingResponse):
+            await self.send_stream(response, send, receive)
+        elif hasattr(response.content, "read"):
+            await self.send_file(response, send, scope)
         else:
-            body = response.content
-        await send({
-            'type': 'http.response.body',
-            'body': body
-        })
+            await send({
+                'type': 'http.response.body',
+                'body': response.content
+            })
 
     def __call__(self, scope):
-        if scope["type"] != "websocket":
-            return super(FixedAsyncApp, self).__call__(scope)
-        else:
+        """
+        存在预编译执行计划的路由直接执行计划，
+        其它情况(未找到路由、class hook等)使用apistar的实现
+        """
+        if scope["type"] == "websocket":
             return WebSocketApp(scope, self)
 
+        try:
+            route, path_params = self.router.lookup(
+                scope['path'], scope['method'])
+        except Exception:
+            return super(FixedAsyncApp, self).__call__(scope)
+        plan = self.plans.get(route)
+        if plan is None:
+            return super(FixedAsyncApp, self).__call__(scope)
+
+        async def asgi_callable(receive, send):
+            state = {
+                'scope': scope,
+                'receive': receive,
+                'send': send,
+                'exc': None,
+                'app': self,
+                'path_params': path_params,
+                'route': route
+            }
+            try:
+                await self.injector.run_plan(plan, state)
+            except Exception as exc:
+                await self.handle_exception(exc, state)
+        return asgi_callable
+
+    async def handle_exception(self, exc, state):
+        """
+        与apistar中的异常处理流程一致，执行计划已在compile_plans中缓存
+        :param exc:
+        :param state:
+        :return:
+        """
+        _, on_response, on_error = self.get_hooks()
+        try:
+            state['exc'] = exc
+            funcs = [self.exception_handler] + on_response + [self.finalize_asgi]
+            await self.injector.run_async(funcs, state)
+        except Exception as inner_exc:
+            try:
+                state['exc'] = inner_exc
+                await self.injector.run_async(on_error, state)
+            finally:
+                funcs = [self.error_handler, self.finalize_asgi]
+                await self.injector.run_async(funcs, state)
+
+    def get_hooks(self):
+        if self.event_hooks is None:
+            return [], [], []
+        return self.get_event_hooks()
+
 
 def application(app_name,
                 packages=None,
@@ -0,0 +1,146 @@
+"""
+进程内的发布订阅频道，用于向大量EventSourceResponse推送事件。
+事件在发布时只编码一次，所有订阅者共享同一份bytes。
+"""
+import asyncio
+
+from collections import deque
+
+from .response import ServerSentEvent
+
+# 每个订阅者默认最多缓存的事件数量
+SSE_QUEUE_SIZE = 100
+# 缓存满时丢弃最旧的事件
+DROP = "drop"
+# 缓存满时断开订阅者，客户端会自动重连
+DISCONNECT = "disconnect"
+
+
+class Subscription(object):
+    """
+    订阅者，迭代返回已编码的事件，队列长度有限，
+    消费过慢时按policy丢弃事件或断开。
+    """
+
+    def __init__(self, channel, max_queue=SSE_QUEUE_SIZE, policy=DROP):
+        assert policy in (DROP, DISCONNECT), f"Unknown policy: {policy}!"
+        self.channel = channel
+        self.max_queue = max_queue
+        self.policy = policy
+        self.queue = deque()
+        self.waiter = None
+        self.closed = False
+        # 丢弃的事件数量
+        self.dropped = 0
+
+    def put(self, message):
+        """
+        放入事件，不会阻塞发布者
+        :param message:
+        :return: 是否放入成功
+        """
+        if self.closed:
+            return False
+        if len(self.queue) >= self.max_queue:
+            if self.policy == DISCONNECT:
+                # 立即断开，不再发送已过时的事件，客户端重连后重新获取
+                self.dropped += len(self.queue)
+                self.queue.clear()
+                self.close()
+                return False
+            self.queue.popleft()
+            self.dropped += 1
+        self.queue.append(message)
+        self.wakeup()
+        return True
+
+    def wakeup(self):
+        if self.waiter is not None and not self.waiter.done():
+            self.waiter.set_result(None)
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.channel.unsubscribe(self)
+            self.wakeup()
+
+    async def aclose(self):
+        self.close()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        while not self.queue:
+            if self.closed:
+                raise StopAsyncIteration
+            self.waiter = asyncio.get_event_loop().create_future()
+            try:
+                await self.waiter
+            finally:
+                self.waiter = None
+        return self.queue.popleft()
+
+    def __len__(self):
+        return len(self.queue)
+
+
+class Channel(object):
+    """
+    使用方法：
+    ```
+    channel = Channel()
+
+    @get("/events")
+    def events(self):
+        return EventSourceResponse(channel.subscribe())
+
+    channel.publish({"price": 1}, event="update")
+    ```
+    Channel不是线程安全的，publish等方法需要在事件循环所在的线程中调用，
+    其它线程中使用loop.call_soon_threadsafe(channel.publish, ...)。
+    """
+
+    def __init__(self, max_queue=SSE_QUEUE_SIZE, policy=DROP):
+        """
+        :param max_queue: 订阅者默认的队列长度
+        :param policy: 订阅者默认的队列满时的处理策略，drop或disconnect
+        """
+        self.max_queue = max_queue
+        self.policy = policy
+        self.subscribers = set()
+
+    def subscribe(self, max_queue=None, policy=None):
+        subscription = Subscription(
+            self, max_queue or self.max_queue, policy or self.policy)
+        self.subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        self.subscribers.discard(subscription)
+
+    def publish(self, data=None, event=None, id=None, retry=None):
+        """
+        编码一次后分发给所有订阅者，只能在事件循环所在的线程中调用
+        :param data: ServerSentEvent或事件数据
+        :param event:
+        :param id:
+        :param retry:
+        :return: 成功放入的订阅者数量
+        """
+        if not isinstance(data, ServerSentEvent):
+            data = ServerSentEvent(data, event, id, retry)
+        message = data.encode()
+        return sum(subscription.put(message)
+                   for subscription in list(self.subscribers))
+
+    def close(self):
+        """
+        关闭所有订阅者
+        :return:
+        """
+        for subscription in list(self.subscribers):
+            subscription.close()
+
+    def __len__(self):
+        return len(self.subscribers)
@@ -6,6 +6,7 @@ from inspect import Parameter
 from datetime import timedelta
 from collections import namedtuple
 
+from toolkit import cache_property
 from toolkit.singleton import Singleton
 from toolkit.settings import FrozenSettings
 
@@ -24,11 +25,33 @@ from apistellar.types import Type
 
 from .compact import get_union_class
 from .controller import Controller
+from .exceptions import PayloadTooLarge
 from .entities import Session, Cookie, FormParam, FileStream, DummyFlaskApp, \
-    SettingsMixin, MultiPartForm, UrlEncodeForm
+    SettingsMixin, MultiPartForm, UrlEncodeForm, TypeStream, receive_body
+
+# 请求体默认的最大字节数，为0时不限制，需要时通过MAX_BODY_SIZE配置开启
+MAX_BODY_SIZE = 0
+# url-encoded表单默认的最大字段数
+MAX_FORM_FIELDS = 1000
 
 
 class IdentityInterface(object):
+
+    @cache_property
+    def resolve_signature(self):
+        """
+        缓存resolve的签名，避免解析每个参数时都调用inspect.signature
+        """
+        return inspect.signature(self.resolve)
+
+    @cache_property
+    def parameterized(self):
+        """
+        resolve是否需要注入Parameter
+        """
+        return inspect.Parameter in [
+            arg.annotation for arg in self.resolve_signature.parameters.values()]
+
     def identity(self, parameter: inspect.Parameter):
         """
         修复annotation_name重名的Bug
@@ -37,8 +60,7 @@ class IdentityInterface(object):
         annotation_name = str(parameter.annotation)
         # If `resolve_parameter` includes `Parameter` then we use an identifier
         # that is additionally parameterized by the parameter name.
-        args = inspect.signature(self.resolve).parameters.values()
-        if inspect.Parameter in [arg.annotation for arg in args]:
+        if self.parameterized:
             return annotation_name + ':' + parameter_name
 
         # Standard case is to use the class name, lowercased.
@@ -55,7 +77,7 @@ class Component(IdentityInterface, _Component):
 
     def can_handle_parameter(self, parameter: inspect.Parameter):
         """重写这个方法是为了增加typing.Union类型的判定"""
-        return_annotation = inspect.signature(self.resolve).return_annotation
+        return_annotation = self.resolve_signature.return_annotation
         if return_annotation is inspect.Signature.empty:
             return False
 
@@ -166,6 +188,31 @@ class FileStreamComponent(Component):
         return await self.decode(receive, content_type)
 
 
+class TypeStreamComponent(Component):
+    """
+    注入TypeStream[Model]，增量解析json数组，
+    单个元素的大小受MAX_BODY_SIZE限制，整个请求体不受限制
+    """
+    media_type = 'application/json'
+
+    def can_handle_parameter(self, parameter: inspect.Parameter):
+        return isinstance(parameter.annotation, type) and \
+               issubclass(parameter.annotation, TypeStream)
+
+    def resolve(self,
+                parameter: Parameter,
+                receive: ASGIReceive,
+                headers: http.Headers,
+                settings: FrozenSettings) -> TypeStream:
+        try:
+            negotiate_content_type([self], headers.get("content-type"))
+        except exceptions.NoCodecAvailable:
+            raise exceptions.UnsupportedMediaType()
+
+        return parameter.annotation(
+            receive, settings.get_int("MAX_BODY_SIZE", MAX_BODY_SIZE))
+
+
 class FormParamComponent(Component):
 
     def resolve(self, parameter: inspect.Parameter,
@@ -228,6 +275,28 @@ class UrlEncodeComponent(RequestDataComponent, Component):
         return parameter.annotation is UrlEncodeForm
 
 
+class BodyComponent(_Component):
+    """
+    接收请求体时检查MAX_BODY_SIZE及MAX_FORM_FIELDS，为0时不限制。
+    Content-Length超出限制时不接收请求体，直接返回413。
+    """
+    async def resolve(self,
+                      receive: ASGIReceive,
+                      headers: http.Headers,
+                      settings: FrozenSettings) -> http.Body:
+        max_size = settings.get_int("MAX_BODY_SIZE", MAX_BODY_SIZE)
+        content_length = headers.get("content-length")
+        if max_size and content_length and content_length.isdigit() and \
+                int(content_length) > max_size:
+            raise PayloadTooLarge(f"Request body exceeds {max_size} bytes.")
+
+        max_fields = 0
+        mime_type, _ = parse_options_header(headers.get("content-type"))
+        if mime_type == "application/x-www-form-urlencoded":
+            max_fields = settings.get_int("MAX_FORM_FIELDS", MAX_FORM_FIELDS)
+        return http.Body(await receive_body(receive, max_size, max_fields))
+
+
 class HeaderComponent(_Component):
     def resolve(self,
                 parameter: Parameter,
@@ -252,3 +321,5 @@ class QueryParamComponent(_Component):
 # 现在改成如果有默认值存在，使用默认值，否则报错。
 ASGI_COMPONENTS[8].resolve = QueryParamComponent().resolve
 ASGI_COMPONENTS[10].resolve = HeaderComponent().resolve
+# 请求体改为边接收边检查大小
+ASGI_COMPONENTS[11].resolve = BodyComponent().resolve
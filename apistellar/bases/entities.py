@@ -1,8 +1,12 @@
 import re
 import os
+import json
+import codecs
 import typing
 
 from enum import Enum
+from abc import ABCMeta
+from contextlib import suppress
 from urllib.parse import unquote
 from collections import namedtuple
 from flask.sessions import SecureCookieSession
@@ -11,7 +15,9 @@ from toolkit.async_context import Context
 from toolkit import global_cache_classproperty, load
 from toolkit.settings import SettingsLoader, Settings, FrozenSettings
 
-from .exceptions import Readonly
+from apistar.exceptions import BadRequest, ValidationError
+
+from .exceptions import Readonly, PayloadTooLarge
 
 Cookie = typing.NewType('Cookie', str)
 # 用于标记已知名字的表单字段
@@ -78,14 +84,19 @@ class File(object):
                 yield read
                 continue
 
-            index = self.stream.body.find(self.tmpboundary)
+            # 未找到分隔线时body只保留不足一个分隔线长度的数据，
+            # 所以每次查找只会重复扫描这部分数据
+            body = stream.body
+            index = body.find(self.tmpboundary)
             if index != -1:
                 # 找到分隔线，返回分隔线前的数据
-                # 并将分隔及分隔线后的数据返回给stream
-                read, stream.body = stream.body[:index], stream.body[index:]
+                # 分隔线及其后的数据留在stream中
+                read = self.consume(body, index)
                 self._size += len(read)
-                yield read
-                if self._last:
+                if read:
+                    yield read
+                # read可能多次切分最后一块数据，需要全部返回
+                while self._last:
                     read = self._last
                     self._last = b""
                     yield read
@@ -94,12 +105,28 @@ class File(object):
                 assert not self.stream.closed, "Content not complete!"
                 # 若没有找到分隔线，为了防止分隔线被读取了一半
                 # 选择只返回少于分隔线长度的部分body
-                read = stream.body[:-self.boundary_len]
-                stream.body = stream.body[-self.boundary_len:]
+                read = self.consume(body, len(body) - self.boundary_len)
                 self._size += len(read)
-                yield read
+                if read:
+                    yield read
                 await self.get_message(self.receive, stream)
 
+    @staticmethod
+    def consume(body, size):
+        """
+        从bytearray头部取出size个字节，只复制取出的部分，
+        bytearray删除头部数据时只移动起始位置，不会复制剩余的数据。
+        :param body:
+        :param size:
+        :return:
+        """
+        if size <= 0:
+            return b""
+        with memoryview(body) as view:
+            read = view[:size].tobytes()
+        del body[:size]
+        return read
+
     async def read(self, size=10240):
         """
         推荐直接迭代File对象，性能较好
@@ -107,17 +134,19 @@ class File(object):
         :param size:
         :return:
         """
-        read = b""
+        read = bytearray()
         assert size > 0, (999, "Read size must > 0")
         while len(read) < size:
             try:
                 buffer = await self.body_iter.asend(None)
             except StopAsyncIteration:
-                return read
-            read = read + buffer
-            read, self._last = read[:size], read[size:]
+                break
+            read += buffer
 
-        return read
+        if len(read) > size:
+            self._last = bytes(read[size:])
+            del read[size:]
+        return bytes(read)
 
     @staticmethod
     async def get_message(receive, stream):
@@ -133,6 +162,54 @@ class File(object):
     def tell(self):
         return self._size - len(self._last)
 
+    async def save(self, dst, hashes=("md5", "sha256"), executor=None):
+        """
+        边接收边写入文件，写入及hash计算在有界线程池中进行，内存占用与文件大小无关
+        :param dst: 文件路径或以二进制模式打开的文件对象，传入路径时会在写入后关闭
+        :param hashes: 需要计算的hash算法
+        :param executor: BoundedExecutor，默认使用文件io线程池
+        :return: FileSink，可通过size及hexdigest获取大小及hash
+        """
+        # avoid import cycle
+        from .fileio import FileSink, IOExecutor
+        executor = executor or IOExecutor.executor
+        if isinstance(dst, (str, bytes, os.PathLike)):
+            sink = FileSink(
+                await executor.run(open, dst, "wb"), hashes, executor)
+            try:
+                try:
+                    await self.write_to(sink)
+                finally:
+                    await sink.close()
+            except BaseException:
+                # 写入失败时删除不完整的文件
+                with suppress(OSError):
+                    await executor.run(os.remove, dst)
+                raise
+        else:
+            sink = FileSink(dst, hashes, executor)
+            await self.write_to(sink)
+        return sink
+
+    async def spool(self, max_size=None, hashes=("md5", "sha256"),
+                    executor=None):
+        """
+        接收文件并暂存，不超过max_size时保存在内存中，否则转存到临时文件
+        :param max_size: 内存中保存的最大字节数，默认使用UPLOAD_SPOOL_SIZE配置
+        :param hashes:
+        :param executor:
+        :return: SpooledFile
+        """
+        from .fileio import SpooledFile
+        sink = SpooledFile(max_size, hashes, executor)
+        await self.write_to(sink)
+        return sink
+
+    async def write_to(self, sink):
+        async for chunk in self:
+            await sink.write(chunk)
+        await sink.flush()
+
     @classmethod
     async def from_boundary(cls, stream, receive, boundary):
         tmp_boundary = b"--" + boundary
@@ -153,11 +230,11 @@ class File(object):
         index = body.find(tmp_boundary)
         if index == body.find(end_boundary):
             raise StopAsyncIteration
-        body = body[index + len(tmp_boundary):]
-        split_index = body.find(b"\r\n\r\n")
-        header_str, body = body[:split_index], body[split_index + 4:]
+        start = index + len(tmp_boundary)
+        split_index = body.find(b"\r\n\r\n", start)
+        header_str = bytes(body[start:split_index])
         headers = cls.parse(header_str)
-        stream.body = body
+        del body[:split_index + 4]
         return headers
 
     @classmethod
@@ -185,7 +262,7 @@ class FileStream(object):
     def __init__(self, receive, boundary):
         self.receive = receive
         self.boundary = boundary
-        self.body = b""
+        self.body = bytearray()
         self.closed = False
 
     def __aiter__(self):
@@ -195,6 +272,203 @@ class FileStream(object):
         return await File.from_boundary(self, self.receive, self.boundary)
 
 
+async def receive_body(receive, max_size=0, max_fields=0, separator=b"&"):
+    """
+    接收请求体，边接收边检查大小和表单字段数，超出限制时立即抛出413，不再继续接收
+    :param receive:
+    :param max_size: 最大字节数，为0时不限制
+    :param max_fields: url-encoded表单的最大字段数，为0时不限制
+    :param separator: 表单字段分隔符
+    :return:
+    """
+    body = bytearray()
+    fields = 1
+    while True:
+        message = await receive()
+        assert message['type'] == 'http.request', \
+            f"Unexpected ASGI message type: {message['type']}."
+        chunk = message.get("body", b"")
+        if max_size and len(body) + len(chunk) > max_size:
+            raise PayloadTooLarge(f"Request body exceeds {max_size} bytes.")
+        if max_fields:
+            fields += chunk.count(separator)
+            if fields > max_fields:
+                raise PayloadTooLarge(
+                    f"Request form exceeds {max_fields} fields.")
+        body += chunk
+        if not message.get('more_body', False):
+            return bytes(body)
+
+
+class TypeStreamMeta(ABCMeta):
+
+    def __getitem__(cls, model):
+        """
+        TypeStream[Model]返回绑定了Model的TypeStream子类，结果会被缓存
+        :param model:
+        :return:
+        """
+        assert cls.model is None, f"{cls.__name__} already bound to a model."
+        try:
+            return cls.classes[model]
+        except KeyError:
+            assert hasattr(model, "iter_validate"), \
+                "TypeStream only support Type."
+            klass = type(cls)(f"{cls.__name__}[{model.__name__}]", (cls,),
+                              {"model": model})
+            cls.classes[model] = klass
+            return klass
+
+
+class TypeStream(object, metaclass=TypeStreamMeta):
+    """
+    增量解析请求体中的json数组，每收到一块数据就解析出其中完整的元素，
+    使用Model.iter_validate逐个校验并返回，内存占用与数组长度无关。
+    使用TypeStream[Model]作为handler参数的注解，未绑定Model时返回原始数据。
+    """
+    model = None
+    classes = dict()
+    decoder = json.JSONDecoder()
+    whitespace = re.compile(r"[ \t\n\r]*")
+    # 解析状态：等待"["，等待元素或"]"，等待","或"]"，等待元素，数组已结束
+    START, FIRST, DELIMITER, VALUE, END = range(5)
+
+    def __init__(self, receive, max_item_size=0, allow_coerce=False):
+        """
+        :param receive:
+        :param max_item_size: 单个元素的最大字节数，为0时不限制
+        :param allow_coerce:
+        """
+        self.receive = receive
+        self.max_item_size = max_item_size
+        self.allow_coerce = allow_coerce
+        self.text_decoder = codecs.getincrementaldecoder("utf-8")()
+        self.buffer = ""
+        # 尚未合并到缓冲区的数据块及其总长度，重试解析时才合并
+        self.chunks = list()
+        self.pending = 0
+        # 缓冲区中未解析部分的起始位置
+        self.pos = 0
+        self.state = self.START
+        # 解析失败后，缓冲区至少达到这个长度才重试，避免大元素被反复解析
+        self.retry_size = 0
+        self.closed = False
+        self.finished = False
+        # 已返回的元素数量，用于错误信息中的位置
+        self.count = 0
+        self.items = iter(())
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        while True:
+            try:
+                return next(self.items)
+            except StopIteration:
+                pass
+            if self.finished:
+                raise StopAsyncIteration
+            await self.feed()
+
+    async def feed(self):
+        message = await self.receive()
+        assert message['type'] == 'http.request', \
+            f"Unexpected ASGI message type: {message['type']}."
+        self.closed = not message.get('more_body', False)
+        try:
+            text = self.text_decoder.decode(
+                message.get("body", b""), final=self.closed)
+        except UnicodeDecodeError as e:
+            raise BadRequest(f"Malformed JSON. {e}")
+
+        self.chunks.append(text)
+        self.pending += len(text)
+        size = len(self.buffer) - self.pos + self.pending
+        if self.closed or size >= self.retry_size or \
+                self.max_item_size and size > self.max_item_size:
+            # 丢弃已经解析的部分，合并数据块，retry_size成倍增长，
+            # 大元素的数据总共只会被复制常数次
+            self.chunks.insert(0, self.buffer[self.pos:])
+            self.buffer = "".join(self.chunks)
+            self.chunks.clear()
+            self.pending = 0
+            self.pos = 0
+            items = self.parse()
+            if items:
+                self.items = self.validate(items)
+            if self.max_item_size and \
+                    len(self.buffer) - self.pos > self.max_item_size:
+                raise PayloadTooLarge(
+                    f"Array item exceeds {self.max_item_size} bytes.")
+        self.finished = self.closed
+
+    def parse(self):
+        """
+        解析缓冲区中完整的元素
+        :return:
+        """
+        items = list()
+        buffer = self.buffer
+        while True:
+            self.pos = self.whitespace.match(buffer, self.pos).end()
+            if self.pos == len(buffer):
+                break
+            char = buffer[self.pos]
+            if self.state == self.END:
+                raise BadRequest("Malformed JSON. Extra data after array.")
+            elif self.state == self.START:
+                if char != "[":
+                    raise BadRequest("Malformed JSON. Expecting an array.")
+                self.pos += 1
+                self.state = self.FIRST
+            elif char == "]" and self.state != self.VALUE:
+                self.pos += 1
+                self.state = self.END
+            elif self.state == self.DELIMITER:
+                if char != ",":
+                    raise BadRequest(
+                        "Malformed JSON. Expecting ',' delimiter.")
+                self.pos += 1
+                self.state = self.VALUE
+            else:
+                try:
+                    item, end = self.decoder.raw_decode(buffer, self.pos)
+                except ValueError as e:
+                    if self.closed:
+                        raise BadRequest(f"Malformed JSON. {e}")
+                    break
+                # 数字等元素到达缓冲区末尾时可能还未接收完整
+                if end == len(buffer) and not self.closed:
+                    break
+                items.append(item)
+                self.pos = end
+                self.state = self.DELIMITER
+
+        if self.closed and self.state != self.END:
+            raise BadRequest("Malformed JSON. Unexpected end of array.")
+        self.retry_size = (len(buffer) - self.pos) * 2
+        return items
+
+    def validate(self, items):
+        """
+        逐个校验并返回元素
+        :param items:
+        :return:
+        """
+        start = self.count
+        self.count += len(items)
+        if self.model is None:
+            yield from items
+            return
+        try:
+            yield from self.model.iter_validate(
+                items, allow_coerce=self.allow_coerce)
+        except ValidationError as exc:
+            raise BadRequest(dict(
+                (start + pos, detail) for pos, detail in exc.detail.items()))
+
+
 class InheritType(Enum):
     DUPLICATE = 0  # 重名且类型相符，在参数列表和赋值中不体现，在super中体现
     OVERWRITE = 1  # 重名但是类型不同，全部位置要体现，但是需要父类的参数改名字
@@ -1,2 +1,10 @@
+from apistar.exceptions import HTTPException
+
+
 class Readonly(Exception):
-    pass
\ No newline at end of file
+    pass
+
+
+class PayloadTooLarge(HTTPException):
+    default_status_code = 413
+    default_detail = 'Payload too large'
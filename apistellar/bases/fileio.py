@@ -0,0 +1,305 @@
+import io
+import asyncio
+import hashlib
+import tempfile
+import threading
+
+from weakref import WeakKeyDictionary
+from concurrent.futures import ThreadPoolExecutor
+
+from toolkit import global_cache_classproperty
+
+from .entities import settings
+
+
+class BoundedExecutor(object):
+    """
+    线程数量及排队任务数量都有上限的线程池，用来执行阻塞的磁盘io，
+    排队已满时，新任务在协程中等待，而不是无限堆积在线程池队列中。
+    """
+
+    def __init__(self, max_workers=4, max_pending=64,
+                 thread_name_prefix="apistellar-io"):
+        assert max_workers > 0, "max_workers must > 0"
+        assert max_pending >= max_workers, "max_pending must >= max_workers"
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.executor = ThreadPoolExecutor(
+            max_workers, thread_name_prefix=thread_name_prefix)
+        # asyncio.Semaphore与事件循环绑定，所以每个事件循环单独维护一个
+        self._semaphores = WeakKeyDictionary()
+        self._lock = threading.Lock()
+        self.waiting = 0
+        self.pending = 0
+        self.running = 0
+        self.completed = 0
+
+    def _get_semaphore(self, loop):
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = self._semaphores[loop] = asyncio.Semaphore(
+                self.max_pending)
+        return semaphore
+
+    def _call(self, func, args):
+        with self._lock:
+            self.running += 1
+        try:
+            return func(*args)
+        finally:
+            with self._lock:
+                self.running -= 1
+
+    async def run(self, func, *args):
+        """
+        在线程池中执行func(*args)
+        :param func:
+        :param args:
+        :return:
+        """
+        loop = asyncio.get_event_loop()
+        semaphore = self._get_semaphore(loop)
+        self.waiting += 1
+        try:
+            await semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        self.pending += 1
+        try:
+            return await loop.run_in_executor(
+                self.executor, self._call, func, args)
+        finally:
+            self.pending -= 1
+            self.completed += 1
+            semaphore.release()
+
+    def metrics(self):
+        """
+        队列深度等指标
+        waiting: 因排队已满而等待提交的任务数
+        queued: 已提交但还未被线程执行的任务数
+        running: 正在执行的任务数
+        :return:
+        """
+        running = self.running
+        return {
+            "max_workers": self.max_workers,
+            "max_pending": self.max_pending,
+            "waiting": self.waiting,
+            "queued": max(self.pending - running, 0),
+            "running": running,
+            "completed": self.completed,
+        }
+
+    def shutdown(self, wait=True):
+        self.executor.shutdown(wait)
+
+
+class IOExecutor(object):
+
+    @global_cache_classproperty
+    def executor(cls):
+        """
+        懒加载，以便使用init_settings之后的配置
+        :return:
+        """
+        max_workers = settings.get_int("FILE_IO_WORKERS", 4)
+        return BoundedExecutor(
+            max_workers, settings.get_int("FILE_IO_MAX_PENDING", max_workers * 16))
+
+
+def io_metrics():
+    """
+    文件io线程池的队列指标
+    :return:
+    """
+    return IOExecutor.executor.metrics()
+
+
+class AsyncFileReader(object):
+    """
+    包装同步的文件对象，在有界线程池中读取，并预读下一块数据，
+    使得磁盘寻道不会阻塞事件循环中的其它请求。
+    """
+
+    def __init__(self, fileobj, executor=None):
+        self.fileobj = fileobj
+        self.executor = executor or IOExecutor.executor
+        self._buffer = b""
+        self._ahead = None
+        self._eof = False
+
+    async def _collect_ahead(self):
+        if self._ahead is not None:
+            ahead, self._ahead = self._ahead, None
+            data = await ahead
+            if data:
+                self._buffer += data
+            else:
+                self._eof = True
+
+    async def read(self, size=-1):
+        await self._collect_ahead()
+        if size is None or size < 0:
+            data, self._buffer = self._buffer, b""
+            if not self._eof:
+                data += await self.executor.run(self.fileobj.read)
+                self._eof = True
+            return data
+
+        if len(self._buffer) < size and not self._eof:
+            data = await self.executor.run(
+                self.fileobj.read, size - len(self._buffer))
+            if data:
+                self._buffer += data
+            else:
+                self._eof = True
+
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        if data and not self._eof:
+            # 顺序读取时，提前读取下一块
+            self._ahead = asyncio.ensure_future(
+                self.executor.run(self.fileobj.read, size))
+        return data
+
+    async def seek(self, offset, whence=0):
+        await self._collect_ahead()
+        if whence == 1:
+            offset -= len(self._buffer)
+        self._buffer = b""
+        self._eof = False
+        return await self.executor.run(self.fileobj.seek, offset, whence)
+
+    async def tell(self):
+        await self._collect_ahead()
+        return await self.executor.run(self.fileobj.tell) - len(self._buffer)
+
+    async def cancel_read_ahead(self):
+        """
+        不再读取时丢弃预读的数据。线程中已经开始的read无法取消，
+        所以等待其结束，避免与之后的close竞争
+        :return:
+        """
+        if self._ahead is not None:
+            ahead, self._ahead = self._ahead, None
+            try:
+                await ahead
+            except Exception:
+                pass
+
+    def fileno(self):
+        return self.fileobj.fileno()
+
+    @property
+    def name(self):
+        return getattr(self.fileobj, "name", "")
+
+    async def close(self):
+        await self.cancel_read_ahead()
+        await self.executor.run(self.fileobj.close)
+
+
+class FileSink(object):
+    """
+    将数据写入文件对象，写入及hash计算在有界线程池中进行。
+    同一时间只有一个写入任务，保证了写入顺序，
+    同时写入上一块数据与接收下一块数据可以并行。
+    """
+
+    def __init__(self, fileobj, hashes=("md5", "sha256"), executor=None):
+        self.fileobj = fileobj
+        self.executor = executor or IOExecutor.executor
+        self.hashes = dict((name, hashlib.new(name)) for name in hashes)
+        self.size = 0
+        self._writing = None
+
+    def _write(self, data):
+        self.fileobj.write(data)
+        # hashlib计算较大的数据时会释放GIL
+        for h in self.hashes.values():
+            h.update(data)
+
+    def in_memory(self, data):
+        """
+        数据是否写入内存，写入内存时不使用线程池
+        :param data:
+        :return:
+        """
+        return False
+
+    async def write(self, data):
+        await self.flush()
+        if self.in_memory(data):
+            self._write(data)
+        else:
+            self._writing = asyncio.ensure_future(
+                self.executor.run(self._write, data))
+        self.size += len(data)
+
+    async def flush(self):
+        """
+        等待写入完成
+        :return:
+        """
+        if self._writing is not None:
+            writing, self._writing = self._writing, None
+            await writing
+
+    def hexdigests(self):
+        return dict((name, h.hexdigest()) for name, h in self.hashes.items())
+
+    def hexdigest(self, name):
+        return self.hashes[name].hexdigest()
+
+    async def close(self):
+        try:
+            await self.flush()
+        finally:
+            await self.executor.run(self.fileobj.close)
+
+
+class SpooledFile(FileSink):
+    """
+    数据量不超过max_size时保存在内存中，超过后转存到临时文件，
+    适合在不确定上传文件大小时暂存文件。
+    """
+
+    def __init__(self, max_size=None, hashes=("md5", "sha256"), executor=None):
+        if max_size is None:
+            max_size = settings.get_int("UPLOAD_SPOOL_SIZE", 1024 * 1024)
+        self.max_size = max_size
+        # 是否已经转存到磁盘
+        self.rolled = False
+        super(SpooledFile, self).__init__(io.BytesIO(), hashes, executor)
+
+    def in_memory(self, data):
+        if not self.rolled and self.size + len(data) <= self.max_size:
+            return True
+        # 这一块及之后的数据都在线程池中写入临时文件
+        self.rolled = True
+        return False
+
+    def _write(self, data):
+        if self.rolled and isinstance(self.fileobj, io.BytesIO):
+            self.rollover()
+        super(SpooledFile, self)._write(data)
+
+    def rollover(self):
+        """
+        将内存中的数据转存到临时文件，在线程池中执行
+        :return:
+        """
+        memory = self.fileobj
+        fileobj = tempfile.TemporaryFile()
+        fileobj.write(memory.getbuffer())
+        self.fileobj = fileobj
+        memory.close()
+
+    async def reader(self):
+        """
+        写入完成后，从头读取数据
+        :return: AsyncFileReader
+        """
+        await self.flush()
+        await self.executor.run(self.fileobj.seek, 0)
+        return AsyncFileReader(self.fileobj, self.executor)
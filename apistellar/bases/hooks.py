@@ -115,7 +115,7 @@ class AccessLogHook(object):
         if string:
             path = path + "?" + string
         self.log(host, path, protocol, method, resp.status_code,
-                 resp.headers["Content-Length"], user_agent)
+                 resp.headers.get("Content-Length", "-"), user_agent)
         return resp
 
     on_error = on_response
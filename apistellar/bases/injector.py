@@ -0,0 +1,70 @@
+from apistar.exceptions import ConfigurationError
+from apistar.server.injector import ASyncInjector
+
+
+class PlanInjector(ASyncInjector):
+    """
+    将一组函数的依赖解析结果编译成固定的执行计划，
+    执行计划为[(func, is_async, kwargs, consts, output_name, set_return), ...]，
+    其中kwargs为(参数名, state key)元组，请求时只需依次执行。
+    """
+
+    def compile(self, funcs, state_keys=()):
+        """
+        编译并缓存执行计划
+        :param funcs:
+        :param state_keys: 运行时state中已存在的key
+        :return:
+        """
+        funcs = tuple(funcs)
+        plan = self.resolver_cache.get(funcs)
+        if plan is None:
+            steps = self.resolve_functions(funcs, dict.fromkeys(state_keys))
+            plan = self.resolver_cache[funcs] = tuple(
+                (func, is_async, tuple(kwargs.items()), consts or None,
+                 output_name, set_return)
+                for func, is_async, kwargs, consts, output_name, set_return
+                in steps)
+        return plan
+
+    @staticmethod
+    async def run_plan(plan, state):
+        output_name = None
+        for func, is_async, kwargs, consts, output_name, set_return in plan:
+            func_kwargs = {key: state[val] for key, val in kwargs}
+            if consts:
+                func_kwargs.update(consts)
+            if is_async:
+                state[output_name] = await func(**func_kwargs)
+            else:
+                state[output_name] = func(**func_kwargs)
+            if set_return:
+                state['return_value'] = state[output_name]
+
+        return state[output_name]
+
+    def run(self, funcs, state):
+        """
+        同步执行，计划中不能包含异步函数
+        """
+        if not funcs:
+            return
+        output_name = None
+        for func, is_async, kwargs, consts, output_name, set_return \
+                in self.compile(funcs, state):
+            if is_async:
+                raise ConfigurationError(
+                    f"Function '{func.__name__}' is async, use run_async.")
+            func_kwargs = {key: state[val] for key, val in kwargs}
+            if consts:
+                func_kwargs.update(consts)
+            state[output_name] = func(**func_kwargs)
+            if set_return:
+                state['return_value'] = state[output_name]
+
+        return state[output_name]
+
+    async def run_async(self, funcs, state):
+        if not funcs:
+            return
+        return await self.run_plan(self.compile(funcs, state), state)
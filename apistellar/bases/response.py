@@ -1,14 +1,28 @@
+import re
 import os
 import time
+import uuid
 import typing
+import asyncio
 import mimetypes
 
 from apistar.http import Response, StrMapping, StrPairs
 
-from apistellar.helper import parse_date
+from apistellar.helper import parse_date, parse_range_header, \
+    get_regular_fileno, get_json_backend
+
+# StreamingResponse默认每块包含的元素数量
+STREAM_BATCH_SIZE = 100
+# EventSourceResponse空闲时发送心跳注释的间隔(秒)
+SSE_PING_INTERVAL = 15
 
 
 class FileResponse(Response):
+    # Range请求的分段信息[(分段头, 偏移, 长度), ...]及结束标记，
+    # 文件对象由finalize_asgi按分段seek读取发送
+    ranges = None
+    ranges_tail = b""
+
     def __init__(self,
                  content: typing.Any,
                  filename: str = None,
@@ -19,12 +33,19 @@ class FileResponse(Response):
                  charset: str = 'utf-8',
                  download: bool = True,
                  req_headers: typing.Union[StrMapping, StrPairs] = None,
+                 zero_copy: bool = True,
+                 async_read: bool = True,
     ):
         self.filename = filename
         self.media_type = media_type or self.media_type
         self.charset = charset
         self.download = download
         self.req_headers = req_headers
+        # 服务器支持零拷贝扩展时，磁盘文件交给服务器直接发送
+        self.zero_copy = zero_copy
+        # 否则同步文件对象在有界线程池中读取，
+        # 为False时磁盘文件在事件循环中读取(zero_copy为True时使用mmap)
+        self.async_read = async_read
         super(FileResponse, self).__init__(content, status_code, headers, exc_info)
 
     def render(self, content: typing.Any):
@@ -69,8 +90,14 @@ class FileResponse(Response):
             self.headers['Content-Disposition'] = f'attachment; ' \
                                                   f'filename="{self.filename}"'
         if "Last-Modified" not in self.headers:
-            self.headers['Last-Modified'] = \
-                time.strftime("%a, %d %b %Y %H:%M:%S GMT")
+            fileno = get_regular_fileno(self.content)
+            if fileno is not None:
+                self.headers['Last-Modified'] = time.strftime(
+                    "%a, %d %b %Y %H:%M:%S GMT",
+                    time.gmtime(os.fstat(fileno).st_mtime))
+            else:
+                self.headers['Last-Modified'] = \
+                    time.strftime("%a, %d %b %Y %H:%M:%S GMT")
 
         if self.req_headers and "If-Modified-Since" in self.req_headers:
             if_modified_since = parse_date(
@@ -79,6 +106,364 @@ class FileResponse(Response):
             if_modified_since = None
 
         mtime = parse_date(self.headers['Last-Modified'])
+        if "ETag" not in self.headers and mtime is not None:
+            self.headers['ETag'] = '"%x-%x"' % (
+                int(mtime), int(self.headers['Content-Length']))
+        self.headers['Accept-Ranges'] = "bytes"
+
         if if_modified_since is not None and mtime is not None and \
                 if_modified_since >= int(mtime):
             self.status_code = 304
+        elif self.status_code == 200 and self.req_headers and \
+                self.req_headers.get("Range") and self.match_if_range():
+            self.set_range(self.req_headers["Range"])
+
+    def match_if_range(self):
+        """
+        If-Range为ETag时需要强匹配，为日期时需要与Last-Modified一致，
+        不匹配时忽略Range返回完整内容
+        :return:
+        """
+        if_range = (self.req_headers.get("If-Range") or "").strip()
+        if not if_range:
+            return True
+        if if_range.startswith(('"', "W/")):
+            return if_range == self.headers.get("ETag") and \
+                   not if_range.startswith("W/")
+        mtime = parse_date(if_range)
+        return mtime is not None and \
+            mtime == parse_date(self.headers['Last-Modified'])
+
+    def get_position(self):
+        """
+        文件对象的当前位置，bytes或异步文件对象返回0
+        :return:
+        """
+        tell = getattr(self.content, "tell", None)
+        if tell is None or not hasattr(self.content, "read"):
+            return 0
+        position = tell()
+        if not isinstance(position, int):
+            # 异步文件对象的tell返回协程，无法在这里获取
+            getattr(position, "close", lambda: None)()
+            return 0
+        return position
+
+    def set_range(self, range_header):
+        """
+        返回206响应，多个区间时使用multipart/byteranges
+        :param range_header:
+        :return:
+        """
+        length = int(self.headers['Content-Length'])
+        ranges = parse_range_header(range_header, length)
+        if ranges is None:
+            return
+
+        if not ranges:
+            self.status_code = 416
+            self.headers['Content-Range'] = f"bytes */{length}"
+            self.headers['Content-Length'] = "0"
+            if hasattr(self.content, "close"):
+                self.content.close()
+            self.content = b""
+            return
+
+        # 文件对象的区间相对于当前位置
+        base = self.get_position()
+        self.status_code = 206
+        if len(ranges) == 1:
+            start, end = ranges[0]
+            self.headers['Content-Range'] = f"bytes {start}-{end}/{length}"
+            self.ranges = [(b"", base + start, end - start + 1)]
+        else:
+            boundary = uuid.uuid4().hex
+            content_type = self.headers.get(
+                'Content-Type', "application/octet-stream")
+            self.ranges = list()
+            for index, (start, end) in enumerate(ranges):
+                head = f"--{boundary}\r\n" \
+                       f"Content-Type: {content_type}\r\n" \
+                       f"Content-Range: bytes {start}-{end}/{length}\r\n\r\n"
+                if index:
+                    head = "\r\n" + head
+                self.ranges.append(
+                    (head.encode(), base + start, end - start + 1))
+            self.ranges_tail = f"\r\n--{boundary}--\r\n".encode()
+            self.headers['Content-Type'] = \
+                f"multipart/byteranges; boundary={boundary}"
+
+        body_length = sum(len(head) + count for head, _, count in self.ranges)
+        self.headers['Content-Length'] = str(
+            body_length + len(self.ranges_tail))
+        if not hasattr(self.content, "read"):
+            self.content = b"".join(
+                head + self.content[start: start + count]
+                for head, start, count in self.ranges) + self.ranges_tail
+            self.ranges = None
+
+
+class StreamingResponse(Response):
+    """
+    content为异步可迭代对象(如异步生成器)或可迭代对象，由finalize_asgi逐块发送，
+    不设置Content-Length，由服务器使用chunked编码。
+    第一个元素立即发送，之后每batch_size个元素编码成一块发送，
+    元素产生较慢时(如推送)可将batch_size设为1。
+    """
+    media_type = 'application/octet-stream'
+    # 是否在客户端断开连接时停止迭代
+    watch_disconnect = False
+
+    def __init__(self,
+                 content: typing.Any,
+                 status_code: int = 200,
+                 headers: typing.Union[StrMapping, StrPairs] = None,
+                 exc_info=None,
+                 media_type: str = None,
+                 batch_size: int = STREAM_BATCH_SIZE,
+    ):
+        self.media_type = media_type or self.media_type
+        self.batch_size = max(batch_size, 1)
+        super(StreamingResponse, self).__init__(
+            content, status_code, headers, exc_info)
+
+    def render(self, content: typing.Any):
+        assert hasattr(content, "__aiter__") or hasattr(content, "__iter__"), \
+            f"{self.__class__.__name__} content must be iterable. " \
+            f"Got {type(content).__name__}."
+        return content
+
+    def set_default_headers(self):
+        if 'Content-Type' not in self.headers and self.media_type is not None:
+            content_type = self.media_type
+            if self.media_type.startswith('text/') and self.charset:
+                content_type += f'; charset={self.charset}'
+            self.headers['Content-Type'] = content_type
+
+    def encode(self, items, first):
+        """
+        将一批元素编码成一块数据
+        :param items:
+        :param first: 是否是第一批
+        :return:
+        """
+        return b"".join(item.encode(self.charset)
+                        if isinstance(item, str) else item for item in items)
+
+    def head(self):
+        return b""
+
+    def tail(self):
+        return b""
+
+    async def iter_items(self):
+        if hasattr(self.content, "__aiter__"):
+            async for item in self.content:
+                yield item
+        else:
+            for item in self.content:
+                yield item
+
+    async def iter_body(self):
+        """
+        返回待发送的数据块
+        :return:
+        """
+        batch = list()
+        first = True
+        head = self.head()
+        async for item in self.iter_items():
+            batch.append(item)
+            if first or len(batch) >= self.batch_size:
+                yield head + self.encode(batch, first)
+                head = b""
+                first = False
+                batch.clear()
+        if batch or head:
+            yield head + self.encode(batch, first)
+        tail = self.tail()
+        if tail:
+            yield tail
+
+    async def close(self):
+        """
+        关闭异步生成器，使其中的async with/finally(如数据库连接)得到执行
+        :return:
+        """
+        aclose = getattr(self.content, "aclose", None)
+        if aclose is not None:
+            await aclose()
+        else:
+            close = getattr(self.content, "close", None)
+            close and close()
+
+
+class NDJSONResponse(StreamingResponse):
+    """
+    每个元素序列化成一行json，序列化语义与TypeEncoder一致
+    """
+    media_type = 'application/x-ndjson'
+
+    def encode(self, items, first):
+        dumpb = get_json_backend().dumpb
+        return b"".join(dumpb(item) + b"\n" for item in items)
+
+
+class JSONStreamResponse(StreamingResponse):
+    """
+    将元素流式序列化成json数组，序列化语义与TypeEncoder一致，
+    每批元素只序列化一次。content为TypeList时按列分块序列化。
+    """
+    media_type = 'application/json'
+
+    async def iter_body(self):
+        if hasattr(self.content, "iter_json"):
+            for chunk in self.content.iter_json(self.batch_size):
+                yield chunk
+        else:
+            async for chunk in super(JSONStreamResponse, self).iter_body():
+                yield chunk
+
+    def encode(self, items, first):
+        if not items:
+            return b""
+        # 去掉每一批的中括号，批之间用逗号连接
+        chunk = get_json_backend().dumpb(items)[1:-1]
+        return chunk if first else b"," + chunk
+
+    def head(self):
+        return b"["
+
+    def tail(self):
+        return b"]"
+
+
+class ServerSentEvent(object):
+    """
+    SSE事件，data不是字符串时序列化成json，多行数据拆成多个data字段。
+    event及id中不能含有换行符，避免伪造其它字段。
+    """
+    # SSE中的换行符，与str.splitlines不同，不包括\u2028等字符
+    newline = re.compile(r"\r\n|\r|\n")
+
+    def __init__(self, data=None, event=None, id=None, retry=None,
+                 comment=None):
+        self.data = data
+        self.event = self.check_field("event", event)
+        self.id = self.check_field("id", id)
+        if id is not None and "\0" in self.id:
+            raise ValueError("SSE id must not contain NULL.")
+        self.retry = None if retry is None else int(retry)
+        self.comment = comment
+
+    @classmethod
+    def check_field(cls, name, value):
+        """
+        单行字段不能含有换行符
+        :param name:
+        :param value:
+        :return:
+        """
+        if value is None:
+            return None
+        value = str(value)
+        if cls.newline.search(value):
+            raise ValueError(f"SSE {name} must not contain line breaks.")
+        return value
+
+    def encode(self):
+        lines = list()
+        if self.comment is not None:
+            lines.extend(f": {line}" for line
+                         in self.newline.split(str(self.comment)))
+        if self.id is not None:
+            lines.append(f"id: {self.id}")
+        if self.event is not None:
+            lines.append(f"event: {self.event}")
+        if self.retry is not None:
+            lines.append(f"retry: {self.retry}")
+        if self.data is not None:
+            data = self.data
+            if not isinstance(data, str):
+                data = get_json_backend().dumps(data)
+            lines.extend(f"data: {line}" for line in self.newline.split(data))
+        lines.append("\n")
+        return "\n".join(lines).encode("utf-8")
+
+
+class EventSourceResponse(StreamingResponse):
+    """
+    Server-Sent Events响应，content中的元素可以是ServerSentEvent、
+    已编码的bytes(如Channel的订阅)或任意数据(作为data发送)。
+    每个事件发送一次，空闲ping秒后发送心跳注释，客户端断开时停止迭代。
+    """
+    media_type = 'text/event-stream'
+    watch_disconnect = True
+    heartbeat = b": ping\n\n"
+
+    def __init__(self,
+                 content: typing.Any,
+                 status_code: int = 200,
+                 headers: typing.Union[StrMapping, StrPairs] = None,
+                 exc_info=None,
+                 ping: float = SSE_PING_INTERVAL,
+                 retry: int = None,
+    ):
+        self.ping = ping
+        self.retry = retry
+        self.disconnected = asyncio.Event()
+        super(EventSourceResponse, self).__init__(
+            content, status_code, headers, exc_info, batch_size=1)
+
+    def set_default_headers(self):
+        super(EventSourceResponse, self).set_default_headers()
+        if "Cache-Control" not in self.headers:
+            self.headers["Cache-Control"] = "no-cache"
+        # 禁止nginx缓冲事件
+        if "X-Accel-Buffering" not in self.headers:
+            self.headers["X-Accel-Buffering"] = "no"
+
+    def encode(self, items, first):
+        return b"".join(self.encode_event(item) for item in items)
+
+    @staticmethod
+    def encode_event(item):
+        if isinstance(item, bytes):
+            return item
+        if not isinstance(item, ServerSentEvent):
+            item = ServerSentEvent(item)
+        return item.encode()
+
+    def disconnect(self):
+        self.disconnected.set()
+
+    async def iter_body(self):
+        if self.retry is not None:
+            yield ServerSentEvent(retry=self.retry).encode()
+
+        items = self.iter_items().__aiter__()
+        disconnected = asyncio.ensure_future(self.disconnected.wait())
+        next_item = None
+        try:
+            while True:
+                if next_item is None:
+                    next_item = asyncio.ensure_future(items.__anext__())
+                done, _ = await asyncio.wait(
+                    (next_item, disconnected), timeout=self.ping,
+                    return_when=asyncio.FIRST_COMPLETED)
+                if disconnected in done:
+                    break
+                if next_item in done:
+                    try:
+                        item = next_item.result()
+                    except StopAsyncIteration:
+                        next_item = None
+                        break
+                    next_item = None
+                    yield self.encode_event(item)
+                else:
+                    yield self.heartbeat
+        finally:
+            disconnected.cancel()
+            if next_item is not None:
+                next_item.cancel()
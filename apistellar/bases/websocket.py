@@ -1,4 +1,3 @@
-import json
 import asyncio
 import logging
 
@@ -6,7 +5,7 @@ from apistar import http
 from functools import partial
 from _collections_abc import _check_methods
 
-from ..helper import TypeEncoder
+from ..helper import get_json_backend
 from .compact import CompactAbcMeta
 
 logger = logging.getLogger("websocket")
@@ -96,7 +95,7 @@ class WebSocketApp:
         elif buf is None:
             message["type"] = "websocket.close"
         elif not isinstance(buf, str):
-            buf = json.dumps(buf, cls=TypeEncoder)
+            buf = get_json_backend().dumps(buf)
 
         if isinstance(buf, str):
             message["text"] = buf
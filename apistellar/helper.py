@@ -4,6 +4,7 @@ import sys
 import json
 import time
 import glob
+import stat
 import email
 import types
 import inspect
@@ -297,20 +298,322 @@ def parse_date(ims):
         return None
 
 
+# 单个请求最多允许的Range区间数量
+MAX_RANGES = 16
+
+
+def parse_range_header(value, length, max_ranges=MAX_RANGES):
+    """
+    解析`Range: bytes=0-499, -500, 9500-`，返回闭区间列表[(start, end), ...]。
+    重叠或相邻的区间会按起始位置排序后合并，避免同一段内容被重复发送。
+    格式不正确或区间数量超过max_ranges时返回None，所有区间均无法满足时返回空列表。
+    """
+    unit, _, ranges = value.partition("=")
+    if unit.strip().lower() != "bytes" or not ranges.strip():
+        return None
+
+    specs = ranges.split(",")
+    if len(specs) > max_ranges:
+        return None
+
+    result = []
+    for spec in specs:
+        start, sep, end = (i.strip() for i in spec.partition("-"))
+        if not sep or start and not start.isdigit() or \
+                end and not end.isdigit() or not start and not end:
+            return None
+        if not start:
+            # 后缀区间，取最后end个字节
+            if int(end) and length:
+                result.append((max(length - int(end), 0), length - 1))
+            continue
+        if end and int(end) < int(start):
+            return None
+        if int(start) < length:
+            end = min(int(end), length - 1) if end else length - 1
+            result.append((int(start), end))
+
+    merged = []
+    for start, end in sorted(result):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def get_regular_fileno(fileobj):
+    """
+    获取普通磁盘文件的文件描述符，对于管道、socket或不存在fileno的对象返回None
+    :param fileobj:
+    :return:
+    """
+    try:
+        fileno = fileobj.fileno()
+    except (AttributeError, OSError, ValueError):
+        return None
+    if not isinstance(fileno, int) or \
+            not stat.S_ISREG(os.fstat(fileno).st_mode):
+        return None
+    return fileno
+
+
 class TypeEncoder(json.JSONEncoder):
     options = {Mapping: dict}
+    # 每个具体类型对应的序列化方法，register时失效
+    dispatch_cache = dict()
+    # 序列化方法对应的直接输出基础结构的版本，供to_primitive使用
+    primitives = dict()
+    # to_primitive使用的转换方法，register时失效
+    converter_cache = dict()
 
     @classmethod
-    def register(cls, type_mapping):
+    def register(cls, type_mapping, primitives=None):
+        """
+        注册类型的序列化方法
+        :param type_mapping: {类型: 序列化方法}
+        :param primitives: {序列化方法: 直接返回基础结构的转换方法}，
+        用于to_primitive时省去对序列化结果的再次遍历
+        :return:
+        """
         cls.options.update(type_mapping)
+        cls.primitives.update(primitives or {})
+        cls.dispatch_cache.clear()
+        cls.converter_cache.clear()
+
+    @classmethod
+    def dispatch(cls, klass):
+        """
+        按mro查找最具体的已注册类型，找不到时再使用isinstance兼容抽象基类，
+        结果按具体类型缓存。
+        :param klass:
+        :return:
+        """
+        try:
+            return cls.dispatch_cache[klass]
+        except KeyError:
+            pass
+
+        handler = None
+        for base in klass.__mro__:
+            if base in cls.options:
+                handler = cls.options[base]
+                break
+        else:
+            for key, val in cls.options.items():
+                if issubclass(klass, key):
+                    handler = val
+                    break
+        cls.dispatch_cache[klass] = handler
+        return handler
 
     def default(self, obj):
-        for key, val in self.options.items():
-            if isinstance(obj, key):
-                return val(obj)
+        handler = self.dispatch(obj.__class__)
+        if handler is not None:
+            return handler(obj)
         return json.JSONEncoder.default(self, obj)
 
 
+def to_primitive_key(key):
+    if isinstance(key, str):
+        return str.__str__(key)
+    elif key is True:
+        return "true"
+    elif key is False:
+        return "false"
+    elif key is None:
+        return "null"
+    elif isinstance(key, int):
+        return int.__repr__(key)
+    elif isinstance(key, float):
+        return json.dumps(float.__float__(key))
+    raise TypeError(f"keys must be str, int, float, bool or None, "
+                    f"not {key.__class__.__name__}")
+
+
+_SCALARS = frozenset((str, int, float, bool, type(None)))
+
+
+def _list_to_primitive(obj):
+    return [val if val.__class__ in _SCALARS else to_primitive(val)
+            for val in obj]
+
+
+def _dict_to_primitive(obj):
+    return {(key if key.__class__ is str else to_primitive_key(key)):
+            (val if val.__class__ in _SCALARS else to_primitive(val))
+            for key, val in obj.items()}
+
+
+def _find_converter(klass):
+    """
+    按json的编码顺序找到klass的转换方法，按具体类型缓存
+    :param klass:
+    :return:
+    """
+    if klass in _SCALARS:
+        converter = None
+    elif issubclass(klass, (str, int, float)):
+        # 子类(如IntEnum)与json一样按基础类型的值输出，不使用子类的__str__
+        converter = next(method for base, method in (
+            (str, str.__str__), (int, int.__int__), (float, float.__float__))
+            if issubclass(klass, base))
+    elif issubclass(klass, (list, tuple)):
+        converter = _list_to_primitive
+    elif issubclass(klass, dict):
+        converter = _dict_to_primitive
+    else:
+        handler = TypeEncoder.dispatch(klass)
+        if handler is None:
+            def converter(obj):
+                raise TypeError(f"Object of type {klass.__name__} "
+                                f"is not JSON serializable")
+        elif handler in TypeEncoder.primitives:
+            converter = TypeEncoder.primitives[handler]
+        else:
+            def converter(obj):
+                return to_primitive(handler(obj))
+
+    TypeEncoder.converter_cache[klass] = converter
+    return converter
+
+
+def to_primitive(obj):
+    """
+    递归的将对象转换成由dict, list, str, int, float, bool, None组成的结构，
+    结果与json.loads(json.dumps(obj, cls=TypeEncoder))一致，但不经过字符串。
+    :param obj:
+    :return:
+    """
+    klass = obj.__class__
+    try:
+        converter = TypeEncoder.converter_cache[klass]
+    except KeyError:
+        converter = _find_converter(klass)
+    if converter is None:
+        return obj
+    return converter(obj)
+
+
+class JSONBackend(object):
+    """
+    标准库json，保持TypeEncoder的序列化语义
+    """
+    name = "json"
+
+    def __init__(self):
+        self.default = TypeEncoder().default
+
+    def dumps(self, obj, **options):
+        options.setdefault("cls", TypeEncoder)
+        return json.dumps(obj, **options)
+
+    def dumpb(self, obj, **options):
+        return self.dumps(obj, **options).encode("utf-8")
+
+    def loads(self, s):
+        return json.loads(s)
+
+
+class OrJSONBackend(JSONBackend):
+    """
+    orjson只输出紧凑格式，忽略indent、separators等格式参数。
+    datetime、dataclass及基础类型的子类交给default处理，
+    以便使用TypeEncoder中注册的序列化方法，结果与标准库json一致。
+    注意：orjson将NaN及Infinity输出为null，而标准库json在allow_nan=False时抛出异常。
+    """
+    name = "orjson"
+
+    def __init__(self):
+        super(OrJSONBackend, self).__init__()
+        import orjson
+        self.orjson = orjson
+        self.option = orjson.OPT_NON_STR_KEYS | \
+            orjson.OPT_PASSTHROUGH_DATETIME | \
+            orjson.OPT_PASSTHROUGH_SUBCLASS | \
+            orjson.OPT_PASSTHROUGH_DATACLASS
+
+    def encode_default(self, obj):
+        # 与标准库json一样，基础类型的子类按基础类型输出
+        if isinstance(obj, str):
+            return str.__str__(obj)
+        if isinstance(obj, int):
+            return int.__int__(obj)
+        if isinstance(obj, float):
+            return float.__float__(obj)
+        if isinstance(obj, (list, tuple)):
+            return list(obj)
+        if isinstance(obj, dict):
+            return dict(obj)
+        return self.default(obj)
+
+    def dumpb(self, obj, **options):
+        return self.orjson.dumps(
+            obj, default=self.encode_default, option=self.option)
+
+    def dumps(self, obj, **options):
+        return self.dumpb(obj).decode("utf-8")
+
+    def loads(self, s):
+        return self.orjson.loads(s)
+
+
+class UJSONBackend(JSONBackend):
+    name = "ujson"
+
+    def __init__(self):
+        super(UJSONBackend, self).__init__()
+        import ujson
+        self.ujson = ujson
+
+    def dumps(self, obj, **options):
+        return self.ujson.dumps(
+            obj, ensure_ascii=options.get("ensure_ascii", True),
+            allow_nan=options.get("allow_nan", True),
+            escape_forward_slashes=False,
+            default=self.default)
+
+    def loads(self, s):
+        return self.ujson.loads(s)
+
+
+JSON_BACKENDS = {
+    "json": JSONBackend,
+    "orjson": OrJSONBackend,
+    "ujson": UJSONBackend,
+}
+_json_backend = None
+
+
+def set_json_backend(name=None):
+    """
+    设置json序列化后端，name为None时使用settings中的JSON_BACKEND，
+    auto会依次尝试orjson、ujson，未安装时使用标准库json。
+    :param name:
+    :return:
+    """
+    global _json_backend
+    if name is None:
+        from apistellar.bases.entities import settings
+        name = settings.get("JSON_BACKEND", "json")
+
+    if name == "auto":
+        for backend_cls in (OrJSONBackend, UJSONBackend):
+            try:
+                _json_backend = backend_cls()
+                return _json_backend
+            except ImportError:
+                pass
+        name = "json"
+    assert name in JSON_BACKENDS, f"Unknown json backend: {name}!"
+    _json_backend = JSON_BACKENDS[name]()
+    return _json_backend
+
+
+def get_json_backend():
+    return _json_backend or set_json_backend()
+
+
 class HookReturn(Exception):
     pass
 
@@ -158,6 +158,44 @@ class DriverMixin(object):
         """
         yield self_or_cls
 
+    @staticmethod
+    def get_changes(self_or_cls):
+        """
+        在get_store中获取实例自上次mark_clean以来发生变化的字段，
+        以便只更新这部分字段，如：
+        ```
+        update = dict()
+        changes = cls.get_changes(self_or_cls)
+        if changes:
+            update["$set"] = changes
+        deleted = cls.get_deleted(self_or_cls)
+        if deleted:
+            update["$unset"] = dict.fromkeys(deleted, "")
+        if update:
+            collection.update_one({"_id": self_or_cls.id}, update)
+            self_or_cls.mark_clean()
+        ```
+        :param self_or_cls:
+        :return: 类方法调用或实例不支持变更追踪时返回None
+        """
+        changes = getattr(self_or_cls, "changes", None)
+        # 类方法调用时，取到的是未绑定的函数
+        if getattr(changes, "__self__", None) is None:
+            return None
+        return changes()
+
+    @staticmethod
+    def get_deleted(self_or_cls):
+        """
+        在get_store中获取实例自上次mark_clean以来被删除的字段，用法同get_changes
+        :param self_or_cls:
+        :return: 类方法调用或实例不支持变更追踪时返回None
+        """
+        deleted_fields = getattr(self_or_cls, "deleted_fields", None)
+        if getattr(deleted_fields, "__self__", None) is None:
+            return None
+        return deleted_fields()
+
 
 class PersistentMeta(type):
     """
@@ -1,4 +1,3 @@
-import json
 import asyncio
 
 from abc import ABCMeta
@@ -7,17 +6,136 @@ from collections.abc import Mapping, MutableMapping
 from apistar.exceptions import ConfigurationError, ValidationError
 
 from . import validators
+from .compiler import compile_validator
+from .columns import TypeList
 from ..persistence import PersistentMeta
-from ..helper import TypeEncoder, add_success_callback
+from ..helper import TypeEncoder, add_success_callback, \
+    to_primitive, to_primitive_key
+
+
+class SlotDict(MutableMapping):
+    """
+    compact模式下Type的字段存储，字段的值保存在实例的slot中，
+    非字段的值保存在_extra中，对外的表现与_dict一致。
+    """
+    __slots__ = ("instance", "slots")
+
+    def __init__(self, instance):
+        self.instance = instance
+        self.slots = instance._slots
+
+    @staticmethod
+    def assign(instance, value):
+        """
+        替换实例的全部字段
+        :param instance:
+        :param value:
+        :return:
+        """
+        object.__setattr__(instance, "_extra", None)
+        slots = instance._slots
+        for slot in slots.values():
+            try:
+                slot.__delete__(instance)
+            except AttributeError:
+                pass
+
+        for key, val in value.items():
+            slot = slots.get(key)
+            if slot is not None:
+                slot.__set__(instance, val)
+            else:
+                if instance._extra is None:
+                    object.__setattr__(instance, "_extra", dict())
+                instance._extra[key] = val
+
+    @staticmethod
+    def lookup(instance, key):
+        """
+        直接读取实例的字段，不创建SlotDict，作为compact模式下Type._lookup的实现
+        :param instance:
+        :param key:
+        :return:
+        """
+        slot = instance._slots.get(key)
+        if slot is not None:
+            try:
+                return slot.__get__(instance)
+            except AttributeError:
+                raise KeyError(key)
+        extra = instance._extra
+        if extra is None:
+            raise KeyError(key)
+        return extra[key]
+
+    @staticmethod
+    def iter_items(instance):
+        """
+        直接遍历实例的字段，不创建SlotDict，作为compact模式下Type._items的实现
+        :param instance:
+        :return:
+        """
+        for key, slot in instance._slots.items():
+            try:
+                value = slot.__get__(instance)
+            except AttributeError:
+                continue
+            yield key, value
+        if instance._extra:
+            yield from instance._extra.items()
+
+    def __getitem__(self, key):
+        return self.lookup(self.instance, key)
+
+    def __setitem__(self, key, value):
+        slot = self.slots.get(key)
+        if slot is not None:
+            slot.__set__(self.instance, value)
+        else:
+            if self.instance._extra is None:
+                object.__setattr__(self.instance, "_extra", dict())
+            self.instance._extra[key] = value
+
+    def __delitem__(self, key):
+        slot = self.slots.get(key)
+        if slot is not None:
+            try:
+                slot.__delete__(self.instance)
+            except AttributeError:
+                raise KeyError(key)
+        else:
+            extra = self.instance._extra
+            if extra is None:
+                raise KeyError(key)
+            del extra[key]
+
+    def __contains__(self, key):
+        try:
+            self[key]
+        except KeyError:
+            return False
+        return True
+
+    def __iter__(self):
+        for key, _ in self.iter_items(self.instance):
+            yield key
+
+    def __len__(self):
+        return sum(1 for _ in self)
 
 
 class TypeMetaclass(ABCMeta):
+    slot_prefix = "_slot_"
+    # Type自身的方法名，不能用作字段名，子类仍可以重写这些方法
+    reserved_fields = ("changes", "mark_clean", "dirty_fields",
+                       "deleted_fields", "validate_many", "iter_validate")
 
     def __new__(mcs, name, bases, attrs):
         properties = []
         for key, value in list(attrs.items()):
             if key in ['keys', 'items', 'values', 'get', "clear",
-                       'validator', "setdefault", "pop", "popitem"]:
+                       'validator', "setdefault", "pop", "popitem"] or \
+                    key in mcs.reserved_fields and hasattr(value, 'validate'):
                 msg = (
                     'Cannot use reserved name "%s" on Type "%s", as it '
                     'clashes with the class interface.'
@@ -50,7 +168,29 @@ class TypeMetaclass(ABCMeta):
         ]
         attrs['_creation_counter'] = validators.Validator._creation_counter
         validators.Validator._creation_counter += 1
+
+        # compact模式下每个字段生成一个slot，实例不再拥有__dict__，
+        # 子类自动继承compact模式
+        compact = attrs.get("__compact__")
+        if compact is None:
+            compact = any(getattr(base, "__compact__", False) for base in bases)
+        if compact:
+            slots = [mcs.slot_prefix + key for key, _ in properties
+                     if not any(hasattr(base, mcs.slot_prefix + key)
+                                for base in bases)]
+            if not any(hasattr(base, "_extra") for base in bases):
+                slots.append("_extra")
+            attrs["__slots__"] = tuple(slots)
+            attrs["__compact__"] = True
+            attrs["_dict"] = property(SlotDict, SlotDict.assign)
+            # 热点路径直接读写slot，不必每次创建SlotDict
+            attrs["_lookup"] = SlotDict.lookup
+            attrs["_items"] = SlotDict.iter_items
+
         cls = super(TypeMetaclass, mcs).__new__(mcs, name, bases, attrs)
+        if compact:
+            cls._slots = dict((key, getattr(cls, mcs.slot_prefix + key))
+                              for key, _ in properties)
 
         cls.validator = validators.Object(
             def_name=name,
@@ -59,6 +199,7 @@ class TypeMetaclass(ABCMeta):
             additional_properties=None,
             model=cls
         )
+        validators.link(cls.validator)
 
         return cls
 
@@ -76,60 +217,215 @@ class TypeMetaclass(ABCMeta):
 
 
 class Type(MutableMapping, metaclass=TypeMetaclass):
+    """
+    设置__compact__ = True时，字段保存在slot中，用于大量实例常驻内存的场景，
+    比如列表接口一次返回大量数据
+    """
+    __slots__ = ("allow_coerce", "_dict", "formatted", "lazy",
+                 "_validated", "_snapshot", "__weakref__")
+    __compact__ = False
+    _slots = None
 
     def __init__(self, *args, **kwargs):
         definitions = None
         allow_coerce = False
         force_format = False
+        lazy = False
 
         if args:
             assert len(args) == 1
             definitions = kwargs.pop('definitions', definitions)
             allow_coerce = kwargs.pop('allow_coerce', allow_coerce)
             force_format = kwargs.pop('force_format', force_format)
+            lazy = kwargs.pop('lazy', lazy)
             assert not kwargs
 
-            if args[0] is None or isinstance(args[0], (str, bytes, bool, int, float, list)):
-                raise ValidationError('Must be an object.')
-            elif isinstance(args[0], Mapping):
-                # Instantiated with a dict.
-                value = args[0]
-            else:
-                # Instantiated with an object instance.
-                value = {}
-                for key, val in self.validator.properties.items():
-                    v = getattr(args[0], key, validators.NO_DEFAULT)
-                    if v != validators.NO_DEFAULT:
-                        value[key] = v
+            value = self._extract(args[0])
         else:
             # Instantiated with keyword arguments.
             value = kwargs
         object.__setattr__(self, 'allow_coerce', allow_coerce)
         object.__setattr__(self, '_dict', dict(value))
         object.__setattr__(self, 'formatted', False)
+        # lazy模式下，字段在第一次读取时校验，结果缓存在_validated中
+        object.__setattr__(self, 'lazy', lazy)
+        object.__setattr__(self, '_validated', dict() if lazy else None)
+        # 修改过的字段在第一次修改前的值，用于变更追踪，第一次修改时才创建
+        object.__setattr__(self, '_snapshot', None)
 
-        if force_format:
+        if force_format and not lazy:
             self.format(self.allow_coerce)
 
     def format(self, allow_coerce=False):
         object.__setattr__(self, 'allow_coerce', allow_coerce)
         if not self.formatted:
-            object.__setattr__(self, '_dict', self.validator.validate(
+            object.__setattr__(self, '_dict', self.get_validate()(
                 self._dict, allow_coerce=self.allow_coerce))
             object.__setattr__(self, 'formatted', True)
+            object.__setattr__(self, '_validated', None)
 
     @classmethod
-    def validate(cls, value, definitions=None, allow_coerce=False, force_format=True):
-        return cls(value,
-                   definitions=definitions,
-                   allow_coerce=allow_coerce,
-                   force_format=force_format)
+    def validate(cls, value, definitions=None, allow_coerce=False,
+                 force_format=True, lazy=False, max_errors=None):
+        """
+        :param max_errors: 最多收集的错误数量，包括嵌套的字段，
+        为1时遇到第一个错误就停止
+        """
+        with validators.error_budget(max_errors):
+            return cls(value,
+                       definitions=definitions,
+                       allow_coerce=allow_coerce,
+                       force_format=force_format,
+                       lazy=lazy)
+
+    def _lookup(self, key):
+        """
+        读取_dict中的值，compact模式下直接读取slot
+        :param key:
+        :return:
+        """
+        return self._dict[key]
+
+    def _items(self):
+        """
+        遍历_dict，compact模式下直接遍历slot
+        :return:
+        """
+        return self._dict.items()
+
+    def _lazy_validate(self, key):
+        """
+        lazy模式下校验单个字段，字段不存在且没有默认值时抛出KeyError
+        :param key:
+        :return:
+        """
+        try:
+            return self._validated[key]
+        except KeyError:
+            pass
+
+        validator = self.validator.properties[key]
+        try:
+            value = self._lookup(key)
+        except KeyError:
+            if not validator.has_default():
+                raise
+            value = None
+        try:
+            value = validator.validate(
+                value, definitions=self.validator.get_definitions(),
+                allow_coerce=self.allow_coerce)
+        except ValidationError as ex:
+            raise ValidationError({validator.title or key: ex.detail})
+        self._validated[key] = value
+        return value
+
+    @classmethod
+    def _extract(cls, obj):
+        if obj is None or isinstance(obj, (str, bytes, bool, int, float, list)):
+            raise ValidationError('Must be an object.')
+        elif isinstance(obj, Mapping):
+            # Instantiated with a dict.
+            return obj
+        else:
+            # Instantiated with an object instance.
+            value = {}
+            for key, val in cls.validator.properties.items():
+                v = getattr(obj, key, validators.NO_DEFAULT)
+                if v != validators.NO_DEFAULT:
+                    value[key] = v
+            return value
+
+    @classmethod
+    def iter_validate(cls, iterable, allow_coerce=False, fail_fast=False,
+                      max_errors=None):
+        """
+        逐条校验并逐个返回实例的生成器，iterable可以是生成器，内存占用与数据量无关。
+        校验函数及definitions在整批数据中共享。
+        遇到错误的数据后不再返回实例，继续校验后续数据以收集错误，结束时抛出。
+        :param iterable: 由Mapping或对象组成的可迭代对象
+        :param allow_coerce:
+        :param fail_fast: 为True时遇到第一条错误的数据就抛出
+        :param max_errors: 整批数据最多收集的错误数量
+        :return: 有错误时抛出ValidationError，
+        其detail为{位置: 错误信息}，与Array一致
+        """
+        # 重写了__init__的子类，仍通过__init__初始化
+        fast = cls.__init__ is Type.__init__
+        validate = cls.get_validate()
+        definitions = dict()
+        errors = dict()
+        # 生成器会在yield处挂起，错误预算只在每次校验期间生效，不影响调用方
+        budget = None if max_errors is None else \
+            validators.ErrorBudget(max_errors)
+
+        for pos, obj in enumerate(iterable):
+            if budget is not None:
+                previous = validators.set_error_budget(budget)
+            try:
+                if fast:
+                    instance = cls.__new__(cls)
+                    object.__setattr__(instance, 'allow_coerce', allow_coerce)
+                    object.__setattr__(instance, '_dict', validate(
+                        dict(cls._extract(obj)), definitions=definitions,
+                        allow_coerce=allow_coerce))
+                    object.__setattr__(instance, 'formatted', True)
+                    object.__setattr__(instance, 'lazy', False)
+                    object.__setattr__(instance, '_validated', None)
+                    object.__setattr__(instance, '_snapshot', None)
+                else:
+                    instance = cls(obj, allow_coerce=allow_coerce,
+                                   force_format=True)
+            except ValidationError as exc:
+                errors[pos] = exc.detail
+                current = budget or validators.get_error_budget()
+                if current is not None:
+                    current.spend(exc.detail)
+                if fail_fast or current is not None and current.exhausted:
+                    break
+                continue
+            finally:
+                if budget is not None:
+                    validators.set_error_budget(previous)
+            if not errors:
+                yield instance
+
+        if errors:
+            raise ValidationError(errors)
+
+    @classmethod
+    def validate_many(cls, iterable, allow_coerce=False, fail_fast=False,
+                      max_errors=None):
+        """
+        批量校验，返回实例列表，参数及错误信息与iter_validate一致
+        :param iterable: 由Mapping或对象组成的可迭代对象
+        :param allow_coerce:
+        :param fail_fast: 为True时遇到第一条错误的数据就抛出
+        :param max_errors: 整批数据最多收集的错误数量
+        :return: 校验后的实例列表
+        """
+        return list(cls.iter_validate(
+            iterable, allow_coerce, fail_fast, max_errors))
+
+    def __getstate__(self):
+        state = dict(getattr(self, "__dict__", ()))
+        state.update(allow_coerce=self.allow_coerce,
+                     _dict=dict(self._dict),
+                     formatted=self.formatted,
+                     lazy=self.lazy,
+                     _validated=self._validated,
+                     _snapshot=self._snapshot)
+        return state
+
+    def __setstate__(self, state):
+        for key, value in state.items():
+            object.__setattr__(self, key, value)
 
     def __repr__(self):
         if self.formatted:
             pair = self.items()
         else:
-            pair = self._dict.items()
+            pair = self._items()
         args = ['%s=%s' % (key, repr(value)) for key, value in pair]
         arg_string = ', '.join(args)
         return '<%s(%s)>' % (self.__class__.__name__, arg_string)
@@ -142,25 +438,36 @@ class Type(MutableMapping, metaclass=TypeMetaclass):
             value = validator.validate(value)
         except ValidationError as ex:
             raise ValidationError({validator.title or key: ex.detail})
+        self._track(key)
         self._dict[key] = value
+        if self._validated:
+            self._validated.pop(key, None)
 
     def __setitem__(self, key, value):
         if key not in self.validator.properties:
             raise KeyError('Invalid key "%s"' % key)
         value = self.validator.properties[key].validate(value)
+        self._track(key)
         self._dict[key] = value
+        if self._validated:
+            self._validated.pop(key, None)
 
     def __delattr__(self, item):
         self.__delitem__(item)
 
     def __delitem__(self, key):
+        self._track(key)
         del self._dict[key]
+        if self._validated:
+            self._validated.pop(key, None)
         if self.formatted:
             self._dict[key] = self.validator.properties[key].validate(None)
 
     def __getattr__(self, key):
         try:
-            return self._dict[key]
+            if self._validated is not None and key in self.validator.properties:
+                return self._lazy_validate(key)
+            return self._lookup(key)
         except (KeyError,):
             raise AttributeError('Invalid attribute "%s"' % key)
 
@@ -168,12 +475,18 @@ class Type(MutableMapping, metaclass=TypeMetaclass):
 
         validator = self.validator.properties.get(key)
         try:
-            value = self._dict[key]
+            if self._validated is not None and validator:
+                value = self._lazy_validate(key)
+            else:
+                value = self._lookup(key)
         except KeyError as e:
             try:
                 if validator:
-                    value = validator.get_default()
-                    self[key] = value
+                    # 填充默认值不算修改，不记录到changes中
+                    value = validator.validate(validator.get_default())
+                    self._dict[key] = value
+                    if self._validated:
+                        self._validated.pop(key, None)
                 else:
                     raise e
             except AssertionError:
@@ -206,8 +519,60 @@ class Type(MutableMapping, metaclass=TypeMetaclass):
             if k in self.validator.properties:
                 setattr(self, k, v)
             else:
+                self._track(k)
                 self._dict[k] = v
 
+    def _track(self, key):
+        """
+        记录字段第一次修改前的值
+        :param key:
+        :return:
+        """
+        if self._snapshot is None:
+            object.__setattr__(self, '_snapshot', dict())
+        if key not in self._snapshot:
+            self._snapshot[key] = self._dict.get(key, validators.NO_DEFAULT)
+
+    def dirty_fields(self):
+        """
+        自上次mark_clean以来被赋值或删除过的字段
+        :return:
+        """
+        return set(self._snapshot or ())
+
+    def deleted_fields(self):
+        """
+        与上次mark_clean时相比，被删除的字段，
+        用于持久化时删除对应的字段，如$unset或置为NULL
+        :return:
+        """
+        _dict = self._dict
+        return set(key for key, old in (self._snapshot or {}).items()
+                   if old is not validators.NO_DEFAULT and key not in _dict)
+
+    def changes(self):
+        """
+        与上次mark_clean时相比，值发生了变化的字段，被删除的字段见deleted_fields，
+        只追踪赋值操作，对可变对象的原地修改无法感知。
+        :return: {字段: 当前值}
+        """
+        changes = dict()
+        for key, old in (self._snapshot or {}).items():
+            try:
+                value = self._lookup(key)
+            except KeyError:
+                continue
+            if old is validators.NO_DEFAULT or value != old:
+                changes[key] = value
+        return changes
+
+    def mark_clean(self):
+        """
+        将当前状态作为新的快照，一般在持久化之后调用
+        :return:
+        """
+        object.__setattr__(self, '_snapshot', None)
+
     def reformat(self, field_name, value=None, allow_coerce=False):
         if value is None:
             value = self._dict.get(field_name)
@@ -220,10 +585,75 @@ class Type(MutableMapping, metaclass=TypeMetaclass):
         return val
 
     def to_dict(self):
-        return json.loads(json.dumps(self, cls=TypeEncoder))
+        """
+        转换成由基础类型组成的dict，与json序列化再反序列化的结果一致
+        :return:
+        """
+        if self._validated is not None:
+            self.format(self.allow_coerce)
+        formatters = self.get_formatters()
+        result = dict()
+        for key, value in self._items():
+            formatter = formatters.get(key)
+            if formatter:
+                value = formatter.to_string(value)
+            if key.__class__ is not str:
+                key = to_primitive_key(key)
+            result[key] = to_primitive(value)
+        return result
 
     to_json = to_dict
 
+    @classmethod
+    def get_validate(cls):
+        """
+        缓存编译后的校验函数，与cls.validator.validate等价
+        :return:
+        """
+        validate = cls.__dict__.get("_validate")
+        if validate is None:
+            validate = compile_validator(cls.validator)
+            cls._validate = validate
+        return validate
+
+    @classmethod
+    def get_formatters(cls):
+        """
+        缓存有formatter的字段，用于序列化
+        :return:
+        """
+        formatters = cls.__dict__.get("_formatters")
+        if formatters is None:
+            formatters = dict()
+            for key, validator in cls.validator.properties.items():
+                formatter = getattr(validator, "formatter", None)
+                if formatter:
+                    formatters[key] = formatter
+            cls._formatters = formatters
+        return formatters
+
+    def _serialize(self):
+        """
+        序列化的快速路径，直接读取_dict，与dict(self)结果一致，
+        lazy模式下先校验全部字段，不输出未校验的数据
+        :return:
+        """
+        if self._validated is not None:
+            self.format(self.allow_coerce)
+        formatters = self.get_formatters()
+        if not formatters:
+            return dict(self._items())
+
+        result = dict()
+        for key, value in self._items():
+            formatter = formatters.get(key)
+            result[key] = formatter.to_string(value) if formatter else value
+        return result
+
+
+TypeEncoder.register({Type: Type._serialize},
+                     primitives={Type._serialize: Type.to_dict})
+
 
 class PersistentTypeMeta(PersistentMeta, TypeMetaclass):
     pass
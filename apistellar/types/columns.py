@@ -0,0 +1,288 @@
+"""
+按列存储的Type集合，不允许为null的Integer/Number字段保存在array.array中，
+其它字段保存在list中，省去list[Type]每行一个dict、每个数值一个python对象的开销。
+"""
+import array
+
+from abc import ABCMeta
+from collections.abc import Sequence, MutableMapping
+from apistar.exceptions import ValidationError
+
+from . import validators
+from ..helper import TypeEncoder, get_json_backend, to_primitive
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# iter_json每次序列化的行数
+JSON_CHUNK_SIZE = 1000
+
+_SCALARS = frozenset((str, int, float, bool, type(None)))
+
+
+class TypeListMeta(ABCMeta):
+
+    def __getitem__(cls, model):
+        """
+        TypeList[Model]返回绑定了Model的TypeList子类，结果会被缓存
+        :param model:
+        :return:
+        """
+        assert cls.model is None, f"{cls.__name__} already bound to a model."
+        try:
+            return cls.classes[model]
+        except KeyError:
+            assert hasattr(model, "validator"), "TypeList only support Type."
+            klass = type(cls)(f"{cls.__name__}[{model.__name__}]", (cls,),
+                              {"model": model, "column_validators": None})
+            cls.classes[model] = klass
+            return klass
+
+
+class RowDict(MutableMapping):
+    """
+    行视图，读写直接作用在列上，作为行实例的_dict使用。
+    列是定长的，删除字段时只检查字段是否存在，由Type.__delitem__重新写入默认值
+    """
+    __slots__ = ("columns", "index")
+
+    def __init__(self, columns, index):
+        self.columns = columns
+        self.index = index
+
+    def __getitem__(self, key):
+        return self.columns[key][self.index]
+
+    def __setitem__(self, key, value):
+        self.columns[key][self.index] = value
+
+    def __delitem__(self, key):
+        if key not in self.columns:
+            raise KeyError(key)
+
+    def __contains__(self, key):
+        return key in self.columns
+
+    def __iter__(self):
+        return iter(self.columns)
+
+    def __len__(self):
+        return len(self.columns)
+
+
+class TypeList(Sequence, metaclass=TypeListMeta):
+    """
+    使用TypeList[Model].validate(rows)创建，按列批量校验，
+    迭代或下标访问时才生成Model实例，实例的读写直接作用在列上。
+    """
+    model = None
+    classes = dict()
+    column_validators = None
+    typecodes = {int: "q", float: "d"}
+
+    def __init__(self, columns, length):
+        assert self.model is not None, "Use TypeList[Model] instead."
+        self.columns = columns
+        self.length = length
+
+    @classmethod
+    def get_column_validators(cls):
+        """
+        每个字段对应一个Array校验器，数值字段输出array.array，
+        长度足够时会使用numpy批量校验
+        :return:
+        """
+        if cls.column_validators is None:
+            column_validators = dict()
+            for key, validator in cls.model.validator.properties.items():
+                if getattr(validator.__class__, "validate", None) is \
+                        validators.NumericType.validate and \
+                        not validator.allow_null:
+                    output = "array"
+                else:
+                    output = "list"
+                column_validators[key] = validators.Array(
+                    items=validator, output=output)
+            cls.column_validators = column_validators
+        return cls.column_validators
+
+    @classmethod
+    def validate(cls, iterable, allow_coerce=False, max_errors=None):
+        """
+        先逐行取出字段值组成列，再按列校验，
+        结果及错误信息与Model.validate_many一致。
+        :param iterable: 由Mapping或对象组成的可迭代对象
+        :param allow_coerce:
+        :param max_errors: 最多收集的错误数量
+        :return:
+        """
+        with validators.error_budget(max_errors) as budget:
+            return cls._validate(iterable, allow_coerce, budget)
+
+    @classmethod
+    def _validate(cls, iterable, allow_coerce, budget):
+        model_validator = cls.model.validator
+        properties = model_validator.properties
+        raw = dict((key, ([], [])) for key in properties)
+        errors = dict()
+        length = 0
+
+        for pos, obj in enumerate(iterable):
+            if budget is not None and budget.exhausted:
+                break
+            length += 1
+            try:
+                row = cls.model._extract(obj)
+            except ValidationError as exc:
+                errors[pos] = exc.detail
+                if budget is not None:
+                    budget.spend(exc.detail)
+                continue
+
+            for key, validator in properties.items():
+                if key in row:
+                    value = row[key]
+                elif validator.has_default():
+                    value = validator.get_default()
+                else:
+                    detail = model_validator.error_message(
+                        "required", field_name=key)
+                    errors.setdefault(pos, dict())[key] = detail
+                    if budget is not None and budget.spend(detail):
+                        break
+                    continue
+                positions, values = raw[key]
+                positions.append(pos)
+                values.append(value)
+
+        columns = dict()
+        for key, column_validator in cls.get_column_validators().items():
+            if budget is not None and budget.exhausted:
+                break
+            positions, values = raw.pop(key)
+            try:
+                columns[key] = column_validator.validate(
+                    values, allow_coerce=allow_coerce)
+            except ValidationError as exc:
+                for index, detail in exc.detail.items():
+                    errors.setdefault(positions[index], dict())[key] = detail
+
+        if errors:
+            raise ValidationError(dict(
+                (pos, model_validator.exchange_error(errors[pos])
+                 if isinstance(errors[pos], dict) else errors[pos])
+                for pos in sorted(errors)))
+        return cls(columns, length)
+
+    def row(self, index):
+        instance = self.model.__new__(self.model)
+        object.__setattr__(instance, 'allow_coerce', False)
+        # compact模式的Model，赋值_dict时会将数据复制到slot中
+        object.__setattr__(instance, '_dict', RowDict(self.columns, index))
+        object.__setattr__(instance, 'formatted', True)
+        object.__setattr__(instance, 'lazy', False)
+        object.__setattr__(instance, '_validated', None)
+        object.__setattr__(instance, '_snapshot', None)
+        return instance
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self.__class__(
+                dict((key, column[index])
+                     for key, column in self.columns.items()),
+                len(range(*index.indices(self.length))))
+        if index < 0:
+            index += self.length
+        if not 0 <= index < self.length:
+            raise IndexError("TypeList index out of range")
+        return self.row(index)
+
+    def __iter__(self):
+        for index in range(self.length):
+            yield self.row(index)
+
+    def __len__(self):
+        return self.length
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__}({self.length} rows)>"
+
+    def to_columns(self):
+        """
+        返回{字段: 列}，列本身不会被复制
+        :return:
+        """
+        return dict(self.columns)
+
+    def to_numpy(self, key=None):
+        """
+        array.array保存的数值列通过缓冲区协议零拷贝转换成ndarray，
+        其它列转换成dtype为object的ndarray。
+        :param key: 为None时返回{字段: ndarray}
+        :return:
+        """
+        assert np is not None, "to_numpy need numpy installed."
+        if key is None:
+            return dict((key, self.to_numpy(key)) for key in self.columns)
+
+        column = self.columns[key]
+        if isinstance(column, array.array):
+            return np.frombuffer(column, dtype=column.typecode)
+        result = np.empty(len(column), dtype=object)
+        result[:] = column
+        return result
+
+    def primitive_columns(self, start=0, stop=None):
+        """
+        按列转换成基础类型，与Type.to_dict的结果一致
+        :param start:
+        :param stop:
+        :return: [(字段, 值列表)]
+        """
+        formatters = self.model.get_formatters()
+        result = list()
+        for key, column in self.columns.items():
+            column = column[start:stop]
+            formatter = formatters.get(key)
+            if isinstance(column, array.array):
+                values = column.tolist()
+            elif formatter:
+                values = [to_primitive(formatter.to_string(value))
+                          for value in column]
+            else:
+                values = [value if value.__class__ in _SCALARS
+                          else to_primitive(value) for value in column]
+            result.append((key, values))
+        return result
+
+    def to_list(self, start=0, stop=None):
+        """
+        转换成由基础类型组成的list[dict]
+        :param start:
+        :param stop:
+        :return:
+        """
+        columns = self.primitive_columns(start, stop)
+        keys = [key for key, _ in columns]
+        return [dict(zip(keys, values))
+                for values in zip(*(values for _, values in columns))]
+
+    def iter_json(self, chunk_size=JSON_CHUNK_SIZE):
+        """
+        分块序列化成json数组，每次只转换chunk_size行
+        :param chunk_size:
+        :return: bytes的生成器
+        """
+        dumpb = get_json_backend().dumpb
+        yield b"["
+        for start in range(0, self.length, chunk_size):
+            chunk = dumpb(self.to_list(start, start + chunk_size))
+            # 去掉每一块的中括号，块之间用逗号连接
+            yield (b"," if start else b"") + chunk[1:-1]
+        yield b"]"
+
+
+TypeEncoder.register({TypeList: TypeList.to_list},
+                     primitives={TypeList.to_list: TypeList.to_list})
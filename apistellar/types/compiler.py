@@ -0,0 +1,284 @@
+"""
+将Object校验器编译成一个扁平的校验函数，只包含实际配置了的检查，
+省去每次校验时对未配置约束的判断、属性查找以及super().validate调用链。
+编译结果与原校验器的返回值及错误信息完全一致。
+"""
+from math import isfinite
+from collections.abc import Mapping
+from apistar.exceptions import ValidationError
+
+from . import validators
+
+
+class ValidatorCompiler(object):
+    func_def = """
+def validate(value, definitions=None, allow_coerce=False):
+{}
+"""
+
+    def __init__(self, validator):
+        self.validator = validator
+        self.namespace = dict(
+            __name__='entries_%s_validate' % (validator.def_name or "object"),
+            ValidationError=ValidationError,
+            Mapping=Mapping,
+            isfinite=isfinite,
+            self=validator)
+        self.lines = list()
+        self.counter = 0
+
+    def bind(self, prefix, obj):
+        """
+        将对象放入命名空间，返回其在生成代码中的名字
+        :param prefix:
+        :param obj:
+        :return:
+        """
+        self.counter += 1
+        name = f"{prefix}{self.counter}"
+        self.namespace[name] = obj
+        return name
+
+    def emit(self, indent, line):
+        self.lines.append("    " * indent + line)
+
+    def compile(self):
+        self.emit_object(self.validator)
+        func_def = self.func_def.format("\n".join(self.lines))
+        exec(func_def, self.namespace)
+        validate = self.namespace["validate"]
+        validate.__source__ = func_def
+        return validate
+
+    def emit_error(self, indent, key, detail):
+        """
+        记录错误，错误数量达到限制时立即抛出
+        """
+        self.emit(indent, f"errors[{key}] = {detail}")
+        self.emit(indent, f"self.spend_error(errors, errors[{key}])")
+
+    def emit_null(self, indent, v, validator, name):
+        """
+        Validator.validate中对默认值的处理及各子类对None的处理
+        """
+        if validator.has_default():
+            self.emit(indent, f"if {name} is None:")
+            self.emit(indent + 1, f"{name} = {v}.get_default()")
+        self.emit(indent, f"if {name} is None:")
+        if validator.allow_null:
+            self.emit(indent + 1, "pass" if name == "item" else "return None")
+        else:
+            self.emit(indent + 1, f"{v}.error('null')")
+
+    def emit_enum(self, indent, v, validator):
+        enum = self.bind("enum", validator.enum)
+        self.emit(indent, f"if item not in {enum}:")
+        if len(validator.enum) == 1:
+            self.emit(indent + 1, f"{v}.error('exact', exact={enum}[0])")
+        self.emit(indent + 1, f"{v}.error('enum')")
+
+    def emit_object(self, validator):
+        self.emit_null(1, "self", validator, "value")
+        self.emit(1, "if value.__class__ is not dict "
+                     "and not isinstance(value, Mapping):")
+        self.emit(2, "self.error('type')")
+
+        if not validator.linked:
+            self.emit(1, "if definitions is None:")
+            self.emit(2, "definitions = {}")
+            if validator.definitions:
+                self.emit(1, "definitions.update(self.definitions)")
+            if validator.def_name is not None:
+                self.emit(1, "definitions[self.def_name] = self.model")
+        self.emit(1, "validated = {}")
+        self.emit(1, "errors = {}")
+
+        self.emit(1, "for key in value.keys():")
+        self.emit(2, "if key.__class__ is not str and not isinstance(key, str):")
+        self.emit_error(3, "key", "self.error_message('invalid_key')")
+
+        if validator.min_properties is not None:
+            self.emit(1, f"if len(value) < {validator.min_properties!r}:")
+            self.emit(2, "self.error('%s')" % (
+                "empty" if validator.min_properties == 1 else "min_properties"))
+        if validator.max_properties is not None:
+            self.emit(1, f"if len(value) > {validator.max_properties!r}:")
+            self.emit(2, "self.error('max_properties')")
+
+        for key in validator.required:
+            self.emit(1, f"if {key!r} not in value:")
+            self.emit_error(2, repr(key), f"self.error_message("
+                                          f"'required', field_name={key!r})")
+
+        for key, child in validator.properties.items():
+            self.emit_property(key, child)
+
+        if validator.pattern_properties:
+            self.emit(1, "for key, child in "
+                         "self.match_pattern_properties(value.keys()):")
+            self.emit(2, "try:")
+            self.emit(3, "validated[key] = child.validate(value[key], "
+                         "definitions=definitions, allow_coerce=allow_coerce)")
+            self.emit(2, "except ValidationError as exc:")
+            self.emit_error(3, "key", "exc.detail")
+
+        additional = validator.additional_properties
+        if additional is not None:
+            self.emit(1, "for key in list(value.keys()):")
+            self.emit(2, "if key in validated or key in errors:")
+            self.emit(3, "continue")
+            if additional is True:
+                self.emit(2, "validated[key] = value[key]")
+            elif additional is False:
+                self.emit_error(2, "key", "self.error_message('invalid_property')")
+            else:
+                child = self.bind("v", additional)
+                self.emit(2, "try:")
+                self.emit(3, f"validated[key] = {child}.validate(value[key], "
+                             f"definitions=definitions, allow_coerce=allow_coerce)")
+                self.emit(2, "except ValidationError as exc:")
+                self.emit_error(3, "key", "exc.detail")
+
+        self.emit(1, "if errors:")
+        self.emit(2, "raise ValidationError(self.exchange_error(errors))")
+        self.emit(1, "return validated")
+
+    def emit_property(self, key, child):
+        v = self.bind("v", child)
+        if child.has_default():
+            default = self.bind("default", child.default)
+            self.emit(1, f"if {key!r} not in value:")
+            if callable(child.default):
+                self.emit(2, f"value[{key!r}] = {default}()")
+            else:
+                self.emit(2, f"value[{key!r}] = {default}")
+            indent = 1
+        else:
+            self.emit(1, f"if {key!r} in value:")
+            indent = 2
+
+        self.emit(indent, f"item = value[{key!r}]")
+        self.emit(indent, "try:")
+        validate = getattr(child.__class__, "validate", None)
+        if validate is validators.String.validate:
+            self.emit_string(indent + 1, v, child)
+        elif validate is validators.NumericType.validate:
+            self.emit_numeric(indent + 1, v, child)
+        elif validate is validators.Boolean.validate:
+            self.emit_boolean(indent + 1, v, child)
+        else:
+            if validate is validators.Object.validate:
+                v = self.bind("f", compile_validator(child))
+            else:
+                v = f"{v}.validate"
+            self.emit(indent + 1, f"item = {v}(item, definitions=definitions, "
+                                  f"allow_coerce=allow_coerce)")
+        self.emit(indent + 1, f"validated[{key!r}] = item")
+        self.emit(indent, "except ValidationError as exc:")
+        self.emit_error(indent + 1, repr(key), "exc.detail")
+
+    def emit_string(self, indent, v, validator):
+        self.emit_null(indent, v, validator, "item")
+        formatter = validator.formatter
+        if formatter:
+            f = self.bind("formatter", formatter)
+            self.emit(indent, f"elif {f}.is_native_type(item):")
+            self.emit(indent + 1, "pass")
+        self.emit(indent, "else:")
+        indent += 1
+        self.emit(indent, "if item.__class__ is not str "
+                          "and not isinstance(item, str):")
+        self.emit(indent + 1, f"{v}.error('type')")
+        if validator.enum is not None:
+            self.emit_enum(indent, v, validator)
+        if validator.min_length is not None:
+            self.emit(indent, f"if len(item) < {validator.min_length!r}:")
+            self.emit(indent + 1, "%s.error('%s')" % (
+                v, "blank" if validator.min_length == 1 else "min_length"))
+        if validator.max_length is not None:
+            self.emit(indent, f"if len(item) > {validator.max_length!r}:")
+            self.emit(indent + 1, f"{v}.error('max_length')")
+        if validator.regex is not None:
+            pattern = self.bind("pattern", validator.regex)
+            self.emit(indent, f"if not {pattern}.search(item):")
+            self.emit(indent + 1, f"{v}.error('pattern')")
+        if formatter:
+            self.emit(indent, "try:")
+            self.emit(indent + 1, f"item = {f}.validate(item)")
+            self.emit(indent, "except ValidationError:")
+            self.emit(indent + 1, f"{v}.error('format')")
+
+    def emit_numeric(self, indent, v, validator):
+        self.emit_null(indent, v, validator, "item")
+        numeric_type = self.bind("numeric_type", validator.numeric_type)
+        if validator.numeric_type is int:
+            self.emit(indent, "elif isinstance(item, float) "
+                              "and not item.is_integer():")
+            self.emit(indent + 1, f"{v}.error('integer')")
+        self.emit(indent, "elif not isinstance(item, (int, float)) "
+                          "and not allow_coerce:")
+        self.emit(indent + 1, f"{v}.error('type')")
+        self.emit(indent, "elif isinstance(item, float) and not isfinite(item):")
+        self.emit(indent + 1, f"{v}.error('finite')")
+        self.emit(indent, "if item is not None:")
+        indent += 1
+        self.emit(indent, "try:")
+        self.emit(indent + 1, f"item = {numeric_type}(item)")
+        self.emit(indent, "except (TypeError, ValueError):")
+        self.emit(indent + 1, f"{v}.error('type')")
+
+        if validator.enum is not None:
+            self.emit_enum(indent, v, validator)
+        if validator.minimum is not None:
+            minimum = self.bind("minimum", validator.minimum)
+            if validator.exclusive_minimum:
+                self.emit(indent, f"if item <= {minimum}:")
+                self.emit(indent + 1, f"{v}.error('exclusive_minimum')")
+            else:
+                self.emit(indent, f"if item < {minimum}:")
+                self.emit(indent + 1, f"{v}.error('minimum')")
+        if validator.maximum is not None:
+            maximum = self.bind("maximum", validator.maximum)
+            if validator.exclusive_maximum:
+                self.emit(indent, f"if item >= {maximum}:")
+                self.emit(indent + 1, f"{v}.error('exclusive_maximum')")
+            else:
+                self.emit(indent, f"if item > {maximum}:")
+                self.emit(indent + 1, f"{v}.error('maximum')")
+        if validator.multiple_of is not None:
+            multiple_of = self.bind("multiple_of", validator.multiple_of)
+            if isinstance(validator.multiple_of, float):
+                self.emit(indent, f"if not (item * (1 / {multiple_of}))"
+                                  f".is_integer():")
+            else:
+                self.emit(indent, f"if item % {multiple_of}:")
+            self.emit(indent + 1, f"{v}.error('multiple_of')")
+
+    def emit_boolean(self, indent, v, validator):
+        self.emit_null(indent, v, validator, "item")
+        values = dict(validator.values)
+        if validator.allow_null:
+            values.update(validator.null_values)
+        values = self.bind("values", values)
+        self.emit(indent, "elif item.__class__ is not bool:")
+        self.emit(indent + 1, "if allow_coerce:")
+        self.emit(indent + 2, "try:")
+        self.emit(indent + 3, f"item = {values}[item.lower() "
+                              f"if isinstance(item, str) else item]")
+        self.emit(indent + 2, "except KeyError:")
+        self.emit(indent + 3, f"{v}.error('type')")
+        self.emit(indent + 1, "else:")
+        self.emit(indent + 2, f"{v}.error('type')")
+
+
+def compile_validator(validator):
+    """
+    编译Object校验器，返回与validator.validate等价的函数，
+    对于重写了validate的Object子类，直接返回其validate方法。
+    :param validator:
+    :return:
+    """
+    if getattr(validator.__class__, "validate", None) \
+            is not validators.Object.validate:
+        return validator.validate
+    return ValidatorCompiler(validator).compile()
@@ -50,6 +50,7 @@ errors = {
         'max_items': 'Must have no more than {max_items} items.',
         'additional_items': 'May not contain additional items.',
         'unique_items': 'This item is not unique.',
+        'out_of_range': 'Must be within the 64-bit numeric range.',
     },
     "Union": {
         'null': 'Must not be null.',
@@ -1,11 +1,11 @@
 import re
 import uuid
 import datetime
+import functools
+import threading
 
 from apistar.exceptions import ValidationError
 
-from ..helper import ChildrenFactory
-
 
 DATE_REGEX = re.compile(
     r'(?P<year>\d{4})-(?P<month>\d{1,2})-(?P<day>\d{1,2})$'
@@ -23,11 +23,202 @@ DATETIME_REGEX = re.compile(
     r'(?P<tzinfo>Z|[+-]\d{2}(?::?\d{2})?)?$'
 )
 
+# datetime.fromisoformat在python3.7中加入
+HAS_FROMISOFORMAT = hasattr(datetime.datetime, "fromisoformat")
+
+# FormatDatetime每种格式缓存的解析结果数量
+FORMAT_DATETIME_CACHE_SIZE = 256
+
+# 可以编译成定长解析的指令，及其位数和缺省值(与strptime一致)
+FIXED_DIRECTIVES = (
+    ("%Y", 4, 1900), ("%m", 2, 1), ("%d", 2, 1),
+    ("%H", 2, 0), ("%M", 2, 0), ("%S", 2, 0),
+)
+
+_parsers = dict()
+
+
+def is_iso_date(value):
+    return len(value) == 10 and value[4] == "-" and value[7] == "-"
+
+
+def is_iso_time(value):
+    """
+    fromisoformat与TIME_REGEX结果一致的格式：HH:MM[:SS[.ffffff]]
+    :param value:
+    :return:
+    """
+    length = len(value)
+    return length in (5, 8, 15) and value[2] == ":" and (
+            length == 5 or value[5] == ":") and (
+            length != 15 or value[8] == ".")
+
+
+def parse_iso_datetime(value):
+    """
+    fromisoformat只处理与DATETIME_REGEX结果一致的格式：
+    YYYY-MM-DD[T ]HH:MM[:SS[.fff[fff]]][Z|+HH:MM]，其它格式返回None
+    :param value:
+    :return:
+    """
+    offset = ""
+    if value.endswith("Z"):
+        value, offset = value[:-1], "+00:00"
+    elif len(value) > 19 and value[-6] in "+-" and value[-3] == ":":
+        value, offset = value[:-6], value[-6:]
+
+    length = len(value)
+    if length in (16, 19, 23, 26) and is_iso_date(value[:10]) \
+            and value[10] in "T " and value[13] == ":" \
+            and (length == 16 or value[16] == ":") \
+            and (length <= 19 or value[19] == "."):
+        try:
+            return datetime.datetime.fromisoformat(value + offset)
+        except ValueError:
+            pass
+    return None
+
+
+def compile_format(date_format):
+    """
+    将只由%Y %m %d %H %M %S及分隔符组成的格式编译成定长的解析函数，
+    位数不足(如2018-1-1)或数值越界等无法匹配的值仍交给strptime处理，
+    保证结果及错误信息与strptime一致。
+    :param date_format:
+    :return: 带LRU缓存的解析函数
+    """
+    strptime = datetime.datetime.strptime
+    pattern = list()
+    directives = list()
+    for token in re.split("(%.)", date_format):
+        width = dict((d, w) for d, w, _ in FIXED_DIRECTIVES).get(token)
+        if width and token not in directives:
+            pattern.append(r"(\d{%d})" % width)
+            directives.append(token)
+        elif "%" in token:
+            pattern = None
+            break
+        else:
+            pattern.append(re.escape(token))
+
+    if pattern is None:
+        def parse(value):
+            return strptime(value, date_format)
+    else:
+        regex = re.compile("".join(pattern) + r"\Z", re.ASCII)
+        # 每个datetime参数在分组中的位置，不存在时使用缺省值
+        args = [(directives.index(d), None) if d in directives else (None, default)
+                for d, _, default in FIXED_DIRECTIVES]
+
+        def parse(value):
+            match = regex.match(value)
+            if match:
+                groups = match.groups()
+                try:
+                    return datetime.datetime(*[
+                        default if index is None else int(groups[index])
+                        for index, default in args])
+                except ValueError:
+                    pass
+            return strptime(value, date_format)
+
+    return functools.lru_cache(maxsize=FORMAT_DATETIME_CACHE_SIZE)(parse)
+
+
+def get_parser(date_format):
+    """
+    获取格式对应的解析函数，每种格式只编译一次
+    :param date_format:
+    :return:
+    """
+    parser = _parsers.get(date_format)
+    if parser is None:
+        parser = _parsers[date_format] = compile_format(date_format)
+    return parser
+
+
+class FormatRegistry(object):
+    """
+    格式注册表，BaseFormat的子类在定义时按name注册，
+    实例按(格式名, 参数)缓存，参数不同的validator使用不同的实例。
+    """
+
+    def __init__(self):
+        self.classes = dict()
+        self.instances = dict()
+        self.kwargs = dict()
+        self.lock = threading.Lock()
+
+    def register(self, name, format_cls):
+        with self.lock:
+            self.classes[name] = format_cls
+            for key in [key for key in self.instances if key[0] == name]:
+                del self.instances[key]
+
+    def install(self, **kwargs):
+        """
+        设置创建格式实例时的默认参数
+        :param kwargs:
+        :return:
+        """
+        with self.lock:
+            self.kwargs.update(kwargs)
+            self.instances.clear()
+
+    def create(self, name, **kwargs):
+        """
+        获取格式实例，参数相同时返回同一个实例
+        :param name: 格式名
+        :param kwargs: 创建实例的参数，会覆盖install的默认参数
+        :return:
+        """
+        key = (name, tuple(sorted(kwargs.items())))
+        instance = self.instances.get(key)
+        if instance is None:
+            with self.lock:
+                instance = self.instances.get(key)
+                if instance is None:
+                    instance = self.classes[name](**dict(self.kwargs, **kwargs))
+                    self.instances[key] = instance
+        return instance
+
+    def get(self, name, default=None, **kwargs):
+        try:
+            return self.create(name, **kwargs)
+        except KeyError:
+            return default
+
+    def __getitem__(self, name):
+        return self.create(name)
+
+    def __setitem__(self, name, value):
+        """
+        value为类时注册该类，否则作为该格式的实例
+        :param name:
+        :param value:
+        :return:
+        """
+        if isinstance(value, type):
+            self.register(name, value)
+        else:
+            self.register(name, value.__class__)
+            self.instances[(name, ())] = value
+
+    def __contains__(self, name):
+        return name in self.classes
+
+
+FORMATS = FormatRegistry()
+
 
 class BaseFormat(object):
     def __init__(self, **kwargs):
         self.name = ""
 
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        FORMATS.register(getattr(cls, "name", cls.__name__.lower()), cls)
+
     def is_native_type(self, value):
         raise NotImplementedError()
 
@@ -51,6 +242,12 @@ class DateFormat(BaseFormat):
         return isinstance(value, self.type)
 
     def validate(self, value):
+        if HAS_FROMISOFORMAT and is_iso_date(value):
+            try:
+                return datetime.date.fromisoformat(value)
+            except ValueError:
+                pass
+
         match = DATE_REGEX.match(value)
         if not match:
             raise ValidationError('Must be a valid date.')
@@ -74,6 +271,12 @@ class TimeFormat(BaseFormat):
         return isinstance(value, self.type)
 
     def validate(self, value):
+        if HAS_FROMISOFORMAT and is_iso_time(value):
+            try:
+                return datetime.time.fromisoformat(value)
+            except ValueError:
+                pass
+
         match = TIME_REGEX.match(value)
         if not match:
             raise ValidationError('Must be a valid time.')
@@ -99,6 +302,11 @@ class DateTimeFormat(BaseFormat):
         return isinstance(value, self.type)
 
     def validate(self, value):
+        if HAS_FROMISOFORMAT:
+            result = parse_iso_datetime(value)
+            if result is not None:
+                return result
+
         match = DATETIME_REGEX.match(value)
         if not match:
             raise ValidationError('Must be a valid datetime.')
@@ -136,15 +344,19 @@ class FormatDatetime(BaseFormat):
 
     def __init__(self, date_format="%Y-%m-%d %H:%M:%S", **kwargs):
         self.format = date_format
+        self.parser = get_parser(date_format)
 
     def register_format(self, date_format):
         self.format = date_format
+        self.parser = get_parser(date_format)
 
     def is_native_type(self, value):
         return isinstance(value, self.type)
 
     def validate(self, value):
         try:
+            if value.__class__ is str:
+                return self.parser(value)
             return datetime.datetime.strptime(value, self.format)
         except Exception as e:
             raise ValidationError(str(e))
@@ -209,8 +421,5 @@ class ExchangeFormat(BaseFormat):
     __repr__ = __str__
 
 
-FORMATS = ChildrenFactory(BaseFormat)
-
-
 def install(**kwargs):
     FORMATS.install(**kwargs)
\ No newline at end of file
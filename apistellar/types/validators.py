@@ -1,5 +1,9 @@
 import re
+import array
 import numbers
+import threading
+
+from contextlib import contextmanager
 
 from math import isfinite
 from collections.abc import Mapping
@@ -9,10 +13,92 @@ from toolkit import cache_property, cache_classproperty, load
 from .formats import FORMATS, ExchangeFormat
 
 from .error_desc import errors
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 NO_DEFAULT = object()
+# 数值数组长度不小于此值时，使用numpy批量校验
+BATCH_MIN_SIZE = 32
+# float64能精确表示的整数范围
+EXACT_INT = 2 ** 53
+# Object按key缓存pattern_properties匹配结果的数量上限
+PATTERN_MATCHES_CACHE_SIZE = 1024
+# 超过此长度的key不缓存匹配结果
+PATTERN_MATCHES_KEY_LENGTH = 64
 
 dict_type = dict
 
+_local = threading.local()
+
+
+class ErrorBudget(object):
+    """
+    一次校验中允许收集的错误数量，用完后各层Object/Array立即抛出已收集的错误，
+    嵌套容器的错误只在最内层计数
+    """
+
+    def __init__(self, max_errors):
+        assert isinstance(max_errors, int) and max_errors > 0, \
+            "max_errors must be a positive integer."
+        self.max_errors = max_errors
+        self.count = 0
+
+    @property
+    def remaining(self):
+        return max(self.max_errors - self.count, 0)
+
+    @property
+    def exhausted(self):
+        return self.count >= self.max_errors
+
+    def spend(self, detail):
+        """
+        记录一个错误
+        :param detail: 错误信息，dict为嵌套容器的错误，已在内层计数
+        :return: 是否已用完
+        """
+        if not isinstance(detail, dict):
+            self.count += 1
+        return self.count >= self.max_errors
+
+
+@contextmanager
+def error_budget(max_errors):
+    """
+    with块中的校验最多收集max_errors个错误，为1时遇到第一个错误就停止，
+    用于限制非法输入消耗的CPU及内存，max_errors为None时沿用外层的设置
+    :param max_errors:
+    :return:
+    """
+    previous = get_error_budget()
+    if max_errors is None:
+        yield previous
+        return
+
+    _local.budget = ErrorBudget(max_errors)
+    try:
+        yield _local.budget
+    finally:
+        _local.budget = previous
+
+
+def get_error_budget():
+    return getattr(_local, "budget", None)
+
+
+def set_error_budget(budget):
+    """
+    设置当前线程的ErrorBudget
+    :param budget:
+    :return: 之前的ErrorBudget
+    """
+    previous = getattr(_local, "budget", None)
+    _local.budget = budget
+    return previous
+
 
 class ErrorMessage(str):
     def __new__(cls, message, code):
@@ -23,6 +109,8 @@ class ErrorMessage(str):
 
 class Validator(object):
     _creation_counter = 0
+    # 子树中所有Ref都已在定义时解析，校验时不再需要definitions
+    linked = False
 
     @cache_classproperty
     def errors(cls):
@@ -98,10 +186,39 @@ class Validator(object):
         raise ValidationError(message)
 
     def error_message(self, code, **context):
-        message = self.errors[code].format(**self.__dict__, **context)
-        return ErrorMessage(message, code)
+        if context:
+            message = self.errors[code].format(**self.__dict__, **context)
+            return ErrorMessage(message, code)
+
+        # 不带context的错误信息只与校验器本身有关，每种只格式化一次，
+        # 大量元素校验失败时不必重复格式化
+        messages = self.__dict__.get("_messages")
+        if messages is None:
+            messages = self.__dict__["_messages"] = dict()
+        message = messages.get(code)
+        if message is None:
+            message = messages[code] = ErrorMessage(
+                self.errors[code].format(**self.__dict__), code)
+        return message
+
+    def exchange_error(self, error_dict):
+        return error_dict
+
+    def spend_error(self, errors, detail):
+        """
+        错误数量达到限制时，抛出已收集的错误，
+        只在出错时才读取ErrorBudget，校验成功时没有额外开销
+        :param errors: 已收集的错误
+        :param detail: 刚加入的错误
+        :return:
+        """
+        budget = get_error_budget()
+        if budget is not None and budget.spend(detail):
+            raise ValidationError(self.exchange_error(errors))
 
     def get_definitions(self, definitions=None):
+        if self.linked:
+            return definitions
         if self.definitions is None and self.def_name is None:
             return definitions
 
@@ -115,7 +232,7 @@ class Validator(object):
 
     def __or__(self, other):
         if isinstance(self, Union):
-            items = self.items
+            items = list(self.items)
         else:
             items = [self]
 
@@ -163,6 +280,8 @@ class String(Validator):
         self.max_length = max_length
         self.min_length = min_length
         self.pattern = pattern
+        # 构造时编译，避免每次校验都查找re模块的缓存
+        self.regex = None if pattern is None else re.compile(pattern)
         self.enum = enum
         self.format = format
         self.left = kwargs
@@ -201,8 +320,8 @@ class String(Validator):
             if len(value) > self.max_length:
                 self.error('max_length')
 
-        if self.pattern is not None:
-            if not re.search(self.pattern, value):
+        if self.regex is not None:
+            if not self.regex.search(value):
                 self.error('pattern')
 
         if self.formatter:
@@ -384,6 +503,63 @@ class Object(Validator):
         self.min_properties = min_properties
         self.max_properties = max_properties
         self.required = required
+        self.compile_pattern_properties()
+
+    def compile_pattern_properties(self):
+        """
+        编译pattern_properties中的正则，并尝试合并成一个用于预筛选的正则，
+        合并后的正则不匹配的key，一定不会匹配任何一个pattern。
+        :return:
+        """
+        self.pattern_regexes = [
+            (re.compile(pattern), child_schema) for pattern, child_schema
+            in self.pattern_properties.items()]
+        self.pattern_regex = None
+        # 含有分组或自定义flag的正则合并后，反向引用及flag的语义会改变
+        if len(self.pattern_regexes) > 1 and all(
+                not regex.groups and regex.flags == re.UNICODE
+                for regex, _ in self.pattern_regexes):
+            self.pattern_regex = re.compile("|".join(
+                "(?:%s)" % pattern for pattern in self.pattern_properties))
+        self.pattern_matches = dict()
+
+    def match_pattern_properties(self, keys):
+        """
+        找出keys中匹配pattern_properties的(key, child_schema)，
+        按单个key缓存其匹配的child_schema，过长的key不缓存。
+        :param keys:
+        :return:
+        """
+        cache = self.pattern_matches
+        matches = list()
+        for key in keys:
+            if not isinstance(key, str):
+                continue
+            schemas = cache.get(key)
+            if schemas is None:
+                schemas = self.match_pattern(key)
+                if len(key) <= PATTERN_MATCHES_KEY_LENGTH:
+                    if len(cache) >= PATTERN_MATCHES_CACHE_SIZE:
+                        cache.clear()
+                    cache[key] = schemas
+            for child_schema in schemas:
+                matches.append((key, child_schema))
+        return matches
+
+    def match_pattern(self, key):
+        """
+        找出key匹配的全部child_schema
+        :param key:
+        :return:
+        """
+        if self.pattern_regex is not None \
+                and not self.pattern_regex.search(key):
+            return ()
+        schemas = list()
+        for regex, child_schema in self.pattern_regexes:
+            if regex.search(key):
+                schemas.append(child_schema)
+        return tuple(schemas)
 
     def validate(self, value, definitions=None, allow_coerce=False):
         value = super().validate(value)
@@ -402,6 +578,7 @@ class Object(Validator):
         for key in value.keys():
             if not isinstance(key, str):
                 errors[key] = self.error_message('invalid_key')
+                self.spend_error(errors, errors[key])
 
         # Min/Max properties
         if self.min_properties is not None:
@@ -418,6 +595,7 @@ class Object(Validator):
         for key in self.required:
             if key not in value:
                 errors[key] = self.error_message('required', field_name=key)
+                self.spend_error(errors, errors[key])
 
         # Properties
         for key, child_schema in self.properties.items():
@@ -439,20 +617,20 @@ class Object(Validator):
                 )
             except ValidationError as exc:
                 errors[key] = exc.detail
+                self.spend_error(errors, exc.detail)
 
         # Pattern properties
         if self.pattern_properties:
-            for key in list(value.keys()):
-                for pattern, child_schema in self.pattern_properties.items():
-                    if isinstance(key, str) and re.search(pattern, key):
-                        item = value[key]
-                        try:
-                            validated[key] = child_schema.validate(
-                                item, definitions=definitions,
-                                allow_coerce=allow_coerce
-                            )
-                        except ValidationError as exc:
-                            errors[key] = exc.detail
+            for key, child_schema in self.match_pattern_properties(value.keys()):
+                item = value[key]
+                try:
+                    validated[key] = child_schema.validate(
+                        item, definitions=definitions,
+                        allow_coerce=allow_coerce
+                    )
+                except ValidationError as exc:
+                    errors[key] = exc.detail
+                    self.spend_error(errors, exc.detail)
 
         # Additional properties
         remaining = [
@@ -466,6 +644,7 @@ class Object(Validator):
         elif self.additional_properties is False:
             for key in remaining:
                 errors[key] = self.error_message('invalid_property')
+                self.spend_error(errors, errors[key])
         elif self.additional_properties is not None:
             child_schema = self.additional_properties
             for key in remaining:
@@ -478,6 +657,7 @@ class Object(Validator):
                     )
                 except ValidationError as exc:
                     errors[key] = exc.detail
+                    self.spend_error(errors, exc.detail)
 
         if errors:
             raise ValidationError(self.exchange_error(errors))
@@ -487,13 +667,21 @@ class Object(Validator):
     def exchange_error(self, error_dict):
         new_errors = dict()
         for key, value in error_dict.items():
-            new_errors[self.properties[key].title or key] = value
+            # pattern_properties等非properties中的key没有title
+            child_schema = self.properties.get(key)
+            new_errors[child_schema and child_schema.title or key] = value
         return new_errors
 
 
 class Array(Validator):
+    outputs = ("list", "array", "ndarray")
+
     def __init__(self, items=None, additional_items=None, min_items=None,
-                 max_items=None, unique_items=False, **kwargs):
+                 max_items=None, unique_items=False, output="list", **kwargs):
+        """
+        :param output: 返回值类型，list, array(array.array)或ndarray，
+        后两者只支持items为不允许为null的Integer或Number
+        """
         super().__init__(**kwargs)
 
         items = list(items) if isinstance(items, (list, tuple)) else items
@@ -512,6 +700,15 @@ class Array(Validator):
         self.min_items = min_items
         self.max_items = max_items
         self.unique_items = unique_items
+        self.batch = not unique_items and getattr(
+            items.__class__, "validate", None) is NumericType.validate
+
+        assert output in self.outputs, f"output must be one of {self.outputs}."
+        assert output == "list" or self.batch and not items.allow_null, \
+            "Only not null Integer or Number items support output array."
+        assert output != "ndarray" or np is not None, \
+            "Output ndarray need numpy installed."
+        self.output = output
 
     def validate(self, value, definitions=None, allow_coerce=False):
         value = super().validate(value)
@@ -536,6 +733,11 @@ class Array(Validator):
         elif isinstance(self.items, list) and (self.additional_items is False) and len(value) > len(self.items):
             self.error('additional_items')
 
+        if self.batch and np is not None and len(value) >= BATCH_MIN_SIZE:
+            result = self.validate_batch(value)
+            if result is not None:
+                return self.convert(result)
+
         # Ensure all items are of the right type.
         errors = {}
         if self.unique_items:
@@ -572,11 +774,121 @@ class Array(Validator):
                 validated.append(item)
             except ValidationError as exc:
                 errors[pos] = exc.detail
+                self.spend_error(errors, exc.detail)
 
         if errors:
             raise ValidationError(errors)
 
-        return validated
+        return self.convert(validated)
+
+    def validate_batch(self, value):
+        """
+        使用numpy批量校验全部由int(Number还可以是float)组成的数组，
+        校验顺序及错误信息与逐个调用items.validate一致，
+        无法保证一致的情况返回None，由调用方逐个校验。
+        :param value:
+        :return: ndarray
+        """
+        item = self.items
+        is_int = item.numeric_type is int
+        types = set(map(type, value))
+        if not types <= ({int} if is_int else {int, float}):
+            return None
+        if item.multiple_of == 0 or not all(
+                isinstance(bound, float) or abs(bound) <= EXACT_INT
+                for bound in [item.minimum, item.maximum] + (item.enum or [])
+                if bound is not None):
+            return None
+
+        try:
+            arr = np.array(value, dtype=np.int64 if is_int else np.float64)
+        except (OverflowError, ValueError, TypeError):
+            return None
+        # 超出float64精确范围的整数与float比较时，numpy与python结果不同
+        if is_int and len(arr) and (arr.min() < -EXACT_INT or arr.max() > EXACT_INT):
+            return None
+
+        checks = list()
+        if not is_int:
+            checks.append(("finite", ~np.isfinite(arr)))
+        if item.enum is not None:
+            code = "exact" if len(item.enum) == 1 else "enum"
+            checks.append((code, ~np.isin(arr, item.enum)))
+        if item.minimum is not None:
+            if item.exclusive_minimum:
+                checks.append(("exclusive_minimum", arr <= item.minimum))
+            else:
+                checks.append(("minimum", arr < item.minimum))
+        if item.maximum is not None:
+            if item.exclusive_maximum:
+                checks.append(("exclusive_maximum", arr >= item.maximum))
+            else:
+                checks.append(("maximum", arr > item.maximum))
+        if item.multiple_of is not None:
+            with np.errstate(invalid="ignore"):
+                if isinstance(item.multiple_of, float):
+                    remainder = np.mod(arr * (1 / item.multiple_of), 1)
+                else:
+                    remainder = np.mod(arr, item.multiple_of)
+                checks.append(("multiple_of", remainder != 0))
+
+        if checks:
+            # 每个位置只记录第一个未通过的检查
+            codes = np.zeros(len(arr), dtype=np.int8)
+            for index, (code, mask) in enumerate(checks, 1):
+                codes[(codes == 0) & mask] = index
+            positions = np.flatnonzero(codes)
+            budget = get_error_budget()
+            if budget is not None and len(positions):
+                positions = positions[:max(budget.remaining, 1)]
+                budget.count += len(positions)
+            if len(positions):
+                messages = [
+                    item.error_message(code, exact=item.enum[0])
+                    if code == "exact" else item.error_message(code)
+                    for code, _ in checks]
+                raise ValidationError({
+                    pos: messages[index - 1] for pos, index
+                    in zip(positions.tolist(), codes[positions].tolist())})
+        return arr
+
+    def convert(self, validated):
+        """
+        将校验结果转换成output指定的类型
+        :param validated: list或ndarray
+        :return:
+        """
+        if self.output == "list":
+            return validated.tolist() if np is not None and isinstance(
+                validated, np.ndarray) else validated
+
+        is_int = self.items.numeric_type is int
+        typecode = "q" if is_int else "d"
+        try:
+            if self.output == "ndarray":
+                return np.asarray(
+                    validated, dtype=np.int64 if is_int else np.float64)
+            if np is not None and isinstance(validated, np.ndarray):
+                return array.array(typecode, validated.tobytes())
+            return array.array(typecode, validated)
+        except OverflowError:
+            self.error_out_of_range(validated, typecode)
+
+    def error_out_of_range(self, validated, typecode):
+        """
+        找出无法放入int64或float64的元素并抛出
+        :param validated:
+        :param typecode:
+        :return:
+        """
+        errors = {}
+        for pos, item in enumerate(validated):
+            try:
+                array.array(typecode, [item])
+            except OverflowError:
+                errors[pos] = self.error_message("out_of_range")
+                self.spend_error(errors, errors[pos])
+        raise ValidationError(errors)
 
 
 class Date(String):
@@ -600,9 +912,8 @@ class FormatDateTime(String):
 
     @cache_property
     def formatter(self):
-        formatter = super(FormatDateTime, self).formatter
-        formatter.register_format(self.left["date_format"])
-        return formatter
+        # 每种格式使用各自的实例，不同格式的validator互不影响
+        return FORMATS.get(self.format, date_format=self.left["date_format"])
 
 
 class Any(Validator):
@@ -613,10 +924,106 @@ class Any(Validator):
 
 class Union(Validator):
 
-    def __init__(self, items, **kwargs):
+    def __init__(self, items, discriminator=None, **kwargs):
+        """
+        :param items: 候选的validator，也可以是Type子类
+        :param discriminator: 用来区分Object成员的字段名，该字段在各成员中
+        需要通过enum或default声明取值，校验时根据取值直接找到对应的成员
+        :param kwargs:
+        """
         super().__init__(**kwargs)
-        assert isinstance(items, list) and all(isinstance(i, Validator) for i in items)
+        assert isinstance(items, list)
+        # Type子类作为成员时，使用Proxy包装
+        items = [Proxy(item) if isinstance(item, type) and hasattr(item, "validator")
+                 else item for item in items]
+        assert all(isinstance(i, Validator) for i in items)
+        assert discriminator is None or isinstance(discriminator, str)
         self.items = list(items)
+        self.discriminator = discriminator
+        self.mapping = self.build_mapping(self.items, discriminator)
+        self.checks = [(item, self.get_check(item)) for item in self.items]
+
+    @staticmethod
+    def get_schema(item):
+        """
+        获取成员对应的Object校验器，无法确定时返回None
+        :param item:
+        :return:
+        """
+        if isinstance(item, Object):
+            return item
+        elif isinstance(item, Proxy):
+            if isinstance(item.type, Object):
+                return item.type
+            return getattr(item.type, "validator", None)
+
+    @classmethod
+    def build_mapping(cls, items, discriminator):
+        """
+        生成discriminator取值到成员的映射，取值相同时，排在前面的成员优先
+        :param items:
+        :param discriminator:
+        :return:
+        """
+        mapping = dict()
+        if discriminator is None:
+            return mapping
+
+        for item in items:
+            schema = cls.get_schema(item)
+            if schema is None:
+                continue
+            prop = schema.properties.get(discriminator)
+            if prop is None:
+                continue
+            if getattr(prop, "enum", None) is not None:
+                values = prop.enum
+            elif prop.has_default() and not callable(prop.default):
+                values = [prop.default]
+            else:
+                continue
+            for value in values:
+                mapping.setdefault(value, item)
+        return mapping
+
+    @classmethod
+    def get_check(cls, item):
+        """
+        生成成员的预检查方法，返回False时该成员一定校验失败，
+        用来跳过必然失败的成员，返回True时仍需完整校验。
+        :param item:
+        :return:
+        """
+        schema = cls.get_schema(item)
+        if schema is not None:
+            required = tuple(schema.required)
+            # Type可以通过对象实例初始化，非Mapping时只能排除基础类型
+            strict = isinstance(item, Object) or isinstance(item.type, Object)
+
+            def check(value, allow_coerce):
+                if isinstance(value, Mapping):
+                    return all(key in value for key in required)
+                return not strict and not isinstance(
+                    value, (str, bytes, bool, int, float, list))
+            return check
+
+        validate = getattr(item.__class__, "validate", None)
+        if validate is String.validate:
+            def check(value, allow_coerce):
+                return isinstance(value, str) or bool(
+                    item.formatter and item.formatter.is_native_type(value))
+        elif validate is NumericType.validate:
+            def check(value, allow_coerce):
+                return allow_coerce or isinstance(value, (int, float))
+        elif validate is Boolean.validate:
+            def check(value, allow_coerce):
+                return allow_coerce or isinstance(value, bool)
+        elif validate is Array.validate:
+            def check(value, allow_coerce):
+                return isinstance(value, list)
+        else:
+            check = None
+        return check
 
     def validate(self, value, definitions=None, allow_coerce=False):
         value = super().validate(value)
@@ -625,7 +1032,26 @@ class Union(Validator):
         elif value is None:
             self.error('null')
 
-        for item in self.items:
+        if self.mapping and isinstance(value, Mapping):
+            try:
+                item = self.mapping.get(value.get(self.discriminator))
+            except TypeError:
+                item = None
+            if item is not None:
+                # 直接使用对应的成员校验，错误信息也由该成员给出
+                return item.validate(
+                    value,
+                    definitions=definitions,
+                    allow_coerce=allow_coerce
+                )
+
+        # 失败成员记录的错误不应计入ErrorBudget，否则后面的成员校验成功时，
+        # 外层会提前用完错误数量
+        budget = get_error_budget()
+        count = budget and budget.count
+        for item, check in self.checks:
+            if check is not None and not check(value, allow_coerce):
+                continue
             try:
                 return item.validate(
                     value,
@@ -633,7 +1059,8 @@ class Union(Validator):
                     allow_coerce=allow_coerce
                 )
             except ValidationError:
-                pass
+                if budget is not None:
+                    budget.count = count
         self.error('union')
 
     def __lshift__(self, obj):
@@ -643,18 +1070,33 @@ class Union(Validator):
 
 
 class Ref(Validator):
+    # 定义时解析出的引用目标
+    target = None
+
     def __init__(self, ref, **kwargs):
         super().__init__(**kwargs)
         assert isinstance(ref, str)
         self.ref = ref
 
+    def link(self, child_schema):
+        """
+        定义时解析引用，校验时直接使用
+        :param child_schema:
+        :return:
+        """
+        kwargs = dict(self.__dict__)
+        kwargs.pop("target", None)
+        self.target = Proxy(child_schema, **kwargs)
+
     def validate(self, value, definitions=None, allow_coerce=False):
         #assert definitions is not None, 'Ref.validate() requires definitions'
         #assert self.ref in definitions, 'Ref "%s" not in definitions' % self.ref
 
-        child_schema = definitions[self.ref]
-        if not isinstance(child_schema, Proxy):
-            child_schema = definitions[self.ref] = Proxy(child_schema, **self.__dict__)
+        child_schema = self.target
+        if child_schema is None:
+            child_schema = definitions[self.ref]
+            if not isinstance(child_schema, Proxy):
+                child_schema = definitions[self.ref] = Proxy(child_schema, **self.__dict__)
 
         return child_schema.validate(
             value,
@@ -663,6 +1105,68 @@ class Ref(Validator):
         )
 
 
+def link(validator, definitions=None, visited=None, root=True):
+    """
+    按定义时的作用域解析validator中的Ref，可以处理循环引用。
+    子树中所有Ref都被解析的Object及Array会被标记为linked，
+    校验时不再为每个节点生成definitions。
+    :param validator:
+    :param definitions: 外层作用域中的definitions
+    :param visited: 已访问的validator，用来避免循环
+    :param root: 是否是Type的根Object
+    :return: 子树中的Ref是否全部被解析
+    """
+    if visited is None:
+        visited = dict()
+    if not isinstance(validator, Validator):
+        # Type子类，在其自身创建时链接，且校验时不使用外层的definitions
+        return True
+    if id(validator) in visited:
+        return True
+    visited[id(validator)] = validator
+
+    if isinstance(validator, Ref):
+        child_schema = (definitions or {}).get(validator.ref)
+        if child_schema is None:
+            return False
+        validator.link(child_schema)
+        return True
+
+    if isinstance(validator, Proxy):
+        return link(validator.type, definitions, visited, False)
+
+    if isinstance(validator, Union):
+        return all([link(item, definitions, visited, False)
+                    for item in validator.items])
+
+    if isinstance(validator, (Object, Array)):
+        scope = dict(definitions or {})
+        scope.update(validator.definitions)
+        if validator.def_name is not None:
+            scope[validator.def_name] = validator.model
+
+        children = list(validator.definitions.values())
+        if isinstance(validator, Object):
+            children.extend(validator.properties.values())
+            children.extend(validator.pattern_properties.values())
+            children.append(validator.additional_properties)
+        else:
+            if isinstance(validator.items, list):
+                children.extend(validator.items)
+            else:
+                children.append(validator.items)
+            children.append(validator.additional_items)
+
+        resolved = all([link(child, scope, visited, False)
+                        for child in children if hasattr(child, "validate")])
+        # 非根节点的definitions会被兄弟节点中的Ref使用，需要保留
+        if resolved and (root or not validator.def_name and not validator.definitions):
+            validator.linked = True
+        return resolved
+
+    return True
+
+
 class Uniqueness(object):
     """
     A set-like class that tests for uniqueness of primitive types.
@@ -1,9 +1,16 @@
 import os
+import json
+import asyncio
 import pytest
 
+from io import BytesIO
 from aiohttp import ClientSession
 from apistar.http import Response
-from apistellar import Controller, get, route, Application, show_routes
+from apistellar.app import FixedAsyncApp
+from apistellar.bases.fileio import AsyncFileReader, io_metrics
+from apistellar import Controller, get, route, Application, show_routes, \
+    FileResponse, StreamingResponse, JSONStreamResponse, NDJSONResponse, \
+    EventSourceResponse, ServerSentEvent, Channel, Type, TypeList, validators
 
 
 @route("/exception")
@@ -22,6 +29,17 @@ class ExceptionController(Controller):
             return Response("error", exc_info=sys.exc_info())
 
 
+channel = Channel()
+
+
+@route("/sse")
+class EventController(Controller):
+
+    @get("/")
+    def events(self):
+        return EventSourceResponse(channel.subscribe(), ping=0.05)
+
+
 @pytest.mark.asyncio
 class TestException(object):
 
@@ -115,3 +133,308 @@ def test_show_routes_with_include(capsys):
     assert captured.out.count(
         "view:haveroutes:hello                    GET     /                                        test_app:HaveRoutes#hello")
 
+
+
+class Sender(object):
+
+    def __init__(self):
+        self.messages = list()
+
+    async def __call__(self, message):
+        if isinstance(message.get("body"), memoryview):
+            message["body"] = bytes(message["body"])
+        self.messages.append(message)
+
+    @property
+    def body(self):
+        return b"".join(m.get("body", b"") for m in self.messages[1:])
+
+
+@pytest.mark.asyncio
+class TestFinalizeAsgi(object):
+
+    @pytest.fixture
+    def big_file(self, tmpdir):
+        path = tmpdir.join("big.bin")
+        path.write_binary(os.urandom(2500000))
+        return str(path)
+
+    async def test_mmap(self, big_file):
+        send = Sender()
+        resp = FileResponse(open(big_file, "rb"), headers={
+            "Content-Length": str(os.path.getsize(big_file))})
+        await FixedAsyncApp([]).finalize_asgi(resp, send, {})
+        assert send.messages[0]["type"] == "http.response.start"
+        assert len(send.messages) == 5
+        assert resp.headers["Accept-Ranges"] == "bytes"
+        assert send.body == open(big_file, "rb").read()
+
+    async def test_mmap_body_is_bytes(self, big_file):
+        messages = list()
+
+        async def send(message):
+            messages.append(message)
+
+        resp = FileResponse(open(big_file, "rb"), headers={
+            "Content-Length": str(os.path.getsize(big_file))})
+        await FixedAsyncApp([]).finalize_asgi(resp, send, {})
+        assert all(type(m["body"]) is bytes for m in messages[1:])
+
+    async def test_mmap_send_error(self, big_file):
+        async def send(message):
+            if message["type"] == "http.response.body":
+                raise ConnectionError()
+
+        resp = FileResponse(open(big_file, "rb"), headers={
+            "Content-Length": str(os.path.getsize(big_file))})
+        with pytest.raises(ConnectionError):
+            await FixedAsyncApp([]).finalize_asgi(resp, send, {})
+
+    async def test_mmap_with_offset(self, big_file):
+        send = Sender()
+        f = open(big_file, "rb")
+        f.seek(100)
+        resp = FileResponse(f, headers={"Content-Length": "1000"})
+        await FixedAsyncApp([]).finalize_asgi(resp, send, {})
+        assert send.body == open(big_file, "rb").read()[100: 1100]
+
+    async def test_regular_file_read_in_executor(self, big_file):
+        send = Sender()
+        completed = io_metrics()["completed"]
+        f = open(big_file, "rb")
+        f.seek(100)
+        resp = FileResponse(f, headers={"Content-Length": "1000"})
+        await FixedAsyncApp([]).finalize_asgi(resp, send, {})
+        assert isinstance(resp.content, AsyncFileReader)
+        assert io_metrics()["completed"] > completed
+        assert send.body == open(big_file, "rb").read()[100: 1100]
+
+    async def test_mmap_without_async_read(self, big_file, monkeypatch):
+        calls = list()
+        send_mmap = FixedAsyncApp.send_mmap
+
+        async def record(*args):
+            calls.append(args)
+            await send_mmap(*args)
+
+        monkeypatch.setattr(FixedAsyncApp, "send_mmap", staticmethod(record))
+        send = Sender()
+        resp = FileResponse(open(big_file, "rb"), async_read=False, headers={
+            "Content-Length": str(os.path.getsize(big_file))})
+        await FixedAsyncApp([]).finalize_asgi(resp, send, {})
+        assert len(calls) == 1
+        assert send.body == open(big_file, "rb").read()
+
+    async def test_zerocopy(self, big_file):
+        send = Sender()
+        f = open(big_file, "rb")
+        resp = FileResponse(f, headers={"Content-Length": "1000"})
+        await FixedAsyncApp([]).finalize_asgi(
+            resp, send, {"extensions": {"http.response.zerocopy": {}}})
+        assert send.messages[1] == {
+            "type": "http.response.zerocopy",
+            "file": f,
+            "offset": 0,
+            "count": 1000,
+            "more_body": True
+        }
+        assert send.messages[2] == {"type": "http.response.body", "body": b""}
+
+    async def test_without_zero_copy(self, big_file):
+        send = Sender()
+        resp = FileResponse(open(big_file, "rb"), zero_copy=False, headers={
+            "Content-Length": str(os.path.getsize(big_file))})
+        await FixedAsyncApp([]).finalize_asgi(
+            resp, send, {"extensions": {"http.response.zerocopy": {}}})
+        assert all(m["type"] != "http.response.zerocopy"
+                   for m in send.messages)
+        assert send.body == open(big_file, "rb").read()
+
+    async def test_not_regular_file(self):
+        send = Sender()
+        resp = FileResponse(BytesIO(b"abc"), filename="abc.txt",
+                            headers={"Content-Length": "3"})
+        await FixedAsyncApp([]).finalize_asgi(resp, send, {})
+        assert send.body == b"abc"
+
+    async def test_range(self, big_file):
+        send = Sender()
+        resp = FileResponse(
+            open(big_file, "rb"),
+            headers={"Content-Length": str(os.path.getsize(big_file))},
+            req_headers={"Range": "bytes=1000-1999"})
+        await FixedAsyncApp([]).finalize_asgi(resp, send, {})
+        assert send.messages[0]["status"] == 206
+        assert send.body == open(big_file, "rb").read()[1000: 2000]
+
+    async def test_multi_range_without_zero_copy(self, big_file):
+        send = Sender()
+        resp = FileResponse(
+            open(big_file, "rb"), zero_copy=False,
+            headers={"Content-Length": str(os.path.getsize(big_file))},
+            req_headers={"Range": "bytes=0-9, -10"})
+        await FixedAsyncApp([]).finalize_asgi(resp, send, {})
+        data = open(big_file, "rb").read()
+        assert send.messages[0]["status"] == 206
+        assert len(send.body) == int(resp.headers["Content-Length"])
+        assert data[:10] in send.body
+        assert data[-10:] in send.body
+
+
+class Row(Type):
+    id = validators.Integer()
+
+
+@pytest.mark.asyncio
+class TestStreamingResponse(object):
+
+    async def test_stream(self):
+        async def gen():
+            for i in range(10):
+                yield str(i)
+
+        send = Sender()
+        resp = StreamingResponse(gen(), media_type="text/plain", batch_size=4)
+        await FixedAsyncApp([]).finalize_asgi(resp, send, {})
+        assert "content-length" not in resp.headers
+        assert resp.headers["content-type"] == "text/plain; charset=utf-8"
+        assert [m["body"] for m in send.messages[1:]] == \
+               [b"0", b"1234", b"5678", b"9", b""]
+        assert all(m["more_body"] for m in send.messages[1:-1])
+        assert "more_body" not in send.messages[-1]
+
+    async def test_json(self):
+        async def gen():
+            for i in range(100):
+                yield Row(id=i)
+
+        send = Sender()
+        resp = JSONStreamResponse(gen(), batch_size=10)
+        await FixedAsyncApp([]).finalize_asgi(resp, send, {})
+        assert resp.headers["content-type"] == "application/json"
+        # 第一个元素单独发送
+        assert send.messages[1]["body"] == b'[{"id": 0}'
+        assert len(send.messages) == 14
+        assert json.loads(send.body) == [{"id": i} for i in range(100)]
+
+    async def test_json_empty(self):
+        send = Sender()
+        await FixedAsyncApp([]).finalize_asgi(JSONStreamResponse([]), send, {})
+        assert send.body == b"[]"
+
+    async def test_type_list(self):
+        rows = [{"id": i} for i in range(3000)]
+        send = Sender()
+        await FixedAsyncApp([]).finalize_asgi(
+            JSONStreamResponse(TypeList[Row].validate(rows)), send, {})
+        assert json.loads(send.body) == rows
+
+    async def test_ndjson(self):
+        send = Sender()
+        resp = NDJSONResponse(Row(id=i) for i in range(3))
+        await FixedAsyncApp([]).finalize_asgi(resp, send, {})
+        assert resp.headers["content-type"] == "application/x-ndjson"
+        assert send.body.count(b"\n") == 3
+        assert [json.loads(line) for line in send.body.splitlines()] == \
+            [{"id": i} for i in range(3)]
+
+    async def test_close(self):
+        closed = list()
+
+        async def gen():
+            try:
+                yield b"a"
+                yield b"b"
+            finally:
+                closed.append(True)
+
+        async def broken(message):
+            raise ConnectionError()
+
+        resp = StreamingResponse(gen())
+        with pytest.raises(ConnectionError):
+            await FixedAsyncApp([]).send_stream(resp, broken)
+        assert closed == [True]
+
+
+    async def test_close_iter_body(self):
+        closed = list()
+
+        class Response(StreamingResponse):
+            async def iter_body(self):
+                try:
+                    async for body in super().iter_body():
+                        yield body
+                finally:
+                    closed.append(True)
+
+        async def broken(message):
+            raise ConnectionError()
+
+        with pytest.raises(ConnectionError):
+            await FixedAsyncApp([]).send_stream(
+                Response([b"a", b"b"]), broken)
+        # send出错时，iter_body中的finally也会执行
+        assert closed == [True]
+
+@pytest.mark.asyncio
+class TestEventSourceResponse(object):
+
+    async def test_events(self):
+        async def gen():
+            yield ServerSentEvent({"a": 1}, event="update", id=1)
+            yield "line1\nline2"
+            await asyncio.sleep(0.05)
+            yield b"data: raw\n\n"
+
+        send = Sender()
+        resp = EventSourceResponse(gen(), ping=0.01, retry=1000)
+        await FixedAsyncApp([]).finalize_asgi(resp, send, {})
+        assert resp.headers["content-type"] == \
+               "text/event-stream; charset=utf-8"
+        assert resp.headers["cache-control"] == "no-cache"
+        body = send.body.decode()
+        assert body.startswith(
+            'retry: 1000\n\nid: 1\nevent: update\ndata: {"a": 1}\n\n'
+            'data: line1\ndata: line2\n\n')
+        assert ": ping\n\n" in body
+        assert body.endswith("data: raw\n\n")
+
+    async def test_disconnect(self):
+        messages = [{"type": "http.request", "body": b""}]
+
+        async def receive():
+            if messages:
+                return messages.pop()
+            await asyncio.sleep(0.05)
+            return {"type": "http.disconnect"}
+
+        subscription = channel.subscribe()
+        send = Sender()
+        resp = EventSourceResponse(subscription, ping=0.01)
+        await asyncio.wait_for(FixedAsyncApp([]).finalize_asgi(
+            resp, send, {}, receive), 1)
+        assert subscription.closed
+        assert subscription not in channel.subscribers
+        assert send.messages[-1] == {"type": "http.response.body", "body": b""}
+
+    async def test_server(self, server):
+        url = f"http://127.0.0.1:{server.port}/sse/"
+        async with ClientSession(conn_timeout=10, read_timeout=10) as session:
+            resp = await session.get(url)
+            assert resp.headers["Content-Type"].startswith("text/event-stream")
+            while not len(channel):
+                await asyncio.sleep(0.01)
+            assert channel.publish("hello", event="greet") == 1
+            lines = list()
+            while len(lines) < 3:
+                line = await resp.content.readline()
+                if not line.startswith(b":"):
+                    lines.append(line)
+            assert lines == [b"event: greet\n", b"data: hello\n", b"\n"]
+            resp.close()
+        for _ in range(100):
+            if not len(channel):
+                break
+            await asyncio.sleep(0.01)
+        assert not len(channel)
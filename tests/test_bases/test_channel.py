@@ -0,0 +1,78 @@
+import asyncio
+import pytest
+
+from apistellar import Channel, ServerSentEvent
+
+
+@pytest.mark.asyncio
+class TestChannel(object):
+
+    async def test_publish(self):
+        channel = Channel()
+        first, second = channel.subscribe(), channel.subscribe()
+        assert channel.publish({"a": 1}, event="e", id=2) == 2
+        message = await first.__anext__()
+        assert message == b'id: 2\nevent: e\ndata: {"a": 1}\n\n'
+        # 编码一次，所有订阅者共享
+        assert await second.__anext__() is message
+
+    async def test_wait(self):
+        channel = Channel()
+        subscription = channel.subscribe()
+        loop = asyncio.get_event_loop()
+        loop.call_later(0.01, channel.publish, "a")
+        assert await asyncio.wait_for(subscription.__anext__(), 1) == \
+            b"data: a\n\n"
+
+    async def test_drop(self):
+        channel = Channel(max_queue=2)
+        subscription = channel.subscribe()
+        for i in range(5):
+            channel.publish(i)
+        assert subscription.dropped == 3
+        assert [await subscription.__anext__() for _ in range(2)] == \
+               [b"data: 3\n\n", b"data: 4\n\n"]
+
+    async def test_disconnect(self):
+        channel = Channel()
+        slow = channel.subscribe(max_queue=1, policy="disconnect")
+        fast = channel.subscribe()
+        assert channel.publish(1) == 2
+        assert channel.publish(2) == 1
+        assert slow.closed
+        assert len(channel) == 1
+        # 强制断开时丢弃已过时的事件，立即结束
+        assert [message async for message in slow] == []
+        assert slow.dropped == 1
+        assert len(fast) == 2
+
+    async def test_close(self):
+        channel = Channel()
+        subscription = channel.subscribe()
+        task = asyncio.ensure_future(subscription.__anext__())
+        await asyncio.sleep(0)
+        channel.close()
+        with pytest.raises(StopAsyncIteration):
+            await task
+        assert not len(channel)
+
+
+def test_event_encode():
+    assert ServerSentEvent(comment="ping").encode() == b": ping\n\n"
+    assert ServerSentEvent("a\nb", retry=10).encode() == \
+        b"retry: 10\ndata: a\ndata: b\n\n"
+
+
+def test_event_injection():
+    assert ServerSentEvent("hi\revent: admin\r\nid: 9").encode() == \
+        b"data: hi\ndata: event: admin\ndata: id: 9\n\n"
+    assert ServerSentEvent(comment="a\rdata: b").encode() == \
+        b": a\n: data: b\n\n"
+    # 非换行的unicode分隔符属于数据本身
+    assert ServerSentEvent("a\u2028b").encode() == \
+        "data: a\u2028b\n\n".encode()
+    for kwargs in [dict(event="a\nid: 9"), dict(event="a\r"),
+                   dict(id="1\nevent: x"), dict(id="1\0"),
+                   dict(retry="1\nevent: x")]:
+        with pytest.raises(ValueError):
+            ServerSentEvent("hi", **kwargs)
@@ -3,7 +3,7 @@ import typing
 from apistar import http
 from aiohttp import ClientSession, FormData
 from apistellar import route, post, Controller, FormParam, Cookie, \
-    validators, Type, get, FileStream
+    validators, Type, get, FileStream, TypeStream
 
 
 class ModelTest(Type):
@@ -67,6 +67,10 @@ class ComponentsTestController(Controller):
                 buffer += chunk
         return {"data": buffer}
 
+    @post()
+    async def type_stream(self, items: TypeStream[ModelTest]):
+        return [item.b async for item in items]
+
 
 @pytest.mark.asyncio
 class TestComponent(object):
@@ -165,3 +169,21 @@ class TestComponent(object):
                 "Content-Type": "multipart/form-data"})
             assert (await resp.json())["message"] == 'Missing boundary'
 
+
+    async def test_type_stream(self, server):
+        url = f"http://127.0.0.1:{server.port}/component/type_stream"
+        async with ClientSession(conn_timeout=10, read_timeout=10) as session:
+            resp = await session.post(
+                url, json=[{"a": "1", "b": i} for i in range(100)])
+            assert await resp.json() == list(range(100))
+            resp = await session.post(url, json=[{"a": "1"}])
+            assert resp.status == 400
+            assert (await resp.json())["message"] == \
+                   {"0": {"b": 'The "b" field is required.'}}
+
+    async def test_body_too_large(self, server):
+        url = f"http://127.0.0.1:{server.port}/component/form_model"
+        async with ClientSession(conn_timeout=10, read_timeout=10) as session:
+            resp = await session.post(url, data="a=1&" * 1001, headers={
+                "Content-Type": "application/x-www-form-urlencoded"})
+            assert resp.status == 413
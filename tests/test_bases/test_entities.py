@@ -1,5 +1,7 @@
 import os
 import asyncio
+import json
+import hashlib
 import pytest
 import aiofiles
 import requests
@@ -7,8 +9,12 @@ import requests
 from toolkit import readexactly
 from aiohttp import ClientSession, FormData
 from apistellar.bases.response import FileResponse
-from apistellar.bases.entities import File, SettingsMixin, init_settings, coroutinelocal
-from apistellar import Controller, FileStream, post, get, route
+from apistar.exceptions import BadRequest
+from apistellar.bases.exceptions import PayloadTooLarge
+from apistellar.bases.entities import File, SettingsMixin, init_settings, \
+    coroutinelocal, receive_body
+from apistellar import Controller, FileStream, TypeStream, Type, \
+    validators, post, get, route
 
 
 init_settings("test_data.settings")
@@ -69,6 +75,18 @@ def filename(request):
     return request.param
 
 
+@pytest.fixture(scope="module", autouse=True)
+def clean_test_data(join_root_dir):
+    """
+    上传和下载测试会在test_data下生成upload_*和download_*文件，
+    模块结束后删除。
+    """
+    yield
+    for name in os.listdir(join_root_dir("test_data")):
+        if name.startswith(("upload_", "download_")):
+            os.remove(join_root_dir("test_data", name))
+
+
 class TestFileStream(object):
 
     @pytest.mark.asyncio
@@ -145,6 +163,215 @@ class TestFileStream(object):
                 assert await f.tell() == os.path.getsize(path)
 
 
+BOUNDARY = b"----boundary1234"
+
+
+def multipart(*parts):
+    body = b""
+    for name, filename, content in parts:
+        body += b"--" + BOUNDARY + b"\r\n"
+        body += f'Content-Disposition: form-data; name="{name}"'.encode()
+        if filename:
+            body += f'; filename="{filename}"'.encode()
+        body += b"\r\n\r\n" + content + b"\r\n"
+    return body + b"--" + BOUNDARY + b"--\r\n"
+
+
+def receive_chunks(body, chunk_size):
+    chunks = [body[i: i + chunk_size]
+              for i in range(0, len(body), chunk_size)]
+
+    async def receive():
+        chunk = chunks.pop(0)
+        return {"type": "http.request", "body": chunk,
+                "more_body": bool(chunks)}
+    return receive
+
+
+class TestMultipartParser(object):
+    parts = [("a", None, b"value"),
+             ("file", "a.bin", bytes(range(256)) * 40 + b"\r\n--"),
+             ("empty", "b.bin", b"")]
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("chunk_size", [1, 7, 17, 1024, 65536])
+    async def test_iter(self, chunk_size):
+        stream = FileStream(
+            receive_chunks(multipart(*self.parts), chunk_size), BOUNDARY)
+        result = []
+        async for file in stream:
+            content = b""
+            async for chunk in file:
+                assert isinstance(chunk, bytes)
+                content += chunk
+            assert file.tell() == len(content)
+            result.append((file.name, file.filename, content))
+        assert result == self.parts
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("size", [1, 100, 100000])
+    async def test_read(self, size):
+        stream = FileStream(
+            receive_chunks(multipart(*self.parts), 333), BOUNDARY)
+        result = []
+        async for file in stream:
+            content = b""
+            while True:
+                chunk = await file.read(size)
+                assert len(chunk) <= size
+                if not chunk:
+                    break
+                content += chunk
+            result.append(content)
+        assert result == [content for _, _, content in self.parts]
+
+    @pytest.mark.asyncio
+    async def test_save(self, tmpdir):
+        stream = FileStream(
+            receive_chunks(multipart(*self.parts), 333), BOUNDARY)
+        await stream.__anext__()
+        file = await stream.__anext__()
+        path = str(tmpdir.join(file.filename))
+        sink = await file.save(path)
+        content = self.parts[1][2]
+        with open(path, "rb") as f:
+            assert f.read() == content
+        assert sink.size == len(content)
+        assert sink.hexdigest("md5") == hashlib.md5(content).hexdigest()
+        assert sink.hexdigest("sha256") == hashlib.sha256(content).hexdigest()
+
+    @pytest.mark.asyncio
+    async def test_save_failed(self, tmpdir):
+        receive = receive_chunks(multipart(*self.parts), 333)
+
+        async def broken():
+            message = await receive()
+            if not message["more_body"]:
+                raise ConnectionError("Client disconnected.")
+            return message
+
+        stream = FileStream(broken, BOUNDARY)
+        await stream.__anext__()
+        file = await stream.__anext__()
+        path = tmpdir.join(file.filename)
+        with pytest.raises(ConnectionError):
+            await file.save(str(path))
+        # 不完整的文件被删除
+        assert not path.exists()
+
+    @pytest.mark.asyncio
+    async def test_spool(self):
+        stream = FileStream(
+            receive_chunks(multipart(*self.parts), 333), BOUNDARY)
+        await stream.__anext__()
+        file = await stream.__anext__()
+        sink = await file.spool(max_size=1000, hashes=("md5",))
+        assert sink.rolled
+        content = self.parts[1][2]
+        assert await (await sink.reader()).read() == content
+        assert sink.hexdigests() == {"md5": hashlib.md5(content).hexdigest()}
+        await sink.close()
+
+
+class Item(Type):
+    id = validators.Integer()
+    name = validators.String(default="")
+
+
+class TestReceiveBody(object):
+
+    @pytest.mark.asyncio
+    async def test_receive(self):
+        body = b"a=1&b=2" * 100
+        assert await receive_body(receive_chunks(body, 7), len(body)) == body
+
+    @pytest.mark.asyncio
+    async def test_max_size(self):
+        chunks = receive_chunks(b"a" * 1000, 100)
+        with pytest.raises(PayloadTooLarge):
+            await receive_body(chunks, 500)
+        # 超出限制后不再继续接收
+        assert len(await receive_body(chunks)) == 400
+
+    @pytest.mark.asyncio
+    async def test_max_fields(self):
+        with pytest.raises(PayloadTooLarge):
+            await receive_body(receive_chunks(b"a=1&" * 100, 10),
+                               max_fields=50)
+
+
+class TestTypeStream(object):
+    rows = [{"id": i, "name": "\u4e2d,]\\\"%d" % i} for i in range(200)]
+
+    async def collect(self, stream):
+        return [item async for item in stream]
+
+    def test_subscript(self):
+        assert TypeStream[Item] is TypeStream[Item]
+        assert TypeStream[Item].model is Item
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("chunk_size", [1, 3, 64, 100000])
+    async def test_iter(self, chunk_size):
+        body = json.dumps(self.rows, indent=1, ensure_ascii=False).encode()
+        items = await self.collect(
+            TypeStream[Item](receive_chunks(body, chunk_size)))
+        assert items == Item.validate_many(self.rows)
+        assert isinstance(items[0], Item)
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("body", [b"[]", b" [ ] ", b"[1, 22, 333]"])
+    async def test_raw(self, body):
+        for chunk_size in (1, 2, 100):
+            assert await self.collect(TypeStream(
+                receive_chunks(body, chunk_size))) == json.loads(body)
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("body", [
+        b"{}", b"[1,]", b"[1 2]", b"[1", b"[1]2", b"[tru]", b"[1,,2]"])
+    async def test_malformed(self, body):
+        with pytest.raises(BadRequest):
+            await self.collect(TypeStream(receive_chunks(body, 1)))
+
+    @pytest.mark.asyncio
+    async def test_invalid(self):
+        rows = self.rows + [{"id": "a"}]
+        body = json.dumps(rows).encode()
+        stream = TypeStream[Item](receive_chunks(body, 100))
+        with pytest.raises(BadRequest) as exc_info:
+            await self.collect(stream)
+        assert exc_info.value.detail == {200: {"id": "Must be a number."}}
+
+    @pytest.mark.asyncio
+    async def test_max_item_size(self):
+        body = json.dumps([{"id": 1, "name": "a" * 1000}]).encode()
+        with pytest.raises(PayloadTooLarge):
+            await self.collect(TypeStream[Item](
+                receive_chunks(body, 100), max_item_size=500))
+        body = json.dumps(self.rows).encode()
+        items = await self.collect(TypeStream[Item](
+            receive_chunks(body, 1000), max_item_size=100))
+        assert len(items) == 200
+
+
+    @pytest.mark.asyncio
+    async def test_large_item(self):
+        body = json.dumps([{"id": 1, "name": "a" * 100000}, 2]).encode()
+        stream = TypeStream(receive_chunks(body, 100))
+        sizes = []
+        parse = stream.parse
+
+        def counted():
+            sizes.append(len(stream.buffer))
+            return parse()
+
+        stream.parse = counted
+        items = await self.collect(stream)
+        assert items == json.loads(body)
+        # 数据块只在重试解析时合并，缓冲区成倍增长，复制的总量与数据量成线性关系
+        assert len(sizes) < 20
+        assert sum(sizes) < 3 * len(body)
+
 class TestLocal(object):
     @pytest.mark.asyncio
     async def test_local(self):
@@ -0,0 +1,130 @@
+import os
+import time
+import hashlib
+import asyncio
+import pytest
+
+from io import BytesIO
+from apistellar.bases.fileio import BoundedExecutor, AsyncFileReader, \
+    FileSink, SpooledFile, io_metrics
+
+
+@pytest.mark.asyncio
+class TestBoundedExecutor(object):
+
+    async def test_run(self):
+        executor = BoundedExecutor(2, 2)
+        assert await executor.run(sum, [1, 2, 3]) == 6
+        assert executor.metrics()["completed"] == 1
+
+    async def test_bounded(self):
+        executor = BoundedExecutor(1, 2)
+        max_queued = list()
+
+        def block():
+            max_queued.append(executor.metrics()["waiting"])
+            time.sleep(0.01)
+
+        await asyncio.gather(*[executor.run(block) for _ in range(5)])
+        metrics = executor.metrics()
+        assert max(max_queued) > 0
+        assert metrics["completed"] == 5
+        assert metrics["waiting"] == 0
+        assert metrics["queued"] == 0
+        assert metrics["running"] == 0
+
+    async def test_io_metrics(self):
+        assert set(io_metrics().keys()) == {
+            "max_workers", "max_pending", "waiting",
+            "queued", "running", "completed"}
+
+
+@pytest.mark.asyncio
+class TestAsyncFileReader(object):
+
+    async def test_read(self):
+        data = os.urandom(1000)
+        reader = AsyncFileReader(BytesIO(data))
+        chunks = list()
+        chunk = await reader.read(300)
+        while chunk:
+            chunks.append(chunk)
+            chunk = await reader.read(300)
+        assert [len(c) for c in chunks] == [300, 300, 300, 100]
+        assert b"".join(chunks) == data
+
+    async def test_read_different_size(self):
+        data = os.urandom(1000)
+        reader = AsyncFileReader(BytesIO(data))
+        assert await reader.read(100) == data[:100]
+        assert await reader.read(50) == data[100:150]
+        assert await reader.tell() == 150
+        assert await reader.read(200) == data[150:350]
+        assert await reader.read() == data[350:]
+
+    async def test_close_wait_read_ahead(self):
+        finished = list()
+
+        class SlowFile(BytesIO):
+            def read(self, size=-1):
+                time.sleep(0.05)
+                data = super(SlowFile, self).read(size)
+                finished.append(len(data))
+                return data
+
+        reader = AsyncFileReader(SlowFile(os.urandom(1000)))
+        assert len(await reader.read(100)) == 100
+        # 预读已经在线程中开始，close需要等待其结束
+        await reader.close()
+        assert finished == [100, 100]
+        assert reader.fileobj.closed
+
+    async def test_seek(self):
+        data = os.urandom(1000)
+        reader = AsyncFileReader(BytesIO(data))
+        assert await reader.read(100) == data[:100]
+        await reader.seek(500)
+        assert await reader.tell() == 500
+        assert await reader.read(100) == data[500:600]
+        await reader.seek(10, 1)
+        assert await reader.read(10) == data[610:620]
+
+
+@pytest.mark.asyncio
+class TestFileSink(object):
+
+    async def test_write(self):
+        chunks = [os.urandom(100) for _ in range(20)]
+        fileobj = BytesIO()
+        sink = FileSink(fileobj, executor=BoundedExecutor(2, 2))
+        for chunk in chunks:
+            await sink.write(chunk)
+        await sink.flush()
+        data = b"".join(chunks)
+        assert fileobj.getvalue() == data
+        assert sink.size == len(data)
+        assert sink.hexdigests() == {
+            "md5": hashlib.md5(data).hexdigest(),
+            "sha256": hashlib.sha256(data).hexdigest()}
+
+    async def test_spool_in_memory(self):
+        sink = SpooledFile(max_size=1000, hashes=("sha256", ))
+        await sink.write(b"a" * 500)
+        await sink.write(b"b" * 500)
+        assert not sink.rolled
+        assert isinstance(sink.fileobj, BytesIO)
+        assert await (await sink.reader()).read() == b"a" * 500 + b"b" * 500
+        await sink.close()
+
+    async def test_spool_rollover(self):
+        data = os.urandom(3000)
+        sink = SpooledFile(max_size=1000)
+        for i in range(0, len(data), 700):
+            await sink.write(data[i: i + 700])
+            assert sink.rolled == (i > 0)
+        assert not isinstance(sink.fileobj, BytesIO)
+        reader = await sink.reader()
+        assert await reader.read(100) == data[:100]
+        assert await reader.read() == data[100:]
+        assert sink.hexdigest("md5") == hashlib.md5(data).hexdigest()
+        await sink.close()
@@ -0,0 +1,122 @@
+import pytest
+
+from apistar import Route, http
+from apistar.exceptions import ConfigurationError, BadRequest
+from apistellar.app import FixedAsyncApp
+
+
+def handler(name: http.QueryParam, user_agent: http.Header=None):
+    return {"name": name, "agent": user_agent}
+
+
+async def receive():
+    return {"type": "http.request", "body": b"", "more_body": False}
+
+
+class Sender(object):
+
+    def __init__(self):
+        self.messages = list()
+
+    async def __call__(self, message):
+        self.messages.append(message)
+
+
+class TestPlanInjector(object):
+
+    def test_compile_plans(self):
+        app = FixedAsyncApp([Route("/", "GET", handler)])
+        route = app.router.name_lookups["handler"]
+        plan = app.plans[route]
+        assert plan[-1][0] == app.finalize_asgi
+        assert all(isinstance(kwargs, tuple) for _, _, kwargs, *_ in plan)
+
+    def test_compile_plans_with_class_hook(self):
+        class HookClass(object):
+            def on_request(self):
+                pass
+
+        app = FixedAsyncApp([Route("/", "GET", handler)],
+                            event_hooks=[HookClass])
+        assert not app.plans
+
+    @pytest.mark.asyncio
+    async def test_run_plan(self):
+        app = FixedAsyncApp([Route("/", "GET", handler)])
+        send = Sender()
+        scope = {
+            "type": "http",
+            "method": "GET",
+            "path": "/",
+            "query_string": b"name=abc",
+            "headers": [[b"user-agent", b"pytest"]],
+            "scheme": "http",
+            "server": ("127.0.0.1", 80),
+        }
+        await app(scope)(receive, send)
+        assert send.messages[0]["status"] == 200
+        assert send.messages[1]["body"] == b'{"name":"abc","agent":"pytest"}'
+
+    @pytest.mark.asyncio
+    async def test_run_without_plan(self):
+        app = FixedAsyncApp([Route("/", "GET", handler)])
+        app.plans.clear()
+        send = Sender()
+        scope = {
+            "type": "http",
+            "method": "GET",
+            "path": "/",
+            "query_string": b"name=abc",
+            "headers": [],
+            "scheme": "http",
+            "server": ("127.0.0.1", 80),
+        }
+        await app(scope)(receive, send)
+        assert send.messages[1]["body"] == b'{"name":"abc","agent":null}'
+
+    @pytest.mark.asyncio
+    async def test_not_found(self):
+        app = FixedAsyncApp([Route("/", "GET", handler)])
+        send = Sender()
+        scope = {
+            "type": "http",
+            "method": "GET",
+            "path": "/not/found",
+            "query_string": b"",
+            "headers": [],
+            "scheme": "http",
+            "server": ("127.0.0.1", 80),
+        }
+        await app(scope)(receive, send)
+        assert send.messages[0]["status"] == 404
+
+    @pytest.mark.asyncio
+    async def test_exception_in_plan(self):
+        def bad_request(name: http.QueryParam):
+            raise BadRequest(f"{name} is invalid.")
+
+        app = FixedAsyncApp([Route("/", "GET", bad_request)])
+        send = Sender()
+        scope = {
+            "type": "http",
+            "method": "GET",
+            "path": "/",
+            "query_string": b"name=abc",
+            "headers": [],
+            "scheme": "http",
+            "server": ("127.0.0.1", 80),
+        }
+        await app(scope)(receive, send)
+        assert send.messages[0]["status"] == 400
+        assert b"abc is invalid." in send.messages[1]["body"]
+
+    def test_run_sync(self):
+        app = FixedAsyncApp([Route("/", "GET", handler)])
+
+        def double(name: http.QueryParam):
+            return name * 2
+
+        state = {"scope": {"query_string": b"name=ab"}}
+        assert app.injector.run([double], state) == "abab"
+        with pytest.raises(ConfigurationError):
+            app.injector.run([app.finalize_asgi], state)
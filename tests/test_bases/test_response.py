@@ -1,5 +1,7 @@
 import pytest
 
+from io import BytesIO
+
 from apistellar import FileResponse
 
 
@@ -77,3 +79,110 @@ class TestFileResposne(object):
                             req_headers={"If-Modified-Since":
                                              "Fri, 08 Feb 2019 22:56:53 GMT"})
         assert resp.status_code == 304
+
+    def test_range(self):
+        resp = FileResponse(b"0123456789", filename="ddd.txt",
+                            req_headers={"Range": "bytes=2-5"})
+        assert resp.status_code == 206
+        assert resp.content == b"2345"
+        assert resp.headers["content-length"] == "4"
+        assert resp.headers["content-range"] == "bytes 2-5/10"
+
+    def test_suffix_range(self):
+        resp = FileResponse(b"0123456789", filename="ddd.txt",
+                            req_headers={"Range": "bytes=-3"})
+        assert resp.status_code == 206
+        assert resp.content == b"789"
+
+    def test_multi_range(self):
+        resp = FileResponse(b"0123456789", filename="ddd.txt",
+                            req_headers={"Range": "bytes=0-1,8-"})
+        assert resp.status_code == 206
+        content_type = resp.headers["content-type"]
+        assert content_type.startswith("multipart/byteranges; boundary=")
+        boundary = content_type.split("=")[1]
+        assert resp.content == (
+            f"--{boundary}\r\n"
+            f"Content-Type: text/plain; charset=utf-8\r\n"
+            f"Content-Range: bytes 0-1/10\r\n\r\n01\r\n"
+            f"--{boundary}\r\n"
+            f"Content-Type: text/plain; charset=utf-8\r\n"
+            f"Content-Range: bytes 8-9/10\r\n\r\n89\r\n"
+            f"--{boundary}--\r\n").encode()
+        assert resp.headers["content-length"] == str(len(resp.content))
+
+    def test_range_not_satisfiable(self):
+        resp = FileResponse(b"0123456789", filename="ddd.txt",
+                            req_headers={"Range": "bytes=20-"})
+        assert resp.status_code == 416
+        assert resp.headers["content-range"] == "bytes */10"
+
+    def test_suffix_range_empty_file(self):
+        resp = FileResponse(b"", filename="ddd.txt",
+                            req_headers={"Range": "bytes=-3"})
+        assert resp.status_code == 416
+        assert resp.headers["content-range"] == "bytes */0"
+
+    def test_range_not_satisfiable_close_file(self):
+        f = BytesIO(b"0123456789")
+        resp = FileResponse(f, filename="ddd.txt",
+                            headers={"Content-Length": "10"},
+                            req_headers={"Range": "bytes=20-"})
+        assert resp.status_code == 416
+        assert f.closed
+
+    def test_too_many_ranges(self):
+        resp = FileResponse(b"0123456789", filename="ddd.txt",
+                            req_headers={"Range": "bytes=" + ",".join(
+                                ["0-"] * 100)})
+        assert resp.status_code == 200
+        assert resp.content == b"0123456789"
+
+    def test_overlapping_ranges(self):
+        resp = FileResponse(b"0123456789", filename="ddd.txt",
+                            req_headers={"Range": "bytes=0-,0-,0-"})
+        assert resp.status_code == 206
+        assert resp.content == b"0123456789"
+
+    def test_range_with_position(self):
+        f = BytesIO(b"xx0123456789")
+        f.seek(2)
+        resp = FileResponse(f, filename="ddd.txt",
+                            headers={"Content-Length": "10"},
+                            req_headers={"Range": "bytes=2-5"})
+        assert resp.headers["content-range"] == "bytes 2-5/10"
+        assert resp.ranges == [(b"", 4, 4)]
+
+    def test_invalid_range(self):
+        resp = FileResponse(b"0123456789", filename="ddd.txt",
+                            req_headers={"Range": "bytes=5-2"})
+        assert resp.status_code == 200
+        assert resp.content == b"0123456789"
+
+    def test_if_range_etag(self):
+        resp = FileResponse(b"0123456789", filename="ddd.txt")
+        etag = resp.headers["etag"]
+        resp = FileResponse(b"0123456789", filename="ddd.txt",
+                            headers={"ETag": etag},
+                            req_headers={"Range": "bytes=2-5",
+                                         "If-Range": etag})
+        assert resp.status_code == 206
+        resp = FileResponse(b"0123456789", filename="ddd.txt",
+                            headers={"ETag": etag},
+                            req_headers={"Range": "bytes=2-5",
+                                         "If-Range": '"other"'})
+        assert resp.status_code == 200
+        assert resp.content == b"0123456789"
+
+    def test_if_range_date(self):
+        last_modified = "Fri, 08 Feb 2019 22:56:51 GMT"
+        resp = FileResponse(b"0123456789", filename="ddd.txt",
+                            headers={"Last-Modified": last_modified},
+                            req_headers={"Range": "bytes=2-5",
+                                         "If-Range": last_modified})
+        assert resp.status_code == 206
+        resp = FileResponse(b"0123456789", filename="ddd.txt",
+                            headers={"Last-Modified": last_modified},
+                            req_headers={"Range": "bytes=2-5",
+                                         "If-Range": "Fri, 08 Feb 2019 22:56:53 GMT"})
+        assert resp.status_code == 200
@@ -0,0 +1,157 @@
+import enum
+import json
+import pytest
+
+from datetime import datetime
+from apistar.http import JSONResponse
+
+import apistellar.app
+
+from apistellar.types import Type, validators
+from apistellar.helper import set_json_backend, get_json_backend, \
+    parse_range_header, to_primitive, TypeEncoder
+
+
+class Article(Type):
+    title = validators.String()
+    created = validators.FormatDateTime()
+
+
+@pytest.fixture(params=["json", "orjson", "ujson"])
+def backend(request):
+    pytest.importorskip(request.param)
+    yield set_json_backend(request.param)
+    set_json_backend("json")
+
+
+class TestJSONBackend(object):
+
+    def test_dumps_type(self, backend):
+        article = Article(title="标题", created=datetime(2018, 10, 20, 11, 11, 11))
+        assert backend.loads(backend.dumps({"article": article})) == {
+            "article": {"title": "标题", "created": "2018-10-20 11:11:11"}}
+
+    def test_json_response(self, backend):
+        article = Article(title="标题", created=datetime(2018, 10, 20, 11, 11, 11))
+        resp = JSONResponse([article])
+        assert backend.loads(resp.content) == [
+            {"title": "标题", "created": "2018-10-20 11:11:11"}]
+
+    def test_to_dict(self, backend):
+        article = Article(title="a", created=datetime(2018, 10, 20, 11, 11, 11))
+        assert article.to_dict() == {
+            "title": "a", "created": "2018-10-20 11:11:11"}
+
+    def test_same_as_json(self, backend):
+        class Level(enum.IntEnum):
+            low = 1
+
+        class Name(str):
+            pass
+
+        class Info(dict):
+            pass
+
+        TypeEncoder.register({datetime: lambda obj: obj.strftime("%Y/%m/%d")})
+        try:
+            data = {"created": datetime(2020, 1, 2, 3, 4),
+                    "level": Level.low,
+                    "name": Name("a/b"),
+                    "info": Info(a=1),
+                    "items": (1, 2)}
+            expected = json.loads(json.dumps(data, cls=TypeEncoder))
+            assert expected["created"] == "2020/01/02"
+            assert json.loads(backend.dumps(data)) == expected
+            assert json.loads(backend.dumpb(data)) == expected
+        finally:
+            del TypeEncoder.options[datetime]
+            TypeEncoder.register({})
+
+    def test_not_serializable(self, backend):
+        with pytest.raises(TypeError):
+            backend.dumps(object())
+
+    def test_default_backend(self):
+        assert get_json_backend().name == "json"
+        assert JSONResponse({"a": 1}).content == b'{"a":1}'
+
+    def test_unknown_backend(self):
+        with pytest.raises(AssertionError):
+            set_json_backend("unknown")
+        set_json_backend("json")
+
+    def test_auto_backend(self):
+        assert set_json_backend("auto").name in ("json", "orjson", "ujson")
+        set_json_backend("json")
+
+
+def test_parse_range_header():
+    assert parse_range_header("bytes=0-499", 1000) == [(0, 499)]
+    # 重叠及相邻的区间会被合并
+    assert parse_range_header("bytes=-100, 900-", 1000) == [(900, 999)]
+    assert parse_range_header("bytes=500-599, 0-9, 10-19, 550-", 1000) == [
+        (0, 19), (500, 999)]
+    assert parse_range_header("bytes=" + ",".join(["0-"] * 17), 1000) is None
+    assert parse_range_header("bytes=0-5000", 1000) == [(0, 999)]
+    assert parse_range_header("bytes=2000-", 1000) == []
+    # 空文件无法满足后缀区间
+    assert parse_range_header("bytes=-100", 0) == []
+    assert parse_range_header("bytes=5-3", 1000) is None
+    assert parse_range_header("items=0-1", 1000) is None
+
+
+class Node(Type):
+    name = validators.String()
+    created = validators.FormatDateTime()
+    children = validators.Array(items=validators.Ref("Node"), default=list)
+
+
+def build_node(depth):
+    return Node(name="node%s" % depth,
+                created=datetime(2018, 10, 20, 11, 11, depth),
+                children=[build_node(depth - 1) for _ in range(2)]
+                if depth > 1 else [])
+
+
+class TestToPrimitive(object):
+
+    @pytest.mark.parametrize("depth", [3, 4, 5])
+    def test_same_as_round_trip(self, depth):
+        node = build_node(depth)
+        assert to_primitive(node) == json.loads(json.dumps(node, cls=TypeEncoder))
+        assert node.to_dict() == to_primitive(node)
+
+    def test_keys(self):
+        data = {1: 1, 1.5: 2, True: 3, None: 4, "a": (1, 2)}
+        assert to_primitive(data) == json.loads(json.dumps(data))
+
+    def test_subclass(self):
+        class Color(str, enum.Enum):
+            RED = "red"
+
+        class Level(int, enum.Enum):
+            LOW = 1
+
+        class Ratio(float, enum.Enum):
+            HALF = 0.5
+
+        data = {Color.RED: [Color.RED, Level.LOW, Ratio.HALF],
+                Level.LOW: Color.RED, Ratio.HALF: Level.LOW}
+        expected = json.loads(json.dumps(data, cls=TypeEncoder))
+        assert expected == {"red": ["red", 1, 0.5], "1": "red", "0.5": 1}
+        assert to_primitive(data) == expected
+
+    def test_register(self):
+        class Point(object):
+            def __init__(self, x, y):
+                self.x, self.y = x, y
+
+        TypeEncoder.register({Point: lambda obj: (obj.x, obj.y)})
+        data = {"points": [Point(1, 2)]}
+        assert to_primitive(data) == {"points": [[1, 2]]}
+
+    def test_not_serializable(self):
+        with pytest.raises(TypeError):
+            to_primitive({"a": object()})
+        with pytest.raises(TypeError):
+            to_primitive({object(): 1})
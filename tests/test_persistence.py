@@ -2,7 +2,7 @@ import os
 import pytest
 import asyncio
 
-from apistellar.types import PersistentType
+from apistellar.types import PersistentType, validators
 from apistellar.persistence import DriverMixin, conn_ignore, \
     get_callargs, proxy, contextmanager, conn_debug, conn_asyncgen, \
     conn_asyncable, conn_proxy_driver_names
@@ -306,3 +306,52 @@ class TestPersistence(object):
     def test_async_driver_mixin_with_sync_method(self):
         driver = AsyncDriverModel().find_one_sync()
         assert isinstance(driver, MyDriver)
+
+
+class PartialUpdateMixin(DriverMixin):
+    saved = None
+    deleted = None
+
+    @classmethod
+    @contextmanager
+    def get_store(cls, self_or_cls, **callargs):
+        with super(PartialUpdateMixin, cls).get_store(
+                self_or_cls, **callargs) as self_or_cls:
+            yield self_or_cls
+            changes = cls.get_changes(self_or_cls)
+            deleted = cls.get_deleted(self_or_cls)
+            if changes or deleted:
+                PartialUpdateMixin.saved = changes
+                PartialUpdateMixin.deleted = deleted
+                self_or_cls.mark_clean()
+
+
+class PartialUpdateModel(PersistentType, PartialUpdateMixin):
+    name = validators.String()
+    count = validators.Integer(default=0)
+
+    def save(self):
+        pass
+
+    @classmethod
+    def find(cls):
+        return cls.get_changes(cls)
+
+
+class TestChanges(object):
+
+    def test_get_changes(self, monkeypatch):
+        monkeypatch.setenv("UNIT_TEST_MODE", "false")
+        model = PartialUpdateModel(name="a", count=1)
+        model.save()
+        assert PartialUpdateMixin.saved is None
+        model.count = 2
+        model.save()
+        assert PartialUpdateMixin.saved == {"count": 2}
+        assert PartialUpdateMixin.deleted == set()
+        assert model.changes() == {}
+        assert PartialUpdateModel.find() is None
+        del model.name
+        model.save()
+        assert PartialUpdateMixin.saved == {}
+        assert PartialUpdateMixin.deleted == {"name"}
@@ -1,7 +1,14 @@
+import array
 import pytest
 
 from apistar.exceptions import ValidationError
-from apistellar.types.validators import String, Integer, Boolean
+from apistellar.types.validators import String, Integer, Boolean, \
+    Number, Array
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 from factories import TypeTestBase
 
@@ -207,3 +214,94 @@ class TestArrayUniqueItems(ArrayTest):
     def test_argument_error(self):
         with pytest.raises(AssertionError):
             self.gen_class(self._type, unique_items=3)()
+
+
+@pytest.mark.skipif(np is None, reason="numpy is not installed")
+class TestArrayBatch(object):
+
+    def validate_both(self, validator, value, allow_coerce=False):
+        results = []
+        for batch in (True, False):
+            validator.batch = batch
+            try:
+                results.append(validator.validate(
+                    list(value), allow_coerce=allow_coerce))
+            except ValidationError as e:
+                results.append(e.detail)
+        validator.batch = True
+        return results
+
+    @pytest.mark.parametrize("items, value", [
+        (Integer(minimum=0, maximum=100), list(range(100))),
+        (Integer(minimum=0, maximum=10), list(range(-5, 50))),
+        (Integer(minimum=0, exclusive_minimum=True, maximum=10,
+                 exclusive_maximum=True, multiple_of=3), list(range(-5, 50))),
+        (Integer(enum=[1, 2, 3]), [1, 2, 3, 4] * 10),
+        (Integer(enum=[1], maximum=0), [1, 2, 0] * 20),
+        (Integer(multiple_of=0.5), list(range(40))),
+        (Number(minimum=0.5, maximum=10), [i / 3 for i in range(60)] + [1, 2]),
+        (Number(multiple_of=0.25), [i / 4 for i in range(40)] + [0.3, 7]),
+        (Number(multiple_of=2), [float(i) for i in range(40)]),
+        (Number(), [float("inf"), 1.0, float("nan"), -float("inf")] * 10),
+        (Number(enum=[1, 2.5]), [1, 2.5, 1.0, 3] * 10),
+    ])
+    def test_same_as_item_validate(self, items, value):
+        validator = Array(items=items)
+        batch, single = self.validate_both(validator, value)
+        assert batch == single
+        if isinstance(batch, list):
+            assert [type(v) for v in batch] == [type(v) for v in single]
+
+    @pytest.mark.parametrize("items, value", [
+        (Integer(), list(range(40)) + [1.0]),
+        (Integer(), list(range(40)) + [True]),
+        (Integer(), list(range(40)) + ["1"]),
+        (Integer(), list(range(40)) + [2 ** 70]),
+        (Integer(maximum=10.5), list(range(40)) + [2 ** 60]),
+        (Number(), list(range(40)) + [None]),
+        (Integer(multiple_of=0), list(range(40))),
+    ])
+    def test_fallback(self, items, value):
+        validator = Array(items=items)
+        assert validator.validate_batch(value) is None
+        if items.multiple_of == 0:
+            with pytest.raises(ZeroDivisionError):
+                validator.validate(value)
+            return
+        batch, single = self.validate_both(validator, value, True)
+        assert type(batch) == type(single)
+        assert batch == single
+
+    def test_output(self):
+        value = list(range(100))
+        validator = Array(items=Integer(), output="array")
+        result = validator.validate(value)
+        assert isinstance(result, array.array) and result.typecode == "q"
+        assert result.tolist() == value
+        result = validator.validate(value[:3])
+        assert result.tolist() == value[:3]
+
+        validator = Array(items=Number(), output="ndarray")
+        result = validator.validate(value)
+        assert isinstance(result, np.ndarray)
+        assert result.dtype == np.float64
+        assert validator.validate([1, 2]).tolist() == [1.0, 2.0]
+
+    @pytest.mark.parametrize("output", ["array", "ndarray"])
+    def test_output_overflow(self, output):
+        validator = Array(items=Integer(), output=output)
+        for value, positions in [([1, 2 ** 70, -2 ** 64], [1, 2]),
+                                 ([1, 2 ** 70] + [1] * 40, [1])]:
+            with pytest.raises(ValidationError) as exc_info:
+                validator.validate(value)
+            detail = exc_info.value.detail
+            assert list(detail) == positions
+            assert detail[1].code == "out_of_range"
+
+    def test_output_error(self):
+        with pytest.raises(AssertionError):
+            Array(items=String(), output="array")
+        with pytest.raises(AssertionError):
+            Array(items=Integer(allow_null=True), output="array")
+        with pytest.raises(AssertionError):
+            Array(items=Integer(), output="tuple")
@@ -0,0 +1,109 @@
+import json
+import array
+import pytest
+
+from datetime import datetime
+from apistar.exceptions import ValidationError
+
+from apistellar import validators, Type, TypeList, TypeEncoder
+from apistellar.types import columns
+
+
+class Example(Type):
+    id = validators.Integer(minimum=0)
+    name = validators.String()
+    score = validators.Number(default=0.0)
+    created = validators.FormatDateTime(allow_null=True)
+    tags = validators.Array(items=validators.String(), default=list)
+
+
+ROWS = [{"id": i, "name": "n%d" % i, "created": datetime(2018, 10, 10)}
+        for i in range(50)]
+
+
+class TestTypeList(object):
+
+    def test_subscript(self):
+        assert TypeList[Example] is TypeList[Example]
+        assert TypeList[Example].model is Example
+        with pytest.raises(AssertionError):
+            TypeList([], 0)
+
+    def test_columns(self):
+        tl = TypeList[Example].validate(iter(ROWS))
+        assert len(tl) == 50
+        assert isinstance(tl.columns["id"], array.array)
+        assert isinstance(tl.columns["score"], array.array)
+        assert isinstance(tl.columns["name"], list)
+        assert tl.to_columns()["id"].tolist() == list(range(50))
+
+    def test_rows(self):
+        tl = TypeList[Example].validate(ROWS)
+        expected = Example.validate_many(ROWS)
+        assert [row.to_dict() for row in tl] == \
+               [row.to_dict() for row in expected]
+        assert tl[-1] == expected[-1]
+        assert isinstance(tl[0], Example)
+        with pytest.raises(IndexError):
+            tl[50]
+
+    def test_row_view(self):
+        tl = TypeList[Example].validate(ROWS)
+        row = tl[3]
+        row.name = "x"
+        row.score = 2
+        assert tl.columns["name"][3] == "x"
+        assert tl.columns["score"][3] == 2.0
+        assert row.changes() == {"name": "x", "score": 2.0}
+        del row.score
+        assert tl[3].score == 0.0
+
+    def test_slice(self):
+        tl = TypeList[Example].validate(ROWS)[10:20]
+        assert len(tl) == 10
+        assert tl[0].id == 10
+
+    def test_errors(self):
+        rows = [{"id": -1}, {"id": 1, "name": 1}, 3] + ROWS
+        with pytest.raises(ValidationError) as exc_info:
+            TypeList[Example].validate(rows)
+        with pytest.raises(ValidationError) as expected:
+            Example.validate_many(rows)
+        assert exc_info.value.detail == expected.value.detail
+        assert list(exc_info.value.detail) == [0, 1, 2]
+
+    def test_coerce(self):
+        tl = TypeList[Example].validate(
+            [{"id": "1", "name": "a"}], allow_coerce=True)
+        assert tl[0].id == 1
+
+    def test_json(self):
+        tl = TypeList[Example].validate(ROWS)
+        expected = [row.to_dict() for row in Example.validate_many(ROWS)]
+        assert tl.to_list() == expected
+        assert json.loads(b"".join(tl.iter_json(7))) == expected
+        assert json.loads(json.dumps(tl, cls=TypeEncoder)) == expected
+        empty = TypeList[Example].validate([])
+        assert b"".join(empty.iter_json()) == b"[]"
+
+    @pytest.mark.skipif(columns.np is None, reason="numpy is not installed")
+    def test_to_numpy(self):
+        tl = TypeList[Example].validate(ROWS)
+        ids = tl.to_numpy("id")
+        assert ids.dtype == columns.np.int64
+        # 零拷贝，共享同一块内存
+        ids[0] = 100
+        assert tl.columns["id"][0] == 100
+        names = tl.to_numpy()["name"]
+        assert names.dtype == object
+        assert names[1] == "n1"
+
+    def test_max_errors(self):
+        rows = [{"id": "a", "name": 1}] * 100
+        with pytest.raises(ValidationError) as exc_info:
+            TypeList[Example].validate(rows, max_errors=3)
+        assert exc_info.value.detail == {
+            0: {"id": "Must be a number."},
+            1: {"id": "Must be a number."},
+            2: {"id": "Must be a number."},
+        }
@@ -0,0 +1,155 @@
+import pytest
+
+from datetime import datetime
+from apistar.exceptions import ValidationError
+
+from apistellar import validators, Type
+from apistellar.types.compiler import compile_validator
+
+
+class Example(Type):
+    name = validators.String(min_length=1, max_length=5, pattern="^[a-z]+$")
+    kind = validators.String(enum=["a", "b"], default="a")
+    only = validators.String(enum=["x"], allow_null=True)
+    created = validators.FormatDateTime(allow_null=True)
+    count = validators.Integer(minimum=0, maximum=10, multiple_of=2, default=0)
+    ratio = validators.Number(minimum=0, exclusive_minimum=True,
+                              maximum=1, exclusive_maximum=True,
+                              multiple_of=0.25, allow_null=True)
+    level = validators.Integer(enum=[1], allow_null=True)
+    flag = validators.Boolean(allow_null=True)
+    strict = validators.Boolean(default=False)
+    tags = validators.Array(items=validators.String(), default=list)
+    any = validators.Any(default=None)
+
+
+class Nested(Type):
+    example = validators.Proxy(Example, allow_null=True)
+    examples = validators.Array(items=Example, default=list)
+    obj = validators.Object(properties={"a": validators.Integer()},
+                            required=["a"], allow_null=True)
+
+
+class Loose(Type):
+    pass
+
+
+Loose.validator.additional_properties = True
+
+
+def validate_both(validator, value, allow_coerce=False):
+    results = []
+    for validate in (validator.validate, compile_validator(validator)):
+        try:
+            results.append(
+                ("ok", validate(dict(value), allow_coerce=allow_coerce)))
+        except ValidationError as e:
+            results.append(("error", e.detail))
+    return results
+
+
+PAYLOADS = [
+    {},
+    {"name": "abc"},
+    {"name": ""},
+    {"name": "abcdef"},
+    {"name": "ABC"},
+    {"name": 1},
+    {"name": None},
+    {"name": "abc", "kind": "c", "only": "y"},
+    {"name": "abc", "only": None, "created": "2018-10-10 10:10:10"},
+    {"name": "abc", "created": datetime(2018, 10, 10)},
+    {"name": "abc", "created": "2018-10-10"},
+    {"name": "abc", "count": 3},
+    {"name": "abc", "count": 12},
+    {"name": "abc", "count": -2},
+    {"name": "abc", "count": 2.5},
+    {"name": "abc", "count": "4"},
+    {"name": "abc", "count": "x"},
+    {"name": "abc", "count": None},
+    {"name": "abc", "ratio": 0},
+    {"name": "abc", "ratio": 1},
+    {"name": "abc", "ratio": 0.3},
+    {"name": "abc", "ratio": 0.5},
+    {"name": "abc", "ratio": float("inf")},
+    {"name": "abc", "level": 2},
+    {"name": "abc", "flag": "on", "strict": "0"},
+    {"name": "abc", "flag": "", "strict": "none"},
+    {"name": "abc", "flag": "yes"},
+    {"name": "abc", "strict": None},
+    {"name": "abc", "tags": ["a", 1]},
+    {"name": "abc", "extra": 1},
+]
+
+
+class TestCompiler(object):
+
+    @pytest.mark.parametrize("allow_coerce", [False, True])
+    @pytest.mark.parametrize("value", PAYLOADS)
+    def test_same_as_validator(self, value, allow_coerce):
+        result, expected = validate_both(Example.validator, value, allow_coerce)
+        assert result == expected
+
+    @pytest.mark.parametrize("value", [
+        {},
+        {"example": None, "obj": None},
+        {"example": {"name": "abc"}, "examples": [{"name": "a"}, {}]},
+        {"example": {"name": 1}, "obj": {"a": "1"}},
+        {"obj": {"b": 1}},
+        {"obj": 1},
+    ])
+    def test_nested(self, value):
+        result, expected = validate_both(Nested.validator, value)
+        assert result == expected
+
+    def test_not_mapping(self):
+        for validate in (Example.validator.validate,
+                         compile_validator(Example.validator)):
+            with pytest.raises(ValidationError) as exc_info:
+                validate([])
+            assert exc_info.value.detail.code == "type"
+
+    def test_additional_properties(self):
+        result, expected = validate_both(Loose.validator, {"a": 1})
+        assert result == expected
+        assert result == ("ok", {"a": 1})
+
+    def test_used_by_type(self):
+        e = Example.validate({"name": "abc"})
+        assert Example.get_validate() is Example.__dict__["_validate"]
+        assert e.count == 0
+        assert e.kind == "a"
+        with pytest.raises(ValidationError) as exc_info:
+            Example.validate({"name": "abc", "count": 3})
+        assert exc_info.value.detail["count"].code == "multiple_of"
+
+    def test_error_budget(self, monkeypatch):
+        calls = []
+        get_error_budget = validators.get_error_budget
+
+        def counted():
+            calls.append(1)
+            return get_error_budget()
+
+        monkeypatch.setattr(validators, "get_error_budget", counted)
+        validate = compile_validator(Example.validator)
+        validate({"name": "abc"})
+        # 校验成功时不读取ErrorBudget
+        assert calls == []
+
+        value = {"name": 1, "count": "a", "flag": 1}
+        with validators.error_budget(2):
+            with pytest.raises(ValidationError) as exc_info:
+                validate(value)
+        assert list(exc_info.value.detail) == ["name", "count"]
+        with pytest.raises(ValidationError) as exc_info:
+            validate(value)
+        assert list(exc_info.value.detail) == ["name", "count", "flag"]
+
+    def test_subclass_validate(self):
+        class MyObject(validators.Object):
+            def validate(self, value, definitions=None, allow_coerce=False):
+                return "mine"
+
+        validator = MyObject()
+        assert compile_validator(validator)({}) == "mine"
@@ -1,3 +1,6 @@
+import os
+import pytest
+import timeit
 import datetime
 
 from apistellar.types import Type, validators, formats
@@ -53,3 +56,120 @@ class TestTime(object):
         assert isinstance(e.field3, datetime.time)
         assert formats.TIME_REGEX.search(e["field3"])
 
+
+
+def parse(format_cls, value, monkeypatch=None):
+    if monkeypatch:
+        monkeypatch.setattr(formats, "HAS_FROMISOFORMAT", False)
+    try:
+        return "ok", format_cls().validate(value)
+    except Exception as e:
+        return "error", e.__class__
+    finally:
+        if monkeypatch:
+            monkeypatch.undo()
+
+
+@pytest.mark.skipif(not formats.HAS_FROMISOFORMAT,
+                    reason="fromisoformat is not supported")
+class TestFromIsoFormat(object):
+
+    @pytest.mark.parametrize("format_cls, value", [
+        (formats.DateFormat, "2018-10-10"),
+        (formats.DateFormat, "2018-1-1"),
+        (formats.DateFormat, "2018-02-30"),
+        (formats.DateFormat, "2018-10-1a"),
+        (formats.DateFormat, "20181010"),
+        (formats.TimeFormat, "10:10"),
+        (formats.TimeFormat, "10:10:10.123456"),
+        (formats.TimeFormat, "10:10:10.1"),
+        (formats.TimeFormat, "1:10"),
+        (formats.TimeFormat, "10:10:10+08:00"),
+        (formats.TimeFormat, "10:10:10.1234567"),
+        (formats.DateTimeFormat, "2018-10-10 10:10:10"),
+        (formats.DateTimeFormat, "2018-10-10 10:10"),
+        (formats.DateTimeFormat, "2018-10-10T10:10:10Z"),
+        (formats.DateTimeFormat, "2018-10-10T10:10:10.123+08:00"),
+        (formats.DateTimeFormat, "2018-10-10T10:10:10.123456-05:30"),
+        (formats.DateTimeFormat, "2018-10-10 10:10:10+0800"),
+        (formats.DateTimeFormat, "2018-10-10 10:10:10.1"),
+        (formats.DateTimeFormat, "2018-1-10 10:10:10"),
+        (formats.DateTimeFormat, "2018-10-10 25:10:10"),
+        (formats.DateTimeFormat, "2018-10-10x10:10:10"),
+    ])
+    def test_same_as_regex(self, format_cls, value, monkeypatch):
+        result = parse(format_cls, value)
+        expected = parse(format_cls, value, monkeypatch)
+        assert result == expected
+        if result[0] == "ok" and hasattr(result[1], "tzinfo"):
+            assert result[1].tzinfo == expected[1].tzinfo
+
+
+class TestFormatParser(object):
+
+    @pytest.mark.parametrize("date_format, value", [
+        ("%Y-%m-%d %H:%M:%S", "2018-10-10 10:10:10"),
+        ("%Y-%m-%d %H:%M:%S", "2018-1-1 1:1:1"),
+        ("%Y-%m-%d %H:%M:%S", "2018-13-10 10:10:10"),
+        ("%Y-%m-%d %H:%M:%S", "2018-10-10  10:10:10"),
+        ("%Y-%m-%d %H:%M:%S", "2018-10-10 10:10:60"),
+        ("%Y%m%d", "20181010"),
+        ("%Y%m%d", "2018101"),
+        ("%H:%M", "10:10"),
+        ("%Y%%%m", "2018%10"),
+        ("%d/%b/%Y", "10/Oct/2018"),
+    ])
+    def test_same_as_strptime(self, date_format, value):
+        try:
+            expected = datetime.datetime.strptime(value, date_format)
+        except ValueError as e:
+            with pytest.raises(ValueError) as exc_info:
+                formats.get_parser(date_format)(value)
+            assert str(exc_info.value) == str(e)
+        else:
+            assert formats.get_parser(date_format)(value) == expected
+
+    def test_cached(self):
+        parser = formats.get_parser("%Y-%m-%d %H:%M:%S")
+        assert parser is formats.get_parser("%Y-%m-%d %H:%M:%S")
+        parser.cache_clear()
+        parser("2018-10-10 10:10:10")
+        parser("2018-10-10 10:10:10")
+        assert parser.cache_info().hits == 1
+
+
+@pytest.mark.skipif(not os.environ.get("APISTELLAR_BENCHMARK"),
+                    reason="set APISTELLAR_BENCHMARK=1 to run benchmarks")
+class TestBenchmark(object):
+    """
+    解析快速路径的微基准，默认跳过，使用
+    `APISTELLAR_BENCHMARK=1 pytest -s test_types/test_datetime.py -k Benchmark`运行
+    """
+    number = 20000
+
+    def timeit(self, func, values):
+        return timeit.timeit(lambda: [func(value) for value in values],
+                             number=self.number // len(values))
+
+    @pytest.mark.skipif(not formats.HAS_FROMISOFORMAT,
+                        reason="fromisoformat is not supported")
+    def test_iso_datetime(self, monkeypatch):
+        validate = formats.DateTimeFormat().validate
+        values = ["2018-10-10T10:10:10.123456+08:00"]
+        fast = self.timeit(validate, values)
+        monkeypatch.setattr(formats, "HAS_FROMISOFORMAT", False)
+        regex = self.timeit(validate, values)
+        print(f"\nDateTimeFormat: fromisoformat {fast:.3f}s, regex {regex:.3f}s")
+        assert fast < regex
+
+    def test_format_datetime(self):
+        date_format = "%Y-%m-%d %H:%M:%S"
+        parser = formats.compile_format(date_format)
+        values = ["2018-10-10 10:%02d:%02d" % divmod(i, 60) for i in range(1000)]
+        strptime = self.timeit(
+            lambda value: datetime.datetime.strptime(value, date_format), values)
+        compiled = self.timeit(parser.__wrapped__, values)
+        cached = self.timeit(parser, values[:100])
+        print(f"\nFormatDatetime: strptime {strptime:.3f}s, "
+              f"compiled {compiled:.3f}s, cached {cached:.3f}s")
+        assert cached < compiled < strptime
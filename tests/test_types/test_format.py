@@ -164,3 +164,50 @@ def test_reformat_field_error_with_field_name():
         e.reformat("field5")
 
     assert err_info.value.detail["field5"] == 'Must be a string.'
+
+
+def test_format_datetime_not_shared():
+    class Example(Type):
+        field1 = validators.FormatDateTime(format="%Y%m%d")
+        field2 = validators.FormatDateTime()
+
+    e = Example.validate({"field1": "20181010",
+                          "field2": "2018-10-10 10:10:10"})
+    assert e.field1 == datetime.datetime(2018, 10, 10)
+    assert e["field1"] == "20181010"
+    assert e["field2"] == "2018-10-10 10:10:10"
+
+
+class TestFormatRegistry(object):
+
+    def test_register_on_define(self):
+        class RegistryFormat(DateTimeFormat):
+            name = "registry_format"
+
+        assert "registry_format" in FORMATS
+        assert isinstance(FORMATS["registry_format"], RegistryFormat)
+        assert FORMATS.get("not_exist") is None
+
+    def test_instance_per_args(self):
+        first = FORMATS.get("format_datetime", date_format="%Y")
+        assert first is FORMATS.get("format_datetime", date_format="%Y")
+        assert first is not FORMATS.get("format_datetime", date_format="%m")
+        assert first.format == "%Y"
+
+    def test_install(self):
+        class InstallFormat(DateTimeFormat):
+            name = "install_format"
+
+            def __init__(self, option=None, **kwargs):
+                super().__init__(**kwargs)
+                self.option = option
+
+        instance = FORMATS["install_format"]
+        assert instance.option is None
+        install(option=1)
+        try:
+            assert FORMATS["install_format"] is not instance
+            assert FORMATS["install_format"].option == 1
+            assert FORMATS.get("install_format", option=2).option == 2
+        finally:
+            FORMATS.kwargs.pop("option")
@@ -0,0 +1,89 @@
+import re
+import pytest
+
+from apistar.exceptions import ValidationError
+
+from apistellar import validators
+from apistellar.types.compiler import compile_validator
+
+
+class TestPatternProperties(object):
+
+    def gen_validator(self, **kwargs):
+        return validators.Object(
+            pattern_properties={
+                "^int_": validators.Integer(),
+                "_str$": validators.String(),
+            }, additional_properties=False, **kwargs)
+
+    def test_success(self):
+        validator = self.gen_validator()
+        assert validator.validate({"int_a": 1, "b_str": "b"}) == {
+            "int_a": 1, "b_str": "b"}
+
+    def test_failed(self):
+        validator = self.gen_validator()
+        with pytest.raises(ValidationError) as exc_info:
+            validator.validate({"int_a": "1", "int_str": "b", "c": 1})
+        detail = exc_info.value.detail
+        assert detail["int_a"].code == "type"
+        # 同时匹配两个pattern时，每个pattern都会校验
+        assert detail["int_str"].code == "type"
+        assert detail["c"].code == "invalid_property"
+
+    def test_combined_regex(self):
+        validator = self.gen_validator()
+        assert validator.pattern_regex.pattern == "(?:^int_)|(?:_str$)"
+        assert [(key, child) for key, child in validator.match_pattern_properties(
+            ["int_a", "b", "int_str", 1])] == [
+            ("int_a", validator.pattern_properties["^int_"]),
+            ("int_str", validator.pattern_properties["^int_"]),
+            ("int_str", validator.pattern_properties["_str$"]),
+        ]
+
+    def test_not_combined(self):
+        validator = validators.Object(pattern_properties={
+            r"^(a)\1$": validators.Integer(),
+            "(?i)^b$": validators.Integer(),
+        })
+        assert validator.pattern_regex is None
+        assert validator.validate({"aa": 1, "B": 2, "ab": "x"}) == {
+            "aa": 1, "B": 2, "ab": "x"}
+
+    def test_cache(self):
+        validator = self.gen_validator()
+        validator.validate({"int_a": 1})
+        assert validator.pattern_matches == {
+            "int_a": (validator.pattern_properties["^int_"],)}
+        validator.pattern_regexes = []
+        # 已缓存的key不再进行正则匹配
+        assert validator.validate({"int_a": 1}) == {"int_a": 1}
+
+    def test_cache_long_key(self):
+        validator = self.gen_validator()
+        key = "int_" + "a" * validators.PATTERN_MATCHES_KEY_LENGTH
+        assert validator.validate({key: 1, "b_str": "b"}) == {
+            key: 1, "b_str": "b"}
+        assert list(validator.pattern_matches) == ["b_str"]
+
+    def test_compiled(self):
+        validator = self.gen_validator()
+        for value in [{"int_a": 1, "b_str": "b"}, {"int_a": "1", "c": 1}]:
+            results = []
+            for validate in (validator.validate, compile_validator(validator)):
+                try:
+                    results.append(validate(dict(value)))
+                except ValidationError as e:
+                    results.append(e.detail)
+            assert results[0] == results[1]
+
+
+class TestStringPattern(object):
+
+    def test_compiled_once(self):
+        validator = validators.String(pattern="^a")
+        assert validator.regex is re.compile("^a")
+        assert validator.validate("abc") == "abc"
+        with pytest.raises(ValidationError) as exc_info:
+            validator.validate("bc")
+        assert exc_info.value.detail == "Must match the pattern /^a/."
@@ -1,3 +1,8 @@
+import pytest
+
+from apistar.exceptions import ValidationError
+
+from apistellar.types import Type, validators
 from factories import TypeTestBase
 
 
@@ -17,3 +22,53 @@ class TestRef(RefTest):
         e.format()
         assert e.field.field.field is None
 
+
+
+class TestLink(object):
+
+    def test_recursive(self):
+        class Node(Type):
+            name = validators.String()
+            children = validators.Array(items=validators.Ref("Node"), default=list)
+
+        ref = Node.validator.properties["children"].items
+        assert isinstance(ref.target, validators.Proxy)
+        assert ref.target.type is Node
+        assert Node.validator.linked
+        assert Node.validator.properties["children"].linked
+
+        def tree(depth, width=10):
+            return {"name": "n%s" % depth, "children": [
+                tree(depth - 1) for _ in range(width)] if depth else []}
+
+        # 11111个节点
+        node = Node.validate(tree(4))
+        assert node.children[3].children[2].name == "n2"
+        with pytest.raises(ValidationError) as exc_info:
+            Node.validate({"name": "a", "children": [{"children": []}]})
+        assert exc_info.value.detail["children"][0]["name"].code == "required"
+
+    def test_unresolved(self):
+        class Example(Type):
+            field = validators.Ref("Other", allow_null=True)
+
+        assert Example.validator.properties["field"].target is None
+        assert not Example.validator.linked
+        with pytest.raises(KeyError):
+            Example.validate({"field": 1})
+
+    def test_definitions_cycle(self):
+        node = validators.Object(properties={
+            "children": validators.Array(items=validators.Ref("Node")),
+            "value": validators.Integer(),
+        })
+
+        class Tree(Type):
+            root = validators.Object(definitions={"Node": node},
+                                     properties={"node": validators.Ref("Node")})
+
+        assert node.properties["children"].items.target.type is node
+        assert not Tree.validator.properties["root"].linked
+        tree = Tree.validate({"root": {"node": {"value": 1, "children": [
+            {"value": 2, "children": []}]}}})
+        assert tree.root["node"]["children"][0]["value"] == 2
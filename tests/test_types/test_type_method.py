@@ -1,8 +1,18 @@
+import json
+import pickle
 import pytest
 
 from datetime import datetime
+from collections.abc import Mapping
 from apistar.exceptions import ConfigurationError, ValidationError
-from apistellar.types import Type, validators
+from apistellar.types import Type, TypeEncoder, SlotDict, validators
+
+
+class CompactExample(Type):
+    __compact__ = True
+    name = validators.String()
+    count = validators.Integer(default=0)
+    created = validators.FormatDateTime(allow_null=True)
 
 
 class TestType(object):
@@ -172,3 +182,357 @@ class TestType(object):
         assert Example.validator.properties["field"].is_valid("a") is True
 
 
+
+    def test_serialize(self):
+        class Sub(Type):
+            created = validators.FormatDateTime()
+
+        class Example(Type):
+            field = validators.String()
+            created = validators.FormatDateTime()
+            subs = validators.Array(items=Sub)
+
+        e = Example(field="a", created=datetime(2018, 10, 20, 11, 11, 11),
+                    subs=[Sub(created=datetime(2018, 10, 21, 11, 11, 11))],
+                    extra=1)
+        assert e._serialize() == dict(e)
+        assert json.dumps(e, cls=TypeEncoder) == json.dumps({
+            "field": "a",
+            "created": "2018-10-20 11:11:11",
+            "subs": [{"created": "2018-10-21 11:11:11"}],
+            "extra": 1,
+        })
+
+
+class TestTypeEncoder(object):
+
+    def test_dispatch_mro(self):
+        class Base(object):
+            pass
+
+        class Child(Base):
+            pass
+
+        TypeEncoder.register({Base: lambda obj: "base"})
+        assert json.dumps(Child(), cls=TypeEncoder) == '"base"'
+        TypeEncoder.register({Child: lambda obj: "child"})
+        assert json.dumps(Child(), cls=TypeEncoder) == '"child"'
+        assert json.dumps(Base(), cls=TypeEncoder) == '"base"'
+
+    def test_dispatch_abc(self):
+        class MyMapping(Mapping):
+            def __getitem__(self, item):
+                return 1
+
+            def __iter__(self):
+                return iter(["a"])
+
+            def __len__(self):
+                return 1
+
+        assert json.dumps(MyMapping(), cls=TypeEncoder) == '{"a": 1}'
+        assert TypeEncoder.dispatch(MyMapping) is dict
+
+    def test_not_serializable(self):
+        with pytest.raises(TypeError):
+            json.dumps(object(), cls=TypeEncoder)
+
+
+class TestValidateMany(object):
+
+    class Example(Type):
+        name = validators.String(max_length=3)
+        count = validators.Integer(default=0)
+
+    def test_generator(self):
+        records = ({"name": str(i)} for i in range(10))
+        instances = self.Example.validate_many(records)
+        assert len(instances) == 10
+        assert all(isinstance(e, self.Example) for e in instances)
+        assert instances[3].to_dict() == {"name": "3", "count": 0}
+        assert instances[3].formatted
+
+    def test_objects(self):
+        class Record(object):
+            name = "a"
+            count = "1"
+
+        instances = self.Example.validate_many([Record()], allow_coerce=True)
+        assert instances[0].count == 1
+
+    def test_errors(self):
+        records = [{"name": "a"}, {"name": "abcd"}, 1, {"count": 1}]
+        with pytest.raises(ValidationError) as exc_info:
+            self.Example.validate_many(records)
+        detail = exc_info.value.detail
+        assert list(detail) == [1, 2, 3]
+        assert detail[1]["name"].code == "max_length"
+        assert detail[2] == "Must be an object."
+        assert detail[3]["name"].code == "required"
+
+    def test_fail_fast(self):
+        consumed = []
+
+        def records():
+            for record in [{"name": "a"}, {"name": "abcd"}, {"name": 1}]:
+                consumed.append(record)
+                yield record
+
+        with pytest.raises(ValidationError) as exc_info:
+            self.Example.validate_many(records(), fail_fast=True)
+        assert list(exc_info.value.detail) == [1]
+        assert len(consumed) == 2
+
+    def test_iter_validate(self):
+        consumed = []
+
+        def records():
+            for i in range(5):
+                consumed.append(i)
+                yield {"name": str(i)}
+
+        instances = self.Example.iter_validate(records())
+        assert next(instances).name == "0"
+        assert consumed == [0]
+        assert [e.name for e in instances] == ["1", "2", "3", "4"]
+
+    def test_iter_validate_errors(self):
+        records = [{"name": "a"}, {"name": "abcd"}, {"name": "b"}, 1, 2]
+        instances = self.Example.iter_validate(records, max_errors=2)
+        assert next(instances).name == "a"
+        assert validators.get_error_budget() is None
+        with pytest.raises(ValidationError) as exc_info:
+            next(instances)
+        assert list(exc_info.value.detail) == [1, 3]
+
+    def test_custom_init(self):
+        class Example(Type):
+            name = validators.String()
+
+            def __init__(self, *args, **kwargs):
+                super().__init__(*args, **kwargs)
+                object.__setattr__(self, "inited", True)
+
+        instances = Example.validate_many([{"name": "a"}])
+        assert instances[0].inited
+        assert instances[0].name == "a"
+
+
+class TestLazy(object):
+
+    class Example(Type):
+        name = validators.String(max_length=3)
+        count = validators.Integer(default=0)
+        created = validators.FormatDateTime(allow_null=True)
+        other = validators.String()
+
+    def test_validate_on_read(self):
+        e = self.Example({"name": "abc", "count": "1",
+                          "created": "2018-10-10 10:10:10", "other": 1},
+                         lazy=True, allow_coerce=True)
+        assert not e.formatted
+        assert e.name == "abc"
+        assert e.count == 1
+        assert e.created == datetime(2018, 10, 10, 10, 10, 10)
+        assert e["created"] == "2018-10-10 10:10:10"
+        assert e._validated == {"name": "abc", "count": 1,
+                                "created": datetime(2018, 10, 10, 10, 10, 10)}
+        # 未读取的字段不会校验
+        assert e._dict["other"] == 1
+        with pytest.raises(ValidationError) as exc_info:
+            e.other
+        assert exc_info.value.detail["other"].code == "type"
+
+    def test_cached(self):
+        e = self.Example.validate({"name": "abc"}, lazy=True)
+        assert e.count == 0
+        e._dict["name"] = "abcd"
+        e._validated["name"] = "cached"
+        assert e.name == "cached"
+        e.name = "ab"
+        assert e.name == "ab"
+
+    def test_missing(self):
+        e = self.Example({"count": 1}, lazy=True)
+        with pytest.raises(AttributeError):
+            e.name
+        with pytest.raises(KeyError):
+            e["name"]
+        assert e.created is None
+        assert "created" not in e
+
+    def test_format(self):
+        e = self.Example({"name": "abc", "count": "x"}, lazy=True)
+        assert e.name == "abc"
+        with pytest.raises(ValidationError) as exc_info:
+            e.format()
+        assert exc_info.value.detail["count"].code == "type"
+        assert exc_info.value.detail["other"].code == "required"
+
+        e = self.Example({"name": "abc", "other": "o"}, lazy=True)
+        e.format()
+        assert e.formatted
+        assert e._validated is None
+        assert e.to_dict() == {"name": "abc", "count": 0,
+                               "created": None, "other": "o"}
+
+    def test_serialize(self):
+        value = {"name": "abc", "created": "2018-10-10 10:10:10",
+                 "other": "toolong"}
+        e = self.Example(dict(value), lazy=True)
+        assert e.name == "abc"
+        for serialize in (e.to_dict, lambda: json.loads(
+                json.dumps(e, cls=TypeEncoder))):
+            assert serialize() == {
+                "name": "abc", "count": 0,
+                "created": "2018-10-10 10:10:10", "other": "toolong"}
+
+        e = self.Example(dict(value, name="toolong"), lazy=True)
+        assert e.created == datetime(2018, 10, 10, 10, 10, 10)
+        for serialize in (e.to_dict, lambda: json.dumps(e, cls=TypeEncoder)):
+            with pytest.raises(ValidationError) as exc_info:
+                serialize()
+            assert exc_info.value.detail["name"].code == "max_length"
+
+    def test_not_lazy(self):
+        e = self.Example({"name": 1})
+        assert e.name == 1
+
+
+class TestChanges(object):
+
+    class Example(Type):
+        name = validators.String()
+        count = validators.Integer(default=0)
+
+    def test_changes(self):
+        e = self.Example.validate({"name": "a", "extra": 1})
+        assert e.changes() == {}
+        assert e.dirty_fields() == set()
+        e.name = "a"
+        e["count"] = 2
+        e.update(extra=2, other=3)
+        assert e.dirty_fields() == {"name", "count", "extra", "other"}
+        # 值未变化的字段不算变更
+        assert e.changes() == {"count": 2, "extra": 2, "other": 3}
+
+    def test_changed_back(self):
+        e = self.Example.validate({"name": "a"})
+        e.name = "b"
+        e.name = "a"
+        assert e.changes() == {}
+        assert e.dirty_fields() == {"name"}
+
+    @pytest.mark.parametrize("cls", [Example, CompactExample])
+    def test_read_default(self, cls):
+        e = cls({"name": "a"})
+        assert e["count"] == 0
+        assert e.dirty_fields() == set()
+        assert e.changes() == {}
+
+    def test_delete(self):
+        e = self.Example({"name": "a", "count": 1})
+        del e.count
+        assert e.dirty_fields() == {"count"}
+        assert e.changes() == {}
+        assert e.deleted_fields() == {"count"}
+        e = self.Example.validate({"name": "a", "count": 1})
+        del e.count
+        assert e.changes() == {"count": 0}
+        assert e.deleted_fields() == set()
+
+    def test_delete_added(self):
+        e = self.Example({"name": "a"})
+        e.update(extra=1)
+        del e["extra"]
+        assert e.changes() == {}
+        assert e.deleted_fields() == set()
+        e.mark_clean()
+        assert e.deleted_fields() == set()
+
+    @pytest.mark.parametrize("name", ["changes", "mark_clean", "dirty_fields",
+                                      "deleted_fields", "validate_many",
+                                      "iter_validate"])
+    def test_reserved(self, name):
+        with pytest.raises(ConfigurationError):
+            type("Example", (Type,), {name: validators.String()})
+
+    def test_mark_clean(self):
+        e = self.Example.validate({"name": "a"})
+        e.name = "b"
+        e.mark_clean()
+        assert e.changes() == {}
+        e.name = "c"
+        assert e.changes() == {"name": "c"}
+
+
+class TestCompact(object):
+
+    def test_no_dict(self):
+        e = CompactExample.validate({"name": "a"})
+        assert not hasattr(e, "__dict__")
+        assert CompactExample.__slots__ == (
+            "_slot_name", "_slot_count", "_slot_created", "_extra")
+
+    def test_mapping(self):
+        e = CompactExample(name="a", created=datetime(2018, 10, 10))
+        assert len(e) == 2
+        assert list(e) == ["name", "created"]
+        assert "count" not in e
+        assert e["created"] == "2018-10-10 00:00:00"
+        e.format()
+        assert e.count == 0
+        e.count = 2
+        e.update(extra=1)
+        assert e.changes() == {"count": 2, "extra": 1}
+        assert dict(e) == {"name": "a", "count": 2,
+                           "created": "2018-10-10 00:00:00", "extra": 1}
+        del e.count
+        assert e.count == 0
+        with pytest.raises(AttributeError):
+            e.other = 1
+
+    def test_no_view(self, monkeypatch):
+        e = CompactExample(name="a", count=1)
+        e.update(extra=1)
+        expected = {"name": "a", "count": 1, "extra": 1}
+        assert dict(e._dict) == expected
+        # 读取字段及序列化不再创建SlotDict
+        monkeypatch.setattr(SlotDict, "__init__", None)
+        assert e.name == "a" and e["count"] == 1
+        assert dict(e._items()) == expected
+        assert e._serialize() == expected
+        assert e.changes() == {"extra": 1}
+        with pytest.raises(AttributeError):
+            e.created
+
+    def test_encoder(self):
+        e = CompactExample.validate_many(
+            [{"name": "a", "created": datetime(2018, 10, 10)}])[0]
+        expected = {"name": "a", "count": 0, "created": "2018-10-10 00:00:00"}
+        assert json.loads(json.dumps(e, cls=TypeEncoder)) == expected
+        assert e.to_dict() == expected
+
+    def test_lazy(self):
+        e = CompactExample({"name": "a", "count": "1"},
+                           lazy=True, allow_coerce=True)
+        assert e.count == 1
+        assert e["name"] == "a"
+
+    def test_subclass(self):
+        class Child(CompactExample):
+            other = validators.String(default="o")
+
+        assert Child.__slots__ == ("_slot_other",)
+        e = Child.validate({"name": "a"})
+        assert not hasattr(e, "__dict__")
+        assert e.other == "o"
+
+    @pytest.mark.parametrize("cls", [CompactExample, TestValidateMany.Example])
+    def test_pickle(self, cls):
+        e = cls.validate({"name": "a"})
+        e.count = 1
+        loaded = pickle.loads(pickle.dumps(e))
+        assert loaded == e
+        assert loaded.formatted
+        assert loaded.changes() == {"count": 1}
@@ -61,3 +61,83 @@ class TestUnion(object):
         with pytest.raises(ValidationError) as exc_info:
             e.field1 = []
         assert exc_info.value.args[0]["field1"].code == "union"
+
+
+class Click(Type):
+    kind = validators.String(enum=["click"])
+    x = validators.Integer()
+    y = validators.Integer()
+
+
+class Scroll(Type):
+    kind = validators.String(default="scroll")
+    offset = validators.Integer()
+
+
+class TestDiscriminator(object):
+
+    def test_mapping(self):
+        union = validators.Union([Click, Scroll], discriminator="kind")
+        assert union.mapping == {"click": union.items[0],
+                                 "scroll": union.items[1]}
+
+    def test_success(self):
+        union = validators.Union([Click, Scroll], discriminator="kind")
+        e = union.validate({"kind": "scroll", "offset": 3})
+        assert isinstance(e, Scroll)
+        e = union.validate({"kind": "click", "x": 1, "y": 2})
+        assert isinstance(e, Click)
+
+    def test_member_error(self):
+        union = validators.Union([Click, Scroll], discriminator="kind")
+        with pytest.raises(ValidationError) as exc_info:
+            union.validate({"kind": "click", "x": "1"})
+        detail = exc_info.value.detail
+        assert detail["x"].code == "type"
+        assert detail["y"].code == "required"
+
+    def test_unknown_discriminator(self):
+        union = validators.Union([Click, Scroll], discriminator="kind")
+        # 没有discriminator时，按顺序尝试
+        assert isinstance(union.validate({"offset": 3}), Scroll)
+        with pytest.raises(ValidationError) as exc_info:
+            union.validate({"kind": "drag"})
+        assert exc_info.value.detail.code == "union"
+        with pytest.raises(ValidationError) as exc_info:
+            union.validate({"kind": []})
+        assert exc_info.value.detail.code == "union"
+
+    def test_skip_by_check(self):
+        calls = []
+
+        class Checked(Type):
+            a = validators.Integer()
+
+            @classmethod
+            def validate(cls, value, *args, **kwargs):
+                calls.append(value)
+                return super().validate(value, *args, **kwargs)
+
+        union = validators.Union([Checked, validators.String(),
+                                  validators.Array(), validators.Integer()])
+        assert union.validate({"a": 1}).a == 1
+        assert union.validate("a") == "a"
+        assert union.validate([1]) == [1]
+        assert union.validate(1) == 1
+        assert len(calls) == 1
+        with pytest.raises(ValidationError):
+            union.validate({"b": 1})
+        assert len(calls) == 1
+
+    def test_coerce(self):
+        union = validators.Union([validators.Boolean(), validators.Integer()])
+        assert union.validate("2", allow_coerce=True) == 2
+        assert union.validate("on", allow_coerce=True) is True
+        with pytest.raises(ValidationError):
+            union.validate("2")
+
+    def test_or_keep_items(self):
+        union = validators.String() | validators.Integer()
+        other = union | validators.Array()
+        assert len(union.items) == 2
+        assert len(other.items) == 3
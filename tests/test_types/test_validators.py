@@ -102,3 +102,80 @@ class TestValidatorWithCustomErrorSettings():
         with pytest.raises(ValidationError) as exc_info:
             Example().field = 1.2
         assert exc_info.value.args[0]["field"] == '必须是[String, Integer]类型之一'
+
+
+class TestErrorBudget(object):
+
+    def test_array(self):
+        field = validators.Array(items=validators.Integer())
+        with validators.error_budget(3) as budget:
+            with pytest.raises(ValidationError) as exc_info:
+                field.validate(["a"] * 50000)
+        assert list(exc_info.value.detail) == [0, 1, 2]
+        assert budget.count == 3
+        assert validators.get_error_budget() is None
+
+    def test_batch(self):
+        field = validators.Array(items=validators.Integer(minimum=0))
+        with validators.error_budget(2):
+            with pytest.raises(ValidationError) as exc_info:
+                field.validate([-1] * 100)
+        assert list(exc_info.value.detail) == [0, 1]
+
+    def test_nested(self):
+        class Item(Type):
+            name = validators.String()
+            count = validators.Integer()
+
+        class Example(Type):
+            title = validators.String(max_length=3)
+            rows = validators.Array(items=Item)
+
+        value = {"title": "abcd",
+                 "rows": [{"name": 1, "count": "a"}, {}, {}]}
+        with pytest.raises(ValidationError) as exc_info:
+            Example.validate(dict(value))
+        assert len(exc_info.value.detail["rows"]) == 3
+
+        with pytest.raises(ValidationError) as exc_info:
+            Example.validate(dict(value), max_errors=1)
+        assert list(exc_info.value.detail) == ["title"]
+
+        with pytest.raises(ValidationError) as exc_info:
+            Example.validate(dict(value), max_errors=3)
+        detail = exc_info.value.detail
+        assert list(detail["rows"]) == [0]
+        assert set(detail["rows"][0]) == {"name", "count"}
+
+    def test_union(self):
+        class A(Type):
+            a = validators.Integer()
+
+        class B(Type):
+            a = validators.String()
+
+        field = validators.Array(items=validators.Union([A, B]))
+        value = [{"a": "x"}] * 5 + [{"a": []}] * 3
+        with pytest.raises(ValidationError) as exc_info:
+            field.validate(value)
+        assert list(exc_info.value.detail) == [5, 6, 7]
+        # 成员A校验失败的错误不计数
+        with validators.error_budget(3) as budget:
+            with pytest.raises(ValidationError) as exc_info:
+                field.validate(value)
+        assert list(exc_info.value.detail) == [5, 6, 7]
+        assert budget.count == 3
+
+    def test_validate_many(self):
+        class Example(Type):
+            name = validators.String()
+
+        records = [{"name": 1}] * 100
+        with pytest.raises(ValidationError) as exc_info:
+            Example.validate_many(records, max_errors=5)
+        assert list(exc_info.value.detail) == [0, 1, 2, 3, 4]
+
+    def test_message_cached(self):
+        field = validators.Integer()
+        assert field.error_message("type") is field.error_message("type")
+        assert field.error_message("type").code == "type"